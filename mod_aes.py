@@ -12,6 +12,21 @@ Although this is an exercise, the `encrypt` and `decrypt` functions should
 provide reasonable security to encrypted messages.
 """
 
+import hashlib
+import queue
+import struct
+import threading
+from collections import OrderedDict
+from functools import partial
+from itertools import islice, repeat
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; the batch APIs fall back to pure Python without it.
+    np = None
+
 
 s_box = (
     0x63, 0x7C, 0x77, 0x7B, 0xF2, 0x6B, 0x6F, 0xC5, 0x30, 0x01, 0x67, 0x2B, 0xFE, 0xD7, 0xAB, 0x76,
@@ -113,6 +128,97 @@ def inv_mix_columns(s):
     mix_columns(s)
 
 
+def _build_enc_tables():
+    """
+    Builds the four encryption T-tables. Each entry fuses SubBytes and
+    MixColumns for one byte of a column; words are big-endian, with row 0 in
+    the most significant byte.
+    """
+    te0 = []
+    for x in range(256):
+        s = s_box[x]
+        s2 = xtime(s)
+        te0.append((s2 << 24) | (s << 16) | (s << 8) | (s2 ^ s))
+    te1 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in te0]
+    te2 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in te1]
+    te3 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in te2]
+    return tuple(te0), tuple(te1), tuple(te2), tuple(te3)
+
+te0, te1, te2, te3 = _build_enc_tables()
+
+
+def gf_mul(a, b):
+    """ Multiplies two bytes in GF(2^8) modulo the AES polynomial. """
+    p = 0
+    while b:
+        if b & 1:
+            p ^= a
+        a = xtime(a)
+        b >>= 1
+    return p
+
+
+def _build_dec_tables():
+    """
+    Builds the four decryption T-tables for the equivalent inverse cipher,
+    fusing InvSubBytes and InvMixColumns. Same word layout as the encryption
+    tables.
+    """
+    td0 = []
+    for x in range(256):
+        s = inv_s_box[x]
+        td0.append((gf_mul(s, 14) << 24) | (gf_mul(s, 9) << 16) | (gf_mul(s, 13) << 8) | gf_mul(s, 11))
+    td1 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td0]
+    td2 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td1]
+    td3 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td2]
+    return tuple(td0), tuple(td1), tuple(td2), tuple(td3)
+
+td0, td1, td2, td3 = _build_dec_tables()
+
+
+def sub_word(w):
+    """ Applies the S-box to each byte of a 32-bit word. """
+    return (s_box[w >> 24] << 24 | s_box[w >> 16 & 0xFF] << 16 |
+            s_box[w >> 8 & 0xFF] << 8 | s_box[w & 0xFF])
+
+
+def inv_mix_column_word(w):
+    """ Applies InvMixColumns to a single 32-bit column word. """
+    return (td0[s_box[w >> 24]] ^ td1[s_box[w >> 16 & 0xFF]] ^
+            td2[s_box[w >> 8 & 0xFF]] ^ td3[s_box[w & 0xFF]])
+
+
+# Translation tables for the byte-buffer rounds: bytes.translate applies
+# SubBytes (optionally fused with a MixColumns coefficient) to all 16 bytes.
+s_box_bytes = bytes(s_box)
+inv_s_box_bytes = bytes(inv_s_box)
+s_box_mul2 = bytes(gf_mul(s_box[x], 2) for x in range(256))
+s_box_mul3 = bytes(gf_mul(s_box[x], 3) for x in range(256))
+mul9 = bytes(gf_mul(x, 9) for x in range(256))
+mul11 = bytes(gf_mul(x, 11) for x in range(256))
+mul13 = bytes(gf_mul(x, 13) for x in range(256))
+mul14 = bytes(gf_mul(x, 14) for x in range(256))
+
+def byte_round_getters(gather):
+    """
+    Returns four itemgetters over the 16 state bytes for one round: getter k
+    yields, at position 4c + r, the byte that row r + k of output column c
+    takes from the gather plan. MixColumns output byte r is then
+    2*g0 ^ 3*g1 ^ g2 ^ g3.
+    """
+    return tuple(itemgetter(*[4 * gather[c][(r + k) % 4] + (r + k) % 4 for c in range(4) for r in range(4)])
+                 for k in range(4))
+
+def byte_inv_round_getters(inv_gather):
+    """
+    Returns four itemgetters fusing InvMixColumns with the inverse row gather:
+    output byte r of column c is 14*g0 ^ 11*g1 ^ 13*g2 ^ 9*g3, read from
+    column inv_gather[c][r] before the inverse shift.
+    """
+    return tuple(itemgetter(*[4 * inv_gather[c][r] + (r + k) % 4 for c in range(4) for r in range(4)])
+                 for k in range(4))
+
+
 r_con = (
     0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40,
     0x80, 0x1B, 0x36, 0x6C, 0xD8, 0xAB, 0x4D, 0x9A,
@@ -127,11 +233,30 @@ def bytes2matrix(text):
 
 def matrix2bytes(matrix):
     """ Converts a 4x4 matrix into a 16-byte array.  """
-    return bytes(sum(matrix, []))
+    return bytes(b for column in matrix for b in column)
 
-def xor_bytes(a, b):
-    """ Returns a new byte array with the elements xor'ed. """
-    return bytes(i^j for i, j in zip(a, b))
+# Below this size the big-int XOR beats NumPy's call overhead.
+XOR_NUMPY_MIN = 256
+
+def xor_bytes(a, b, out=None):
+    """
+    XORs two byte buffers (bytes, bytearray or memoryview) as one bulk
+    operation, truncating to the shorter one. Returns new bytes, or writes the
+    result into the writable buffer `out` (which may alias `a`) and returns it.
+    """
+    n = min(len(a), len(b))
+    if np is not None and n >= XOR_NUMPY_MIN:
+        x = np.frombuffer(a, dtype=np.uint8, count=n)
+        y = np.frombuffer(b, dtype=np.uint8, count=n)
+        if out is None:
+            return np.bitwise_xor(x, y).tobytes()
+        np.bitwise_xor(x, y, out=np.frombuffer(out, dtype=np.uint8, count=n))
+        return out
+    result = (int.from_bytes(a[:n], 'big') ^ int.from_bytes(b[:n], 'big')).to_bytes(n, 'big')
+    if out is None:
+        return result
+    out[:n] = result
+    return out
 
 def inc_bytes(a):
     """ Returns a new byte array with the value increment by 1 """
@@ -152,7 +277,7 @@ def pad(plaintext):
     """
     padding_len = 16 - (len(plaintext) % 16)
     padding = bytes([padding_len] * padding_len)
-    return plaintext + padding
+    return b''.join((plaintext, padding))
 
 def unpad(plaintext):
     """
@@ -166,8 +291,340 @@ def unpad(plaintext):
     return message
 
 def split_blocks(message, block_size=16, require_padding=True):
-        assert len(message) % block_size == 0 or not require_padding
-        return [message[i:i+16] for i in range(0, len(message), block_size)]
+    """
+    Iterates over the `block_size`-byte blocks of `message`, slicing each one
+    only when it is reached.
+    """
+    assert len(message) % block_size == 0 or not require_padding
+    return (message[i:i+block_size] for i in range(0, len(message), block_size))
+
+
+if np is not None:
+    np_s_box = np.array(s_box, dtype=np.uint8)
+    np_inv_s_box = np.array(inv_s_box, dtype=np.uint8)
+    np_xtime = np.array([xtime(x) for x in range(256)], dtype=np.uint8)
+    np_xtime2 = np_xtime[np_xtime]
+
+def np_mix_columns(state):
+    """ MixColumns over an (N, 16) uint8 state, using xtime table lookups. """
+    a = state.reshape(-1, 4, 4)
+    t = a[:, :, 0] ^ a[:, :, 1] ^ a[:, :, 2] ^ a[:, :, 3]
+    a = a ^ t[:, :, None] ^ np_xtime[a ^ np.roll(a, -1, axis=2)]
+    return a.reshape(-1, 16)
+
+def np_inv_mix_columns(state):
+    """ InvMixColumns over an (N, 16) uint8 state, see `inv_mix_columns`. """
+    a = state.reshape(-1, 4, 4)
+    u = np_xtime2[a[:, :, 0] ^ a[:, :, 2]]
+    v = np_xtime2[a[:, :, 1] ^ a[:, :, 3]]
+    a = a ^ np.stack((u, v, u, v), axis=2)
+    return np_mix_columns(a.reshape(-1, 16))
+
+def gather_index(gather):
+    """
+    Flattens a per-column row gather plan into a 16-entry index over the
+    column-major state bytes.
+    """
+    return [4 * gather[c][r] + r for c in range(4) for r in range(4)]
+
+def as_block_array(blocks):
+    """
+    Returns a writable (N, 16) uint8 copy of `blocks`, which may be an array
+    of any shape with 16N elements or a bytes-like object.
+    """
+    if isinstance(blocks, np.ndarray):
+        state = np.array(blocks, dtype=np.uint8).reshape(-1, 16)
+    else:
+        state = np.frombuffer(bytes(blocks), dtype=np.uint8).reshape(-1, 16).copy()
+    return state
+
+
+# --- Bitsliced helpers ---
+# N blocks are transposed into 128 big-int bit planes, one per state bit, so
+# each Python integer operation processes every block at once. A byte of
+# the state is a list of 8 planes, least significant bit first.
+
+# Squaring in GF(2^8) is linear: output bit k is the XOR of these input bits.
+_bs_square_taps = tuple(tuple(i for i in range(8) if gf_mul(1 << i, 1 << i) >> k & 1)
+                        for k in range(8))
+
+def bs_gf_mul(a, b):
+    """ Bitsliced GF(2^8) multiplication of two bytes given as 8 planes. """
+    p = [0] * 15
+    for i in range(8):
+        ai = a[i]
+        for j in range(8):
+            p[i + j] ^= ai & b[j]
+    # Reduce modulo x^8 + x^4 + x^3 + x + 1.
+    for k in range(14, 7, -1):
+        t = p[k]
+        p[k - 4] ^= t
+        p[k - 5] ^= t
+        p[k - 7] ^= t
+        p[k - 8] ^= t
+    return p[:8]
+
+def bs_gf_square(a):
+    """ Bitsliced GF(2^8) squaring, a fixed linear map of the planes. """
+    out = []
+    for taps in _bs_square_taps:
+        v = 0
+        for i in taps:
+            v ^= a[i]
+        out.append(v)
+    return out
+
+def bs_gf_inverse(x):
+    """ Bitsliced x^254, the multiplicative inverse in GF(2^8) (0 maps to 0). """
+    x2 = bs_gf_square(x)
+    x3 = bs_gf_mul(x2, x)
+    x12 = bs_gf_square(bs_gf_square(x3))
+    x15 = bs_gf_mul(x12, x3)
+    x240 = bs_gf_square(bs_gf_square(bs_gf_square(bs_gf_square(x15))))
+    return bs_gf_mul(bs_gf_mul(x240, x12), x2)
+
+def bs_sub_byte(x, full):
+    """ Bitsliced S-box: inversion followed by the affine transform. """
+    b = bs_gf_inverse(x)
+    out = []
+    for i in range(8):
+        v = b[i] ^ b[(i + 4) % 8] ^ b[(i + 5) % 8] ^ b[(i + 6) % 8] ^ b[(i + 7) % 8]
+        if 0x63 >> i & 1:
+            v ^= full
+        out.append(v)
+    return out
+
+def bs_inv_sub_byte(x, full):
+    """ Bitsliced inverse S-box: inverse affine transform, then inversion. """
+    b = []
+    for i in range(8):
+        v = x[(i + 2) % 8] ^ x[(i + 5) % 8] ^ x[(i + 7) % 8]
+        if 0x05 >> i & 1:
+            v ^= full
+        b.append(v)
+    return bs_gf_inverse(b)
+
+def bs_xtime(x):
+    """ Bitsliced multiplication by x (i.e. {02}). """
+    x7 = x[7]
+    return [x7, x[0] ^ x7, x[1], x[2] ^ x7, x[3] ^ x7, x[4], x[5], x[6]]
+
+def bs_mix_columns(s):
+    """ Bitsliced MixColumns over a state of 16 bytes of 8 planes each. """
+    out = []
+    for c in range(0, 16, 4):
+        a = s[c:c+4]
+        t = [a[0][i] ^ a[1][i] ^ a[2][i] ^ a[3][i] for i in range(8)]
+        for r in range(4):
+            ar, an = a[r], a[(r + 1) % 4]
+            x = bs_xtime([ar[i] ^ an[i] for i in range(8)])
+            out.append([ar[i] ^ t[i] ^ x[i] for i in range(8)])
+    return out
+
+def bs_inv_mix_columns(s):
+    """ Bitsliced InvMixColumns, see `inv_mix_columns`. """
+    out = []
+    for c in range(0, 16, 4):
+        a = s[c:c+4]
+        u = bs_xtime(bs_xtime([a[0][i] ^ a[2][i] for i in range(8)]))
+        v = bs_xtime(bs_xtime([a[1][i] ^ a[3][i] for i in range(8)]))
+        out.append([a[0][i] ^ u[i] for i in range(8)])
+        out.append([a[1][i] ^ v[i] for i in range(8)])
+        out.append([a[2][i] ^ u[i] for i in range(8)])
+        out.append([a[3][i] ^ v[i] for i in range(8)])
+    return bs_mix_columns(out)
+
+def bs_add_round_key(state, round_key, full):
+    """ XORs a round key (four column words) into the bitsliced state. """
+    key = b''.join(w.to_bytes(4, 'big') for w in round_key)
+    for planes, k in zip(state, key):
+        for b in range(8):
+            if k >> b & 1:
+                planes[b] ^= full
+
+def bs_transpose(data):
+    """
+    Transposes 16N bytes of blocks (N a multiple of 8) into 16 bytes of 8 bit
+    planes. Blocks are split into 8 chunks of N/8; block j of chunk k lives
+    in bit 8j + k of every plane.
+    """
+    lanes = len(data) // 128
+    ones = int.from_bytes(b'\x01' * lanes, 'little')
+    chunk_size = 16 * lanes
+    state = []
+    for p in range(16):
+        planes = [0] * 8
+        for k in range(8):
+            column = int.from_bytes(data[k * chunk_size + p:(k + 1) * chunk_size:16], 'little')
+            for b in range(8):
+                planes[b] |= (column >> b & ones) << k
+        state.append(planes)
+    return state
+
+def bs_untranspose(state, lanes):
+    """ Inverse of `bs_transpose`, returning the blocks as bytes. """
+    ones = int.from_bytes(b'\x01' * lanes, 'little')
+    chunk_size = 16 * lanes
+    out = bytearray(8 * chunk_size)
+    for p, planes in enumerate(state):
+        for k in range(8):
+            column = 0
+            for b in range(8):
+                column |= (planes[b] >> k & ones) << b
+            out[k * chunk_size + p:(k + 1) * chunk_size:16] = column.to_bytes(lanes, 'little')
+    return bytes(out)
+# --- end Bitsliced helpers ---
+
+
+def _kdrp_gather(perm, direction):
+    """
+    Returns, for each output column c, the source column of each row r once
+    row r is rotated by perm[r]: left for direction=1, right for direction=-1.
+    """
+    return tuple(tuple((c + direction * (perm[r] & 3)) % 4 for r in range(4))
+                 for c in range(4))
+
+
+def _unrolled_rounds_source(name, n_rounds, gather, tables, sbox):
+    """
+    Returns the source of a fully unrolled T-table round function with the
+    row gather baked in as constant local-variable names.
+    """
+    table_args = ', '.join('t%d=%s' % (i, t) for i, t in enumerate(tables))
+    n_keys = 4 * (n_rounds + 1)
+    lines = [
+        'def %s(rk, state, %s, sb=%s):' % (name, table_args, sbox),
+        '    %s, = rk' % ', '.join('k%d' % i for i in range(n_keys)),
+        '    s0 = state >> 96 ^ k0',
+        '    s1 = state >> 64 & 0xFFFFFFFF ^ k1',
+        '    s2 = state >> 32 & 0xFFFFFFFF ^ k2',
+        '    s3 = state & 0xFFFFFFFF ^ k3',
+    ]
+    src, dst = 's', 'u'
+    for i in range(1, n_rounds):
+        for c, (a, b, cc, d) in enumerate(gather):
+            lines.append('    %s%d = t0[%s%d >> 24] ^ t1[%s%d >> 16 & 0xFF] ^ t2[%s%d >> 8 & 0xFF] ^ t3[%s%d & 0xFF] ^ k%d'
+                         % (dst, c, src, a, src, b, src, cc, src, d, 4 * i + c))
+        src, dst = dst, src
+    words = []
+    for c, (a, b, cc, d) in enumerate(gather):
+        words.append('((sb[%s%d >> 24] << 24 | sb[%s%d >> 16 & 0xFF] << 16 | sb[%s%d >> 8 & 0xFF] << 8 | sb[%s%d & 0xFF]) ^ k%d) << %d'
+                     % (src, a, src, b, src, cc, src, d, 4 * n_rounds + c, 96 - 32 * c))
+    lines.append('    return ' + ' | '.join(words))
+    return '\n'.join(lines) + '\n'
+
+
+# Unrolled encrypt/decrypt functions keyed by (n_rounds, KDRP permutation).
+# There are 3 round counts and 24 permutations, so at most 72 entries.
+_round_functions = {}
+
+def get_round_functions(n_rounds, perm):
+    """
+    Returns the (encrypt, decrypt) pair of unrolled T-table round functions
+    specialised for `n_rounds` and the KDRP permutation `perm`, generating
+    them on first use. Both take a flat tuple of round key words and a
+    128-bit state; decrypt expects equivalent-inverse-cipher round keys.
+    """
+    cache_key = (n_rounds, tuple(perm))
+    functions = _round_functions.get(cache_key)
+    if functions is None:
+        namespace = {}
+        exec(_unrolled_rounds_source('encrypt', n_rounds, _kdrp_gather(perm, 1),
+                                     ('te0', 'te1', 'te2', 'te3'), 's_box'), globals(), namespace)
+        exec(_unrolled_rounds_source('decrypt', n_rounds, _kdrp_gather(perm, -1),
+                                     ('td0', 'td1', 'td2', 'td3'), 'inv_s_box'), globals(), namespace)
+        functions = _round_functions[cache_key] = (namespace['encrypt'], namespace['decrypt'])
+    return functions
+
+
+# 8-byte big-endian block index of the KW-Tweak.
+pack_block_index = struct.Struct('>Q').pack
+# Default KW-Tweak IV of the sector mode, separating it from message modes.
+SECTOR_TWEAK_IV = b'KW-Tweak sector'
+
+def _ghash_tables(h):
+    """
+    Builds the per-key GHASH tables: table j maps a byte value b to the
+    product with H of the block holding b at byte j. Blocks use GCM's
+    reflected bit order, where the leftmost bit is the x^0 coefficient.
+    """
+    # powers[p] = x^p * H, i.e. H shifted right p times with reduction.
+    powers = []
+    v = h
+    for _ in range(128):
+        powers.append(v)
+        v = (v >> 1) ^ (0xE1 << 120) if v & 1 else v >> 1
+    tables = []
+    for j in range(16):
+        table = [0] * 256
+        for k in range(8):
+            table[1 << k] = powers[8 * j + 7 - k]
+        for b in range(1, 256):
+            low = b & -b
+            if b != low:
+                table[b] = table[b ^ low] ^ table[low]
+        tables.append(table)
+    return tables
+
+
+class GHash:
+    """
+    GHASH universal hash over GF(2^128) with key H, using Shoup-style
+    precomputed tables 8 bits at a time: a block multiply is 16 lookups and
+    XORs instead of 128 shift-and-add steps.
+    """
+    def __init__(self, h):
+        self._tables = _ghash_tables(int.from_bytes(h, 'big'))
+
+    def update(self, y, data):
+        """
+        Folds the blocks of `data` into the hash state `y` and returns the new
+        state. A final partial block is zero-padded, so every call but the
+        last for one input must pass whole blocks.
+        """
+        if len(data) % 16:
+            data = bytes(data) + bytes(16 - len(data) % 16)
+        t0, t1, t2, t3, t4, t5, t6, t7, t8, t9, t10, t11, t12, t13, t14, t15 = self._tables
+        for i in range(0, len(data), 16):
+            b = (y ^ int.from_bytes(data[i:i+16], 'big')).to_bytes(16, 'big')
+            y = (t0[b[0]] ^ t1[b[1]] ^ t2[b[2]] ^ t3[b[3]] ^ t4[b[4]] ^ t5[b[5]] ^ t6[b[6]] ^ t7[b[7]] ^
+                 t8[b[8]] ^ t9[b[9]] ^ t10[b[10]] ^ t11[b[11]] ^ t12[b[12]] ^ t13[b[13]] ^ t14[b[14]] ^ t15[b[15]])
+        return y
+
+
+class KWMaskGenerator:
+    """
+    Per-message KW-Tweak mask generator. The tweak IV is absorbed into a
+    SHA-256 context once, and each block index only copies that context and
+    adds its own index and the master key, so masks stay
+    W = Trunc16(SHA256(iv || block_index[8] || master_key)).
+    """
+    def __init__(self, master_key, iv=None):
+        self._prefix = hashlib.sha256(iv or b'')
+        self._master_key = bytes(master_key)
+
+    def mask(self, block_index):
+        """ Returns the 16-byte whitening mask of `block_index`. """
+        h = self._prefix.copy()
+        h.update(pack_block_index(block_index) + self._master_key)
+        return h.digest()[:16]
+
+    def tape(self, n, start=0):
+        """
+        Returns one contiguous buffer with the masks of blocks start..start+n-1,
+        so whitening a whole message is a single XOR.
+        """
+        return self.masks(range(start, start + n))
+
+    def masks(self, block_indices):
+        """ Returns the concatenated masks of every index in `block_indices`. """
+        prefix, key = self._prefix, self._master_key
+        out = []
+        for i in block_indices:
+            h = prefix.copy()
+            h.update(pack_block_index(i) + key)
+            out.append(h.digest()[:16])
+        return b''.join(out)
 
 
 class AES:
@@ -178,11 +635,28 @@ class AES:
     management. Unless you need that, please use `encrypt` and `decrypt`.
     """
     rounds_by_key_size = {16: 10, 24: 12, 32: 14}
-    def __init__(self, master_key):
+    engines = ('ttable', 'matrix', 'bytes')
+    batch_backends = ('numpy', 'bitsliced', 'loop')
+    modes = ('cbc', 'pcbc', 'cfb', 'ofb', 'ctr')
+    # Below this many blocks the bitsliced engine is slower than the T-table loop.
+    bitslice_min_blocks = 1024
+    # Below this many blocks NumPy's per-call setup outweighs its vectorised rounds.
+    numpy_min_blocks = 16
+    # Blocks per task when batch work is handed to an executor.
+    pool_chunk_blocks = 4096
+    # Bytes per sector of the sector (disk) mode.
+    sector_size = 4096
+    def __init__(self, master_key, engine='ttable'):
         """
         Initializes the object with a given key.
+
+        `engine` selects the round implementation: 'ttable' runs on 32-bit
+        column words with fused SubBytes/MixColumns tables, 'bytes' keeps the
+        state in a 16-byte buffer driven by `bytes.translate`, and 'matrix'
+        runs the reference list-of-lists rounds. All produce identical output.
         """
         assert len(master_key) in AES.rounds_by_key_size
+        assert engine in AES.engines
         self.n_rounds = AES.rounds_by_key_size[len(master_key)]
         self._key_matrices = self._expand_key(master_key)
         # KDRP: derive per-key row-shift permutation from first 4 key bytes
@@ -190,39 +664,69 @@ class AES:
         # KW-Tweak: keep master key for whitening PRF
         self._master_key = bytes(master_key)
 
+        self.engine = engine
+        self._gather = self._kdrp_gather_plan()
+        self._inv_gather = self._inv_kdrp_gather_plan()
+        # Equivalent-inverse-cipher round keys, built on the first decryption.
+        self._dec_key_matrices = None
+        # Batch (NumPy) round keys and gather indices, built on first use.
+        self._np_round_keys = None
+        # GHASH tables for the authenticated mode, built on first use.
+        self._ghash = None
+        # Optional KeystreamReservoir with precomputed CTR/OFB keystreams.
+        self.reservoir = None
+        if engine == 'ttable':
+            self._round_functions = get_round_functions(self.n_rounds, self.perm)
+            flat_keys = tuple(w for round_key in self._key_matrices for w in round_key)
+            self._encrypt_int = partial(self._round_functions[0], flat_keys)
+            self._decrypt_int = self._decrypt_int_ttable
+        elif engine == 'bytes':
+            self._prepare_bytes_engine()
+            self._encrypt_int = self._encrypt_int_bytes
+            self._decrypt_int = self._decrypt_int_bytes
+        else:
+            self._encrypt_int = self._encrypt_int_matrix
+            self._decrypt_int = self._decrypt_int_matrix
+
     def _expand_key(self, master_key):
         """
-        Expands and returns a list of key matrices for the given master_key.
+        Expands and returns a list of round keys for the given master_key.
+        Each round key is a tuple of four 32-bit column words.
         """
         # Initialize round keys with raw key material.
-        key_columns = bytes2matrix(master_key)
+        key_columns = [int.from_bytes(master_key[i:i+4], 'big') for i in range(0, len(master_key), 4)]
         iteration_size = len(master_key) // 4
 
         i = 1
         while len(key_columns) < (self.n_rounds + 1) * 4:
             # Copy previous word.
-            word = list(key_columns[-1])
+            word = key_columns[-1]
 
             # Perform schedule_core once every "row".
             if len(key_columns) % iteration_size == 0:
                 # Circular shift.
-                word.append(word.pop(0))
+                word = ((word << 8) | (word >> 24)) & 0xFFFFFFFF
                 # Map to S-BOX.
-                word = [s_box[b] for b in word]
+                word = sub_word(word)
                 # XOR with first byte of R-CON, since the others bytes of R-CON are 0.
-                word[0] ^= r_con[i]
+                word ^= r_con[i] << 24
                 i += 1
             elif len(master_key) == 32 and len(key_columns) % iteration_size == 4:
                 # Run word through S-box in the fourth iteration when using a
                 # 256-bit key.
-                word = [s_box[b] for b in word]
+                word = sub_word(word)
 
             # XOR with equivalent word from previous iteration.
-            word = xor_bytes(word, key_columns[-iteration_size])
-            key_columns.append(word)
+            key_columns.append(word ^ key_columns[-iteration_size])
+
+        # Group key words in rounds of four columns.
+        return [tuple(key_columns[4*i : 4*(i+1)]) for i in range(len(key_columns) // 4)]
 
-        # Group key words in 4x4 byte matrices.
-        return [key_columns[4*i : 4*(i+1)] for i in range(len(key_columns) // 4)]
+    def _round_key_matrix(self, i):
+        """
+        Materialises round key `i` as a 4x4 matrix for the list-based rounds.
+        """
+        return [list(word.to_bytes(4, 'big')) for word in self._key_matrices[i]]
 
     # --- KDRP helpers ---
     def _generate_kdrp_permutation(self, master_key: bytes):
@@ -259,6 +763,21 @@ class AES:
                 rotated = row[-k:] + row[:-k]
                 for c, v in enumerate(rotated):
                     s[c][r] = v
+
+    def _kdrp_gather_plan(self):
+        """
+        Returns, for each output column c, the source column of each row after
+        KDRP. Row r is rotated left by perm[r], so output (c, r) comes from
+        input column (c + perm[r]) % 4.
+        """
+        return _kdrp_gather(self.perm, 1)
+
+    def _inv_kdrp_gather_plan(self):
+        """
+        Inverse of `_kdrp_gather_plan`: row r is rotated right by perm[r], so
+        output (c, r) comes from input column (c - perm[r]) % 4.
+        """
+        return _kdrp_gather(self.perm, -1)
     # --- end KDRP helpers ---
 
     # --- KW-Tweak helpers ---
@@ -274,8 +793,13 @@ class AES:
         """
         Whitening mask W = Trunc16(SHA256(tweak || master_key))
         """
-        import hashlib
         return hashlib.sha256(tweak_bytes + self._master_key).digest()[:16]
+
+    def _kw_mask_generator(self, iv: bytes | None) -> KWMaskGenerator:
+        """
+        Returns a mask generator for all blocks tweaked with `iv`.
+        """
+        return KWMaskGenerator(self._master_key, iv)
     # --- end KW-Tweak helpers ---
 
     def encrypt_block(self, plaintext, block_index: int = 0, tweak_iv: bytes | None = None):
@@ -287,23 +811,35 @@ class AES:
 
         # KW-Tweak pre-whitening
         mask = self._kw_whitening_mask(self._kw_tweak_bytes(block_index, tweak_iv))
-        xored = xor_bytes(plaintext, mask)
+        return self._encrypt_masked(plaintext, mask)
 
-        plain_state = bytes2matrix(xored)
+    def _encrypt_masked(self, plaintext, mask):
+        """
+        Encrypts a 16-byte block given its precomputed whitening mask.
+        """
+        state = int.from_bytes(plaintext, 'big') ^ int.from_bytes(mask, 'big')
+        return self._encrypt_int(state).to_bytes(16, 'big')
 
-        add_round_key(plain_state, self._key_matrices[0])
+    def _encrypt_int_matrix(self, state):
+        """
+        Runs the AES rounds with KDRP on an already whitened 128-bit block,
+        using the list-of-lists state.
+        """
+        plain_state = bytes2matrix(state.to_bytes(16, 'big'))
+
+        add_round_key(plain_state, self._round_key_matrix(0))
 
         for i in range(1, self.n_rounds):
             sub_bytes(plain_state)
             self._shift_rows_kdrp(plain_state)
             mix_columns(plain_state)
-            add_round_key(plain_state, self._key_matrices[i])
+            add_round_key(plain_state, self._round_key_matrix(i))
 
         sub_bytes(plain_state)
         self._shift_rows_kdrp(plain_state)
-        add_round_key(plain_state, self._key_matrices[-1])
+        add_round_key(plain_state, self._round_key_matrix(-1))
 
-        return matrix2bytes(plain_state)
+        return int.from_bytes(matrix2bytes(plain_state), 'big')
 
     def decrypt_block(self, ciphertext, block_index: int = 0, tweak_iv: bytes | None = None):
         """
@@ -314,24 +850,488 @@ class AES:
 
         # Pre-compute whitening mask (same tweak as encryption)
         mask = self._kw_whitening_mask(self._kw_tweak_bytes(block_index, tweak_iv))
+        return self._decrypt_masked(ciphertext, mask)
+
+    def _decrypt_masked(self, ciphertext, mask):
+        """
+        Decrypts a 16-byte block and removes its precomputed whitening mask.
+        """
+        state = self._decrypt_int(int.from_bytes(ciphertext, 'big')) ^ int.from_bytes(mask, 'big')
+        return state.to_bytes(16, 'big')
 
-        cipher_state = bytes2matrix(ciphertext)
+    def _prepare_decryption(self):
+        """
+        Builds the equivalent-inverse-cipher round keys: InvMixColumns applied
+        to the inner round keys, in reverse order.
+        """
+        rk = self._key_matrices
+        dk = [rk[-1]]
+        for i in range(self.n_rounds - 1, 0, -1):
+            dk.append(tuple(inv_mix_column_word(w) for w in rk[i]))
+        dk.append(rk[0])
+        self._dec_key_matrices = dk
+
+    def _decrypt_int_ttable(self, state):
+        """
+        First decryption on a 'ttable' instance: builds the decryption round
+        keys, then rebinds `_decrypt_int` to the unrolled inverse rounds.
+        """
+        self._prepare_decryption()
+        flat_keys = tuple(w for round_key in self._dec_key_matrices for w in round_key)
+        self._decrypt_int = partial(self._round_functions[1], flat_keys)
+        return self._decrypt_int(state)
 
-        add_round_key(cipher_state, self._key_matrices[-1])
+    def _decrypt_int_matrix(self, state):
+        """
+        Runs the inverse AES rounds with KDRP on a 128-bit block using the
+        list-of-lists state, returning the still-whitened block.
+        """
+        cipher_state = bytes2matrix(state.to_bytes(16, 'big'))
+
+        add_round_key(cipher_state, self._round_key_matrix(-1))
         self._inv_shift_rows_kdrp(cipher_state)
         inv_sub_bytes(cipher_state)
 
         for i in range(self.n_rounds - 1, 0, -1):
-            add_round_key(cipher_state, self._key_matrices[i])
+            add_round_key(cipher_state, self._round_key_matrix(i))
             inv_mix_columns(cipher_state)
             self._inv_shift_rows_kdrp(cipher_state)
             inv_sub_bytes(cipher_state)
 
-        add_round_key(cipher_state, self._key_matrices[0])
+        add_round_key(cipher_state, self._round_key_matrix(0))
 
-        # Remove whitening
-        pre_chain = matrix2bytes(cipher_state)
-        return xor_bytes(pre_chain, mask)
+        return int.from_bytes(matrix2bytes(cipher_state), 'big')
+
+    def _prepare_bytes_engine(self):
+        """
+        Builds the 128-bit round keys and the itemgetter gathers used by the
+        byte-buffer rounds.
+        """
+        self._round_key_ints = [k0 << 96 | k1 << 64 | k2 << 32 | k3 for k0, k1, k2, k3 in self._key_matrices]
+        self._byte_getters = byte_round_getters(self._gather)
+        self._byte_inv_getters = byte_inv_round_getters(self._inv_gather)
+        self._byte_inv_shift = itemgetter(*gather_index(self._inv_gather))
+
+    def _encrypt_int_bytes(self, state):
+        """
+        Runs the AES rounds with KDRP on a 16-byte buffer: SubBytes and the
+        MixColumns coefficients are `bytes.translate` calls, the row gather
+        an itemgetter, and AddRoundKey a 128-bit int XOR.
+        """
+        rk = self._round_key_ints
+        g0, g1, g2, g3 = self._byte_getters
+        st = (state ^ rk[0]).to_bytes(16, 'big')
+        for i in range(1, self.n_rounds):
+            sb = st.translate(s_box_bytes)
+            st = (int.from_bytes(g0(st.translate(s_box_mul2)), 'big') ^
+                  int.from_bytes(g1(st.translate(s_box_mul3)), 'big') ^
+                  int.from_bytes(g2(sb), 'big') ^ int.from_bytes(g3(sb), 'big') ^ rk[i]).to_bytes(16, 'big')
+        return int.from_bytes(g0(st.translate(s_box_bytes)), 'big') ^ rk[-1]
+
+    def _decrypt_int_bytes(self, state):
+        """
+        Runs the inverse AES rounds with KDRP on a 16-byte buffer, with InvMixColumns
+        fused into the inverse row gather through the mul9/11/13/14 tables.
+        """
+        rk = self._round_key_ints
+        h0, h1, h2, h3 = self._byte_inv_getters
+        st = bytes(self._byte_inv_shift((state ^ rk[-1]).to_bytes(16, 'big'))).translate(inv_s_box_bytes)
+        for i in range(self.n_rounds - 1, 0, -1):
+            b = (int.from_bytes(st, 'big') ^ rk[i]).to_bytes(16, 'big')
+            st = (int.from_bytes(h0(b.translate(mul14)), 'big') ^ int.from_bytes(h1(b.translate(mul11)), 'big') ^
+                  int.from_bytes(h2(b.translate(mul13)), 'big') ^ int.from_bytes(h3(b.translate(mul9)), 'big')
+                  ).to_bytes(16, 'big').translate(inv_s_box_bytes)
+        return int.from_bytes(st, 'big') ^ rk[0]
+
+    def wipe(self):
+        """
+        Overwrites every round-key representation this instance holds (the
+        matrices, the bytes engine's 128-bit ints, the NumPy array and the
+        GHASH tables) and drops its state; the object is unusable afterwards.
+        Best effort: immutable copies, such as the flattened keys bound into
+        the T-table round functions, cannot be reached. Safe to call twice.
+        """
+        state = vars(self)
+        for name in ('_key_matrices', '_dec_key_matrices'):
+            schedule = state.get(name)
+            if schedule is not None:
+                schedule[:] = [(0, 0, 0, 0)] * len(schedule)
+        round_key_ints = state.get('_round_key_ints')
+        if round_key_ints is not None:
+            round_key_ints[:] = [0] * len(round_key_ints)
+        if state.get('_np_round_keys') is not None:
+            self._np_round_keys.fill(0)
+        if state.get('_ghash') is not None:
+            for table in self._ghash._tables:
+                table[:] = [0] * len(table)
+        if state.get('reservoir') is not None:
+            self.reservoir.close()
+        state.clear()
+
+    def _kw_block_masks(self, block_index, tweak_iv, n):
+        """
+        Returns the concatenated whitening masks of `n` blocks. `block_index`
+        is None (index 0), a single int, or a sequence of `n` ints.
+        """
+        if block_index is None or not hasattr(block_index, '__len__'):
+            return self._kw_whitening_mask(self._kw_tweak_bytes(block_index or 0, tweak_iv)) * n
+        assert len(block_index) == n
+        return self._kw_mask_generator(tweak_iv).masks(int(i) for i in block_index)
+
+    def _np_prepare(self):
+        """
+        Builds the round keys as a (n_rounds + 1, 16) uint8 array and the
+        KDRP permutation as 16-byte gather indices for the batch rounds.
+        """
+        round_keys = np.array(
+            [list(b''.join(w.to_bytes(4, 'big') for w in round_key)) for round_key in self._key_matrices],
+            dtype=np.uint8)
+        self._np_gather = np.array(gather_index(self._gather), dtype=np.intp)
+        self._np_inv_gather = np.array(gather_index(self._inv_gather), dtype=np.intp)
+        # Published last: callers test only `_np_round_keys`, possibly from other threads.
+        self._np_round_keys = round_keys
+
+    def _encrypt_array(self, state):
+        """
+        Runs the AES rounds with KDRP on an already whitened (N, 16) uint8
+        state: SubBytes is fancy indexing, KDRP a column gather and
+        MixColumns xtime table lookups.
+        """
+        if self._np_round_keys is None:
+            self._np_prepare()
+        rk = self._np_round_keys
+        gather = self._np_gather
+
+        state ^= rk[0]
+        for i in range(1, self.n_rounds):
+            state = np_mix_columns(np_s_box[state][:, gather])
+            state ^= rk[i]
+        state = np_s_box[state][:, gather]
+        state ^= rk[-1]
+        return state
+
+    def _decrypt_array(self, state):
+        """
+        Runs the inverse AES rounds with KDRP on an (N, 16) uint8 state,
+        returning the still-whitened blocks.
+        """
+        if self._np_round_keys is None:
+            self._np_prepare()
+        rk = self._np_round_keys
+        inv_gather = self._np_inv_gather
+
+        state ^= rk[-1]
+        state = np_inv_s_box[state[:, inv_gather]]
+        for i in range(self.n_rounds - 1, 0, -1):
+            state ^= rk[i]
+            state = np_inv_s_box[np_inv_mix_columns(state)[:, inv_gather]]
+        state ^= rk[0]
+        return state
+
+    def _encrypt_bitsliced(self, data):
+        """
+        Runs the AES rounds with KDRP on whitened blocks (16N bytes) through
+        the bitsliced engine. KDRP is a renaming of bit planes.
+        """
+        n = len(data) // 16
+        lanes = -(-n // 8)
+        full = (1 << 8 * lanes) - 1
+        state = bs_transpose(bytes(data) + bytes(16 * (8 * lanes - n)))
+        order = gather_index(self._gather)
+        rk = self._key_matrices
+
+        bs_add_round_key(state, rk[0], full)
+        for i in range(1, self.n_rounds):
+            state = [bs_sub_byte(x, full) for x in state]
+            state = bs_mix_columns([state[j] for j in order])
+            bs_add_round_key(state, rk[i], full)
+        state = [bs_sub_byte(state[j], full) for j in order]
+        bs_add_round_key(state, rk[-1], full)
+
+        return bs_untranspose(state, lanes)[:16 * n]
+
+    def _decrypt_bitsliced(self, data):
+        """
+        Runs the inverse AES rounds with KDRP on blocks (16N bytes) through the
+        bitsliced engine, returning the still-whitened blocks.
+        """
+        n = len(data) // 16
+        lanes = -(-n // 8)
+        full = (1 << 8 * lanes) - 1
+        state = bs_transpose(bytes(data) + bytes(16 * (8 * lanes - n)))
+        order = gather_index(self._inv_gather)
+        rk = self._key_matrices
+
+        bs_add_round_key(state, rk[-1], full)
+        state = [bs_inv_sub_byte(state[j], full) for j in order]
+        for i in range(self.n_rounds - 1, 0, -1):
+            bs_add_round_key(state, rk[i], full)
+            state = bs_inv_mix_columns(state)
+            state = [bs_inv_sub_byte(state[j], full) for j in order]
+        bs_add_round_key(state, rk[0], full)
+
+        return bs_untranspose(state, lanes)[:16 * n]
+
+    def _batch_backend(self, backend, n):
+        """
+        Picks the batch backend: NumPy when installed and the batch is large
+        enough to amortise it, else the bitsliced engine for large batches
+        and a loop over the integer core otherwise.
+        """
+        if backend is None:
+            if np is not None and n >= AES.numpy_min_blocks:
+                return 'numpy'
+            return 'bitsliced' if n >= AES.bitslice_min_blocks else 'loop'
+        assert backend in AES.batch_backends
+        assert backend != 'numpy' or np is not None, 'NumPy is not installed.'
+        return backend
+
+    def encrypt_blocks(self, blocks, block_index=None, tweak_iv: bytes | None = None, backend=None):
+        """
+        Encrypts N independent 16-byte blocks in one call, giving the same
+        result as `encrypt_block` on each. `blocks` is an (N, 16) uint8 NumPy
+        array or a bytes-like object of 16N bytes; the result has the same
+        type. `block_index` is a single int or a sequence of N ints.
+
+        `backend` is one of `AES.batch_backends`; by default NumPy is used
+        when installed (from `numpy_min_blocks`), otherwise the bitsliced
+        engine for large batches.
+        """
+        is_array = np is not None and isinstance(blocks, np.ndarray)
+        n = blocks.size // 16 if is_array else len(blocks) // 16
+        backend = self._batch_backend(backend, n)
+        masks = self._kw_block_masks(block_index, tweak_iv, n)
+
+        if backend == 'numpy':
+            state = as_block_array(blocks)
+            state ^= np.frombuffer(masks, dtype=np.uint8).reshape(-1, 16)
+            state = self._encrypt_array(state)
+            return state if is_array else state.tobytes()
+
+        data = bytes(blocks)
+        assert len(data) % 16 == 0
+        whitened = xor_bytes(data, masks)
+        if backend == 'bitsliced':
+            out = self._encrypt_bitsliced(whitened)
+        else:
+            encrypt_int = self._encrypt_int
+            out = b''.join(encrypt_int(int.from_bytes(whitened[i:i+16], 'big')).to_bytes(16, 'big')
+                           for i in range(0, len(whitened), 16))
+        return np.frombuffer(out, dtype=np.uint8).reshape(blocks.shape).copy() if is_array else out
+
+    def decrypt_blocks(self, blocks, block_index=None, tweak_iv: bytes | None = None, backend=None):
+        """
+        Decrypts N independent 16-byte blocks in one call, giving the same
+        result as `decrypt_block` on each. Arguments as in `encrypt_blocks`.
+        """
+        is_array = np is not None and isinstance(blocks, np.ndarray)
+        n = blocks.size // 16 if is_array else len(blocks) // 16
+        backend = self._batch_backend(backend, n)
+        masks = self._kw_block_masks(block_index, tweak_iv, n)
+
+        if backend == 'numpy':
+            state = self._decrypt_array(as_block_array(blocks))
+            state ^= np.frombuffer(masks, dtype=np.uint8).reshape(-1, 16)
+            return state if is_array else state.tobytes()
+
+        data = bytes(blocks)
+        assert len(data) % 16 == 0
+        if backend == 'bitsliced':
+            out = self._decrypt_bitsliced(data)
+        else:
+            decrypt_int = self._decrypt_int
+            out = b''.join(decrypt_int(int.from_bytes(data[i:i+16], 'big')).to_bytes(16, 'big')
+                           for i in range(0, len(data), 16))
+        out = xor_bytes(out, masks)
+        return np.frombuffer(out, dtype=np.uint8).reshape(blocks.shape).copy() if is_array else out
+
+    def _batch_blocks(self, decrypt, data, tweak_iv, start=0, executor=None):
+        """
+        Runs `decrypt_blocks` (or `encrypt_blocks`) over `data` with block
+        indices start, start+1, ... under `tweak_iv`. Given an `executor`
+        (e.g. a `concurrent.futures.ProcessPoolExecutor`), the blocks are
+        split into chunks of `pool_chunk_blocks` and processed by its workers.
+        """
+        n = len(data) // 16
+        if executor is None or n <= self.pool_chunk_blocks:
+            method = self.decrypt_blocks if decrypt else self.encrypt_blocks
+            return method(data, range(start, start + n), tweak_iv)
+
+        step = 16 * self.pool_chunk_blocks
+        offsets = range(0, 16 * n, step)
+        parts = executor.map(_pool_blocks, repeat(self._master_key), repeat(self.engine), repeat(decrypt),
+                             [bytes(data[i:i+step]) for i in offsets],
+                             [start + i // 16 for i in offsets], repeat(tweak_iv))
+        return b''.join(parts)
+
+    def _prepare_ghash(self):
+        """
+        Builds the GHASH tables for the hash key H = encrypt_block(0).
+        """
+        self._ghash = GHash(self.encrypt_block(bytes(16)))
+
+    def _aead_tag(self, y, iv, ad_length, length):
+        """
+        Finishes the GHASH state `y` with the bit lengths and masks it with
+        keystream block 0, which the payload never uses.
+        """
+        y = self._ghash.update(y, struct.pack('>QQ', 8 * ad_length, 8 * length))
+        return xor_bytes(y.to_bytes(16, 'big'), self._ctr_keystream(iv, 1))
+
+    def encrypt_aead(self, plaintext, iv, associated_data=b''):
+        """
+        Encrypts and authenticates `plaintext` (and authenticates
+        `associated_data`) in one pass, returning ciphertext || 16-byte tag.
+        The payload is the KW-Tweak CTR keystream from block 1 on, and the
+        tag is GHASH over the associated data and ciphertext, as in GCM.
+        """
+        assert len(iv) == 16
+        if self._ghash is None:
+            self._prepare_ghash()
+
+        y = self._ghash.update(0, associated_data)
+        step = 16 * self.pool_chunk_blocks
+        blocks = []
+        for i in range(0, len(plaintext), step):
+            chunk = self.ctr_crypt(plaintext[i:i+step], iv, offset=16 + i)
+            y = self._ghash.update(y, chunk)
+            blocks.append(chunk)
+        blocks.append(self._aead_tag(y, iv, len(associated_data), len(plaintext)))
+        return b''.join(blocks)
+
+    def decrypt_aead(self, ciphertext, iv, associated_data=b''):
+        """
+        Verifies and decrypts the output of `encrypt_aead`. Raises
+        AssertionError if the ciphertext, tag or associated data was modified.
+        """
+        assert len(iv) == 16
+        assert len(ciphertext) >= 16, 'Ciphertext is shorter than the tag.'
+        if self._ghash is None:
+            self._prepare_ghash()
+        ciphertext, tag = ciphertext[:-16], ciphertext[-16:]
+
+        y = self._ghash.update(0, associated_data)
+        step = 16 * self.pool_chunk_blocks
+        blocks = []
+        for i in range(0, len(ciphertext), step):
+            chunk = ciphertext[i:i+step]
+            y = self._ghash.update(y, chunk)
+            blocks.append(self.ctr_crypt(chunk, iv, offset=16 + i))
+        expected_tag = self._aead_tag(y, iv, len(associated_data), len(ciphertext))
+        assert compare_digest(tag, expected_tag), 'Ciphertext corrupted or tampered.'
+        return b''.join(blocks)
+
+    def encrypt_aead_into(self, src, dst, iv, associated_data=b''):
+        """
+        Same as `encrypt_aead`, but writes the ciphertext into the writable
+        buffer `dst` (e.g. an mmap, possibly `src` itself for in-place
+        operation) and returns only the 16-byte tag.
+        """
+        assert len(iv) == 16
+        assert len(dst) >= len(src)
+        if self._ghash is None:
+            self._prepare_ghash()
+        src, dst = memoryview(src).cast('B'), memoryview(dst).cast('B')
+
+        y = self._ghash.update(0, associated_data)
+        step = 16 * self.pool_chunk_blocks
+        for i in range(0, len(src), step):
+            chunk = dst[i:min(i + step, len(src))]
+            self.ctr_crypt(src[i:i+step], iv, offset=16 + i, out=chunk)
+            y = self._ghash.update(y, chunk)
+        return self._aead_tag(y, iv, len(associated_data), len(src))
+
+    def decrypt_aead_into(self, src, dst, iv, tag, associated_data=b''):
+        """
+        Verifies `tag` over the ciphertext `src` first, then decrypts it into
+        `dst` (which may be `src`), so nothing is written unless the
+        ciphertext is authentic. Raises AssertionError otherwise.
+        """
+        assert len(iv) == 16
+        assert len(dst) >= len(src)
+        if self._ghash is None:
+            self._prepare_ghash()
+        src, dst = memoryview(src).cast('B'), memoryview(dst).cast('B')
+
+        y = self._ghash.update(0, associated_data)
+        step = 16 * self.pool_chunk_blocks
+        for i in range(0, len(src), step):
+            y = self._ghash.update(y, src[i:i+step])
+        expected_tag = self._aead_tag(y, iv, len(associated_data), len(src))
+        assert compare_digest(tag, expected_tag), 'Ciphertext corrupted or tampered.'
+
+        for i in range(0, len(src), step):
+            self.ctr_crypt(src[i:i+step], iv, offset=16 + i, out=dst[i:min(i + step, len(src))])
+        return len(src)
+
+    def _sector_blocks(self, sector_number):
+        """ Returns the KW-Tweak block index of the first block of a sector. """
+        blocks_per_sector = self.sector_size // 16
+        assert 0 <= sector_number and (sector_number + 1) * blocks_per_sector <= 1 << 64
+        return sector_number * blocks_per_sector
+
+    def encrypt_sector(self, data, sector_number, tweak_iv=SECTOR_TWEAK_IV):
+        """
+        Encrypts one `sector_size`-byte sector for block-device or page
+        storage. Block j of sector s is whitened with block index
+        s * (sector_size // 16) + j, so every block of the device gets its own
+        tweak and any sector can be rewritten without touching its neighbours.
+        The ciphertext has the same length as `data`.
+        """
+        assert len(data) == self.sector_size
+        return self._batch_blocks(False, data, tweak_iv, self._sector_blocks(sector_number))
+
+    def decrypt_sector(self, data, sector_number, tweak_iv=SECTOR_TWEAK_IV):
+        """ Decrypts one sector encrypted by `encrypt_sector`. """
+        assert len(data) == self.sector_size
+        return self._batch_blocks(True, data, tweak_iv, self._sector_blocks(sector_number))
+
+    def _crypt_sectors(self, decrypt, data, sectors, tweak_iv, executor):
+        """
+        Runs many sectors as one batch. `sectors` is the first sector number of
+        a contiguous run, or a sequence with one sector number per sector.
+        """
+        size = self.sector_size
+        assert len(data) % size == 0
+        if not hasattr(sectors, '__len__'):
+            return self._batch_blocks(decrypt, data, tweak_iv, self._sector_blocks(sectors), executor)
+
+        assert len(sectors) * size == len(data)
+        starts = [self._sector_blocks(s) for s in sectors]
+        if executor is None:
+            indices = [i for start in starts for i in range(start, start + size // 16)]
+            method = self.decrypt_blocks if decrypt else self.encrypt_blocks
+            return method(data, indices, tweak_iv)
+        parts = executor.map(_pool_blocks, repeat(self._master_key), repeat(self.engine), repeat(decrypt),
+                             [bytes(data[i:i+size]) for i in range(0, len(data), size)], starts, repeat(tweak_iv))
+        return b''.join(parts)
+
+    def encrypt_sectors(self, data, sectors, tweak_iv=SECTOR_TWEAK_IV, executor=None):
+        """
+        Encrypts the `sector_size`-byte sectors of `data` in one batch, as
+        `encrypt_sector` would one by one. `sectors` is the number of the
+        first sector of a contiguous run, or one sector number per sector.
+        With an `executor` the work is spread over its workers.
+        """
+        return self._crypt_sectors(False, data, sectors, tweak_iv, executor)
+
+    def decrypt_sectors(self, data, sectors, tweak_iv=SECTOR_TWEAK_IV, executor=None):
+        """ Decrypts sectors encrypted by `encrypt_sector(s)`; see `encrypt_sectors`. """
+        return self._crypt_sectors(True, data, sectors, tweak_iv, executor)
+
+    def encryptor(self, mode, iv):
+        """
+        Returns a `ModeContext` encrypting one message incrementally in `mode`
+        (one of `AES.modes`) with the given initialization vector (iv).
+        """
+        return ModeContext(self, mode, iv, decrypt=False)
+
+    def decryptor(self, mode, iv):
+        """
+        Returns a `ModeContext` decrypting one message incrementally in `mode`
+        (one of `AES.modes`) with the given initialization vector (iv).
+        """
+        return ModeContext(self, mode, iv, decrypt=True)
 
     def encrypt_cbc(self, plaintext, iv):
         """
@@ -341,34 +1341,31 @@ class AES:
         assert len(iv) == 16
 
         plaintext = pad(plaintext)
+        # The KW-Tweak mask and the plaintext are XORed into the same block
+        # input, so the whole message is whitened up front.
+        whitened = xor_bytes(plaintext, self._kw_mask_generator(iv).tape(len(plaintext) // 16))
 
+        encrypt_int = self._encrypt_int
         blocks = []
-        previous = iv
-        for idx, plaintext_block in enumerate(split_blocks(plaintext)):
-            # CBC chaining then KW-Tweak whitening inside encrypt_block
-            x = xor_bytes(plaintext_block, previous)
-            block = self.encrypt_block(x, block_index=idx, tweak_iv=iv)
-            blocks.append(block)
-            previous = block
+        previous = int.from_bytes(iv, 'big')
+        for i in range(0, len(whitened), 16):
+            previous = encrypt_int(int.from_bytes(whitened[i:i+16], 'big') ^ previous)
+            blocks.append(previous.to_bytes(16, 'big'))
 
         return b''.join(blocks)
 
-    def decrypt_cbc(self, ciphertext, iv):
+    def decrypt_cbc(self, ciphertext, iv, executor=None):
         """
         Decrypts `ciphertext` using CBC mode and PKCS#7 padding, with the given
-        initialization vector (iv).
+        initialization vector (iv). The block decryptions are independent, so
+        they run as one batch, spread over `executor` when one is given.
         """
         assert len(iv) == 16
+        assert len(ciphertext) % 16 == 0
 
-        blocks = []
-        previous = iv
-        for idx, ciphertext_block in enumerate(split_blocks(ciphertext)):
-            # KW-Tweak removed inside decrypt_block, then CBC unchaining
-            x = self.decrypt_block(ciphertext_block, block_index=idx, tweak_iv=iv)
-            blocks.append(xor_bytes(previous, x))
-            previous = ciphertext_block
-
-        return unpad(b''.join(blocks))
+        raw = self._batch_blocks(True, ciphertext, iv, executor=executor)
+        # CBC unchaining is one XOR over the message.
+        return unpad(xor_bytes(raw, b''.join((iv, ciphertext[:-16]))))
 
     def encrypt_pcbc(self, plaintext, iv):
         """
@@ -378,35 +1375,40 @@ class AES:
         assert len(iv) == 16
 
         plaintext = pad(plaintext)
+        # P[i] ^ P[i-1] ^ mask[i] does not depend on the ciphertext, so only
+        # the C[i-1] term is left inside the loop.
+        pre = bytearray(plaintext)
+        xor_bytes(pre, bytes(16) + plaintext[:-16], out=pre)
+        xor_bytes(pre, self._kw_mask_generator(iv).tape(len(plaintext) // 16), out=pre)
 
+        encrypt_int = self._encrypt_int
         blocks = []
-        prev_ciphertext = iv
-        prev_plaintext = bytes(16)
-        for idx, plaintext_block in enumerate(split_blocks(plaintext)):
-            x = xor_bytes(plaintext_block, xor_bytes(prev_ciphertext, prev_plaintext))
-            ciphertext_block = self.encrypt_block(x, block_index=idx, tweak_iv=iv)
-            blocks.append(ciphertext_block)
-            prev_ciphertext = ciphertext_block
-            prev_plaintext = plaintext_block
+        previous = int.from_bytes(iv, 'big')
+        for i in range(0, len(pre), 16):
+            previous = encrypt_int(int.from_bytes(pre[i:i+16], 'big') ^ previous)
+            blocks.append(previous.to_bytes(16, 'big'))
 
         return b''.join(blocks)
 
-    def decrypt_pcbc(self, ciphertext, iv):
+    def decrypt_pcbc(self, ciphertext, iv, executor=None):
         """
         Decrypts `ciphertext` using PCBC mode and PKCS#7 padding, with the given
-        initialization vector (iv).
+        initialization vector (iv). The block decryptions run as one batch,
+        spread over `executor` when one is given.
         """
         assert len(iv) == 16
+        assert len(ciphertext) % 16 == 0
+
+        raw = self._batch_blocks(True, ciphertext, iv, executor=executor)
+        # Everything but the previous plaintext is known: strip it in bulk,
+        # leaving P[i] ^ P[i-1], then undo that with a running XOR.
+        raw = xor_bytes(raw, b''.join((iv, ciphertext[:-16])))
 
         blocks = []
-        prev_ciphertext = iv
-        prev_plaintext = bytes(16)
-        for idx, ciphertext_block in enumerate(split_blocks(ciphertext)):
-            x = self.decrypt_block(ciphertext_block, block_index=idx, tweak_iv=iv)
-            plaintext_block = xor_bytes(xor_bytes(prev_ciphertext, prev_plaintext), x)
-            blocks.append(plaintext_block)
-            prev_ciphertext = ciphertext_block
-            prev_plaintext = plaintext_block
+        previous = 0
+        for i in range(0, len(raw), 16):
+            previous ^= int.from_bytes(raw[i:i+16], 'big')
+            blocks.append(previous.to_bytes(16, 'big'))
 
         return unpad(b''.join(blocks))
 
@@ -415,32 +1417,48 @@ class AES:
         Encrypts `plaintext` with the given initialization vector (iv).
         """
         assert len(iv) == 16
+        n = (len(plaintext) + 15) // 16
+        tape = self._kw_mask_generator(iv).tape(n)
 
+        encrypt_int = self._encrypt_int
         blocks = []
-        prev_ciphertext = iv
-        for idx, plaintext_block in enumerate(split_blocks(plaintext, require_padding=False)):
+        previous = int.from_bytes(iv, 'big')
+        for i in range(0, 16 * (len(plaintext) // 16), 16):
             # Keystream generated via AES(prev) with KW-Tweak
-            keystream = self.encrypt_block(prev_ciphertext, block_index=idx, tweak_iv=iv)
-            ciphertext_block = xor_bytes(plaintext_block, keystream)
-            blocks.append(ciphertext_block)
-            prev_ciphertext = ciphertext_block
+            keystream = encrypt_int(previous ^ int.from_bytes(tape[i:i+16], 'big'))
+            previous = int.from_bytes(plaintext[i:i+16], 'big') ^ keystream
+            blocks.append(previous.to_bytes(16, 'big'))
+        if len(plaintext) % 16:
+            i = 16 * (n - 1)
+            keystream = encrypt_int(previous ^ int.from_bytes(tape[i:], 'big'))
+            blocks.append(xor_bytes(plaintext[i:], keystream.to_bytes(16, 'big')))
 
         return b''.join(blocks)
 
-    def decrypt_cfb(self, ciphertext, iv):
+    def decrypt_cfb(self, ciphertext, iv, executor=None):
         """
         Decrypts `ciphertext` with the given initialization vector (iv).
+        Every keystream input is a known ciphertext block, so the keystream
+        is one batch, spread over `executor` when one is given.
         """
         assert len(iv) == 16
+        n = (len(ciphertext) + 15) // 16
 
-        blocks = []
-        prev_ciphertext = iv
-        for idx, ciphertext_block in enumerate(split_blocks(ciphertext, require_padding=False)):
-            keystream = self.encrypt_block(prev_ciphertext, block_index=idx, tweak_iv=iv)
-            plaintext_block = xor_bytes(ciphertext_block, keystream)
-            blocks.append(plaintext_block)
-            prev_ciphertext = ciphertext_block
+        keystream = self._batch_blocks(False, b''.join((iv, ciphertext))[:16 * n], iv, executor=executor)
+        return xor_bytes(ciphertext, keystream)
 
+    def _ofb_keystream(self, iv, n):
+        """
+        Returns `n` blocks of KW-Tweak whitened OFB keystream.
+        """
+        tape = self._kw_mask_generator(iv).tape(n)
+
+        encrypt_int = self._encrypt_int
+        blocks = []
+        previous = int.from_bytes(iv, 'big')
+        for i in range(0, 16 * n, 16):
+            previous = encrypt_int(previous ^ int.from_bytes(tape[i:i+16], 'big'))
+            blocks.append(previous.to_bytes(16, 'big'))
         return b''.join(blocks)
 
     def encrypt_ofb(self, plaintext, iv):
@@ -448,64 +1466,162 @@ class AES:
         Encrypts `plaintext` using OFB mode initialization vector (iv).
         """
         assert len(iv) == 16
-
-        blocks = []
-        previous = iv
-        for idx, plaintext_block in enumerate(split_blocks(plaintext, require_padding=False)):
-            keystream = self.encrypt_block(previous, block_index=idx, tweak_iv=iv)
-            ciphertext_block = xor_bytes(plaintext_block, keystream)
-            blocks.append(ciphertext_block)
-            previous = keystream
-
-        return b''.join(blocks)
+        n = (len(plaintext) + 15) // 16
+        return xor_bytes(plaintext, self._reserved_keystream('ofb', iv, n) or self._ofb_keystream(iv, n))
 
     def decrypt_ofb(self, ciphertext, iv):
         """
         Decrypts `ciphertext` using OFB mode initialization vector (iv).
         """
         assert len(iv) == 16
+        n = (len(ciphertext) + 15) // 16
+        return xor_bytes(ciphertext, self._reserved_keystream('ofb', iv, n) or self._ofb_keystream(iv, n))
 
-        blocks = []
-        previous = iv
-        for idx, ciphertext_block in enumerate(split_blocks(ciphertext, require_padding=False)):
-            keystream = self.encrypt_block(previous, block_index=idx, tweak_iv=iv)
-            plaintext_block = xor_bytes(ciphertext_block, keystream)
-            blocks.append(plaintext_block)
-            previous = keystream
-
-        return b''.join(blocks)
+    def _reserved_keystream(self, mode, iv, n):
+        """
+        Returns `n` or more blocks of `mode` keystream for `iv` taken from
+        the attached reservoir, or None if none was reserved.
+        """
+        if self.reservoir is None:
+            return None
+        return self.reservoir.take(iv, n, mode)
 
-    def encrypt_ctr(self, plaintext, iv):
+    def _ctr_keystream(self, iv, n, start=0, executor=None):
         """
-        Encrypts `plaintext` using CTR mode with the given nounce/IV.
+        Returns `n` blocks of KW-Tweak whitened CTR keystream from block
+        `start` on. Block i encrypts counter (iv + i) mod 2^128 under tweak
+        index i, so any block can be computed on its own; with an `executor`
+        the blocks are generated in chunks of `pool_chunk_blocks` by its workers.
+        """
+        if executor is not None and n > self.pool_chunk_blocks:
+            step = self.pool_chunk_blocks
+            firsts = range(start, start + n, step)
+            parts = executor.map(_pool_ctr_keystream, repeat(self._master_key), repeat(self.engine), repeat(iv),
+                                 [min(step, start + n - i) for i in firsts], firsts)
+            return b''.join(parts)
+
+        nonce = int.from_bytes(iv, 'big')
+        counters = b''.join(((nonce + i) & 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF).to_bytes(16, 'big')
+                            for i in range(start, start + n))
+        return self.encrypt_blocks(counters, range(start, start + n), iv)
+
+    def ctr_crypt(self, data, iv, offset=0, executor=None, out=None):
+        """
+        Encrypts or decrypts `data` in CTR mode as the bytes at `offset` of a
+        message under the nonce/IV `iv`. Only the keystream blocks covering
+        [offset, offset + len(data)) are computed, so a range of a large
+        payload can be processed without the blocks before it. The result is
+        returned, or written into the writable buffer `out` (may be `data`).
         """
         assert len(iv) == 16
+        assert offset >= 0
+        first, skip = divmod(offset, 16)
+        n = (skip + len(data) + 15) // 16
+        keystream = self._reserved_keystream('ctr', iv, n) if offset == 0 else None
+        if keystream is None:
+            keystream = self._ctr_keystream(iv, n, first, executor)
+        return xor_bytes(data, memoryview(keystream)[skip:], out)
+
+    def encrypt_ctr(self, plaintext, iv, executor=None):
+        """
+        Encrypts `plaintext` using CTR mode with the given nounce/IV.
+        """
+        return self.ctr_crypt(plaintext, iv, executor=executor)
 
-        blocks = []
-        nonce = iv
-        for idx, plaintext_block in enumerate(split_blocks(plaintext, require_padding=False)):
-            keystream = self.encrypt_block(nonce, block_index=idx, tweak_iv=iv)
-            block = xor_bytes(plaintext_block, keystream)
-            blocks.append(block)
-            nonce = inc_bytes(nonce)
+    def decrypt_ctr(self, ciphertext, iv, executor=None):
+        """
+        Decrypts `ciphertext` using CTR mode with the given nounce/IV.
+        """
+        return self.ctr_crypt(ciphertext, iv, executor=executor)
 
-        return b''.join(blocks)
+    def _crypt_into(self, mode, decrypt, src, dst, iv):
+        """
+        Encrypts or decrypts `src` into the writable buffer `dst` (e.g. a
+        `bytearray` or `mmap`) in chunks of `pool_chunk_blocks` blocks, and
+        returns the number of bytes written. Both are read and written through
+        `memoryview`, and `dst` may be `src` itself (in place). Only the final
+        block is copied for PKCS#7 padding, so for CBC/PCBC encryption `dst`
+        must have room for it.
+        """
+        src = memoryview(src).cast('B')
+        dst = memoryview(dst).cast('B')
+        context = ModeContext(self, mode, iv, decrypt)
+        padded = mode in ('cbc', 'pcbc')
+        if padded and decrypt:
+            assert len(src) >= 16 and len(src) % 16 == 0
+            body = len(src) - 16
+        else:
+            body = len(src) - len(src) % 16
+        assert len(dst) >= (body + 16 if padded and not decrypt else len(src))
+
+        step = 16 * self.pool_chunk_blocks
+        for i in range(0, body, step):
+            j = min(i + step, body)
+            context._process(src[i:j], dst[i:j])
+
+        tail = src[body:].tobytes()
+        if padded and decrypt:
+            plaintext = unpad(context._process(tail))
+            dst[body:body + len(plaintext)] = plaintext
+            return body + len(plaintext)
+        if padded:
+            context._process(pad(tail), dst[body:body + 16])
+            return body + 16
+        if tail:
+            dst[body:len(src)] = context._process(tail + bytes(16 - len(tail)))[:len(tail)]
+        return len(src)
+
+    def encrypt_cbc_into(self, src, dst, iv):
+        """
+        Encrypts `src` using CBC mode and PKCS#7 padding into `dst`, which
+        needs room for the padded length. Returns the bytes written.
+        """
+        return self._crypt_into('cbc', False, src, dst, iv)
 
-    def decrypt_ctr(self, ciphertext, iv):
+    def decrypt_cbc_into(self, src, dst, iv):
         """
-        Decrypts `ciphertext` using CTR mode with the given nounce/IV.
+        Decrypts `src` using CBC mode and PKCS#7 padding into `dst`. Returns
+        the length of the unpadded plaintext.
         """
-        assert len(iv) == 16
+        return self._crypt_into('cbc', True, src, dst, iv)
 
-        blocks = []
-        nonce = iv
-        for idx, ciphertext_block in enumerate(split_blocks(ciphertext, require_padding=False)):
-            keystream = self.encrypt_block(nonce, block_index=idx, tweak_iv=iv)
-            block = xor_bytes(ciphertext_block, keystream)
-            blocks.append(block)
-            nonce = inc_bytes(nonce)
+    def encrypt_pcbc_into(self, src, dst, iv):
+        """
+        Encrypts `src` using PCBC mode and PKCS#7 padding into `dst`, which
+        needs room for the padded length. Returns the bytes written.
+        """
+        return self._crypt_into('pcbc', False, src, dst, iv)
 
-        return b''.join(blocks)
+    def decrypt_pcbc_into(self, src, dst, iv):
+        """
+        Decrypts `src` using PCBC mode and PKCS#7 padding into `dst`. Returns
+        the length of the unpadded plaintext.
+        """
+        return self._crypt_into('pcbc', True, src, dst, iv)
+
+    def encrypt_cfb_into(self, src, dst, iv):
+        """ Encrypts `src` using CFB mode into `dst` (which may be `src`). """
+        return self._crypt_into('cfb', False, src, dst, iv)
+
+    def decrypt_cfb_into(self, src, dst, iv):
+        """ Decrypts `src` using CFB mode into `dst` (which may be `src`). """
+        return self._crypt_into('cfb', True, src, dst, iv)
+
+    def encrypt_ofb_into(self, src, dst, iv):
+        """ Encrypts `src` using OFB mode into `dst` (which may be `src`). """
+        return self._crypt_into('ofb', False, src, dst, iv)
+
+    def decrypt_ofb_into(self, src, dst, iv):
+        """ Decrypts `src` using OFB mode into `dst` (which may be `src`). """
+        return self._crypt_into('ofb', True, src, dst, iv)
+
+    def encrypt_ctr_into(self, src, dst, iv):
+        """ Encrypts `src` using CTR mode into `dst` (which may be `src`). """
+        return self._crypt_into('ctr', False, src, dst, iv)
+
+    def decrypt_ctr_into(self, src, dst, iv):
+        """ Decrypts `src` using CTR mode into `dst` (which may be `src`). """
+        return self._crypt_into('ctr', True, src, dst, iv)
 
     def trace_encrypt_rounds(self, plaintext):
         """
@@ -516,26 +1632,288 @@ class AES:
         s = bytes2matrix(plaintext)
         rounds = []
 
-        add_round_key(s, self._key_matrices[0])
+        add_round_key(s, self._round_key_matrix(0))
 
         for i in range(1, self.n_rounds):
             sub_bytes(s)
             # shift_rows(s)
             self._shift_rows_kdrp(s)
             mix_columns(s)
-            add_round_key(s, self._key_matrices[i])
+            add_round_key(s, self._round_key_matrix(i))
             rounds.append(matrix2bytes([row[:] for row in s]))
 
         sub_bytes(s)
         # shift_rows(s)
         self._shift_rows_kdrp(s)
-        add_round_key(s, self._key_matrices[-1])
+        add_round_key(s, self._round_key_matrix(-1))
         rounds.append(matrix2bytes([row[:] for row in s]))
 
         return rounds
 
 
+class ModeContext:
+    """
+    Incremental encryption or decryption of one message, as returned by
+    `AES.encryptor` and `AES.decryptor`. The chaining value, the next
+    KW-Tweak block index and any partial block are kept between `update`
+    calls, so memory use does not grow with the message. The concatenated
+    output of `update` and `finalize` equals the one-shot mode method's.
+    """
+    def __init__(self, aes, mode, iv, decrypt):
+        assert mode in AES.modes
+        assert len(iv) == 16
+        self.mode = mode
+        self.decrypt = decrypt
+        self._aes = aes
+        self._iv = bytes(iv)
+        self._masks = aes._kw_mask_generator(self._iv)
+        self._index = 0
+        self._buffer = b''
+        # Previous ciphertext block (CBC, PCBC, CFB) or keystream block (OFB).
+        self._previous = int.from_bytes(iv, 'big')
+        # Previous plaintext block (PCBC).
+        self._previous_plain = 0
+
+    def update(self, data):
+        """ Processes `data`, returning the output of every completed block. """
+        assert self._buffer is not None, 'Context already finalized.'
+        buffer = self._buffer + bytes(data)
+        keep = len(buffer) % 16
+        # Decrypting a padded mode holds back the last block for unpadding.
+        if keep == 0 and buffer and self.decrypt and self.mode in ('cbc', 'pcbc'):
+            keep = 16
+        ready = len(buffer) - keep
+        self._buffer = buffer[ready:]
+        return self._process(buffer[:ready]) if ready else b''
+
+    def finalize(self):
+        """
+        Processes the buffered tail: PKCS#7 padding is added (or checked and
+        removed) for CBC and PCBC, and a partial final block is processed for
+        the stream modes.
+        """
+        assert self._buffer is not None, 'Context already finalized.'
+        buffer, self._buffer = self._buffer, None
+        if self.mode in ('cbc', 'pcbc'):
+            if self.decrypt:
+                assert len(buffer) == 16
+                return unpad(self._process(buffer))
+            return self._process(pad(buffer))
+        if not buffer:
+            return b''
+        # Every stream mode XORs a whole keystream block into the data, so a
+        # zero-filled tail block truncated afterwards gives the partial block.
+        return self._process(buffer + bytes(16 - len(buffer)))[:len(buffer)]
+
+    def _process(self, data, out=None):
+        """
+        Encrypts or decrypts whole blocks, advancing the chaining state. The
+        result is returned, or written into the writable buffer `out`, which
+        may be `data` itself.
+        """
+        aes, iv, mode = self._aes, self._iv, self.mode
+        n, start = len(data) // 16, self._index
+        self._index += n
+
+        if mode == 'ctr':
+            return xor_bytes(data, aes._ctr_keystream(iv, n, start), out)
+
+        if self.decrypt and mode != 'ofb':
+            # Every block-cipher input is known: one batch, then bulk XORs.
+            previous = self._previous.to_bytes(16, 'big') + data[:-16]
+            self._previous = int.from_bytes(data[-16:], 'big')
+            if mode == 'cfb':
+                return xor_bytes(data, aes.encrypt_blocks(previous, range(start, start + n), iv), out)
+            raw = aes.decrypt_blocks(data, range(start, start + n), iv)
+            if mode == 'cbc':
+                return xor_bytes(raw, previous, out)
+            raw = xor_bytes(raw, previous)
+            blocks = []
+            plain = self._previous_plain
+            for i in range(0, len(raw), 16):
+                plain ^= int.from_bytes(raw[i:i+16], 'big')
+                blocks.append(plain.to_bytes(16, 'big'))
+            self._previous_plain = plain
+        else:
+            tape = self._masks.tape(n, start)
+            encrypt_int = aes._encrypt_int
+            previous, plain = self._previous, self._previous_plain
+            blocks = []
+            for i in range(0, len(data), 16):
+                block = int.from_bytes(data[i:i+16], 'big')
+                mask = int.from_bytes(tape[i:i+16], 'big')
+                if mode == 'cbc':
+                    previous = out_block = encrypt_int(block ^ previous ^ mask)
+                elif mode == 'pcbc':
+                    previous = out_block = encrypt_int(block ^ plain ^ previous ^ mask)
+                    plain = block
+                elif mode == 'cfb':
+                    previous = out_block = block ^ encrypt_int(previous ^ mask)
+                else:
+                    previous = encrypt_int(previous ^ mask)
+                    out_block = block ^ previous
+                blocks.append(out_block.to_bytes(16, 'big'))
+            self._previous, self._previous_plain = previous, plain
+
+        if out is None:
+            return b''.join(blocks)
+        out[:len(data)] = b''.join(blocks)
+        return out
+
+
+class KeystreamReservoir:
+    """
+    Precomputes CTR and OFB keystreams on a background thread. Under
+    KW-Tweak a keystream depends only on the key and IV, so once an IV has
+    been reserved the matching `encrypt_ctr`/`encrypt_ofb` (or decrypt) call
+    of the attached `AES` is reduced to the final XOR:
+
+        aes.reservoir = KeystreamReservoir(aes)
+        aes.reservoir.reserve(iv, len(expected_message), 'ctr')
+        ...
+        ciphertext = aes.encrypt_ctr(message, iv)
+
+    Each reserved keystream is handed out once. At most `max_ready`
+    computed keystreams are kept waiting to be taken; past that the oldest
+    is dropped, and its call computes the keystream inline.
+    """
+    modes = ('ctr', 'ofb')
+
+    def __init__(self, aes, max_ready=64):
+        assert max_ready > 0
+        self._aes = aes
+        self.max_ready = max_ready
+        self._lock = threading.Lock()
+        # (mode, iv) -> blocks still to compute, in flight, or done.
+        self._queued = {}
+        self._running = {}
+        self._ready = OrderedDict()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._fill, daemon=True)
+        self._thread.start()
+
+    def reserve(self, iv, length, mode='ctr'):
+        """
+        Schedules the keystream covering the first `length` bytes of a
+        `mode` message under `iv`.
+        """
+        assert mode in KeystreamReservoir.modes
+        assert len(iv) == 16
+        key = (mode, bytes(iv))
+        with self._lock:
+            self._queued[key] = (length + 15) // 16
+        self._queue.put(key)
+
+    def take(self, iv, n, mode):
+        """
+        Removes and returns the reserved keystream for `iv` if it covers `n`
+        blocks, waiting for it if it is being computed. Returns None if it was
+        not reserved, too short, or not started yet (the caller computing it
+        inline is then no slower than waiting).
+        """
+        key = (mode, bytes(iv))
+        with self._lock:
+            self._queued.pop(key, None)
+            done = self._running.get(key)
+        if done is not None:
+            done.wait()
+        with self._lock:
+            keystream = self._ready.pop(key, None)
+        if keystream is None or len(keystream) < 16 * n:
+            return None
+        return keystream
+
+    def close(self):
+        """ Stops the background thread and drops unused keystreams. """
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._queued.clear()
+            self._ready.clear()
+
+    def _fill(self):
+        while True:
+            key = self._queue.get()
+            if key is None:
+                return
+            with self._lock:
+                n = self._queued.pop(key, None)
+                if n is None:
+                    continue
+                done = self._running[key] = threading.Event()
+            mode, iv = key
+            try:
+                if mode == 'ctr':
+                    keystream = self._aes._ctr_keystream(iv, n)
+                else:
+                    keystream = self._aes._ofb_keystream(iv, n)
+            except Exception:
+                # Left to the caller, whose inline computation raises it again.
+                keystream = None
+            with self._lock:
+                del self._running[key]
+                if keystream is not None:
+                    self._ready[key] = keystream
+                    while len(self._ready) > self.max_ready:
+                        self._ready.popitem(last=False)
+            done.set()
+
+
+# Executor workers rebuild the cipher from the key once per process, keeping
+# only the most recently used few (each holds round keys and GHASH tables).
+POOL_CIPHER_CACHE_SIZE = 8
+_pool_ciphers = OrderedDict()
+_pool_ciphers_lock = threading.Lock()
+
+def _pool_cipher(master_key, engine):
+    """ Returns this process's cached `AES` instance for `master_key`. """
+    key = (bytes(master_key), engine)
+    with _pool_ciphers_lock:
+        aes = _pool_ciphers.get(key)
+        if aes is not None:
+            _pool_ciphers.move_to_end(key)
+            return aes
+    aes = AES(key[0], engine)
+    with _pool_ciphers_lock:
+        _pool_ciphers[key] = aes
+        while len(_pool_ciphers) > POOL_CIPHER_CACHE_SIZE:
+            _pool_ciphers.popitem(last=False)
+    return aes
+
+def clear_pool_ciphers():
+    """ Drops the ciphers cached for executor workers in this process. """
+    with _pool_ciphers_lock:
+        _pool_ciphers.clear()
+
+def _pool_blocks(master_key, engine, decrypt, data, start, tweak_iv):
+    """
+    Executor task for `AES._batch_blocks`: one chunk of tweaked blocks
+    starting at block index `start`.
+    """
+    aes = _pool_cipher(master_key, engine)
+    method = aes.decrypt_blocks if decrypt else aes.encrypt_blocks
+    return method(data, range(start, start + len(data) // 16), tweak_iv)
+
+def _pool_ctr_keystream(master_key, engine, iv, n, start):
+    """ Executor task for `AES._ctr_keystream`: `n` blocks from `start`. """
+    return _pool_cipher(master_key, engine)._ctr_keystream(iv, n, start)
+
+def _pool_aead(master_key, decrypt, data, iv, associated_data):
+    """ Executor task for `SegmentedCipher`: one segment through the AEAD mode. """
+    aes = _pool_cipher(master_key, 'ttable')
+    method = aes.decrypt_aead if decrypt else aes.encrypt_aead
+    return method(data, iv, associated_data)
+
+import asyncio
+import atexit
+import lzma
+import mmap
 import os
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
 from hashlib import pbkdf2_hmac
 from hmac import new as new_hmac, compare_digest
 
@@ -545,6 +1923,88 @@ IV_SIZE = 16
 
 SALT_SIZE = 16
 HMAC_SIZE = 32
+TAG_SIZE = 16
+
+# Versioned header: MAGIC(4) || version(1) || mode(1) || flags(1) || reserved(1).
+# Blobs without it are the original HMAC(32) || salt(16) || CBC format.
+FORMAT_MAGIC = b'\x8fKWT'
+FORMAT_VERSION = 1
+HEADER_SIZE = 8
+FORMAT_MODES = {'cbc': 1, 'aead': 2, 'segmented': 3, 'envelope': 4}
+
+def pack_header(mode, flags=0):
+    """ Returns the versioned header of a blob encrypted in `mode`. """
+    return FORMAT_MAGIC + bytes([FORMAT_VERSION, FORMAT_MODES[mode], flags, 0])
+
+def parse_header(data):
+    """
+    Returns (mode, flags) from the header of `data`, or None if `data` does
+    not start with a known versioned header.
+    """
+    if len(data) < HEADER_SIZE or data[:4] != FORMAT_MAGIC or data[4] != FORMAT_VERSION:
+        return None
+    for mode, tag in FORMAT_MODES.items():
+        if data[5] == tag:
+            return mode, data[6]
+    return None
+
+# Header flags of a payload compressed before encryption, by method.
+COMPRESSION_FLAGS = {'zlib': 0x04, 'lzma': 0x08}
+COMPRESSION_MASK = 0x04 | 0x08
+# Inputs shorter than this, or whose sample shrinks by less than the ratio, are stored as is.
+COMPRESS_MIN_SIZE = 256
+COMPRESS_MAX_RATIO = 0.9
+
+def _compressor(method):
+    return zlib.compressobj(6) if method == 'zlib' else lzma.LZMACompressor()
+
+def _decompressor(flags):
+    return zlib.decompressobj() if flags & COMPRESSION_FLAGS['zlib'] else lzma.LZMADecompressor()
+
+def should_compress(data, sample_size=4096, samples=4):
+    """
+    Guesses whether `data` is worth compressing by deflating (at the fastest
+    level) up to `samples` slices of `sample_size` bytes spread across it.
+    """
+    if len(data) < COMPRESS_MIN_SIZE:
+        return False
+    view = memoryview(data)
+    step = max(sample_size, len(data) // samples)
+    sample = b''.join(view[i:i + sample_size] for i in range(0, len(data), step)[:samples])
+    return len(zlib.compress(sample, 1)) < len(sample) * COMPRESS_MAX_RATIO
+
+def compress_payload(data, method):
+    """
+    Returns (payload, flags): `data` compressed with `method` ('zlib' or
+    'lzma') and its header flag, or `data` and 0 when `method` is None or
+    `should_compress` rejects it.
+    """
+    if method is None or not should_compress(data):
+        return data, 0
+    compressor = _compressor(method)
+    return compressor.compress(data) + compressor.flush(), COMPRESSION_FLAGS[method]
+
+def decompress_chunks(pieces, flags, limit=64 * 1024):
+    """
+    Yields the decompressed data of the iterable `pieces` (as compressed
+    under header `flags`) in chunks of at most `limit` bytes.
+    """
+    decompressor = _decompressor(flags)
+    for data in pieces:
+        while True:
+            out = decompressor.decompress(data, limit)
+            if out:
+                yield out
+            data = getattr(decompressor, 'unconsumed_tail', b'')
+            if not data and (len(out) < limit or decompressor.eof):
+                break
+    assert decompressor.eof, 'Compressed payload truncated.'
+
+def decompress_payload(data, flags):
+    """ Reverses `compress_payload` given the header `flags`. """
+    if not flags & COMPRESSION_MASK:
+        return data
+    return b''.join(decompress_chunks([data], flags))
 
 def get_key_iv(password, salt, workload=100000):
     """
@@ -558,35 +2018,247 @@ def get_key_iv(password, salt, workload=100000):
     return aes_key, hmac_key, iv
 
 
-def encrypt(key, plaintext, workload=100000):
+class _KeyCacheEntry:
+    """ One `KeyCache` slot, released once it is evicted and no longer leased. """
+    __slots__ = ('keys', 'aes', 'expires', 'leases', 'evicted')
+
+    def __init__(self, keys, expires):
+        self.keys = keys
+        self.aes = AES(keys[0])
+        self.expires = expires
+        self.leases = 0
+        self.evicted = False
+
+    def release(self):
+        """ Overwrites the cipher's round keys and drops the references to the keys. """
+        self.aes.wipe()
+        self.keys = self.aes = None
+
+
+class KeyCache:
+    """
+    Opt-in cache for `decrypt`: maps a fingerprint of (password, salt,
+    workload) to the `get_key_iv` keys and a ready `AES` instance, so hot
+    blobs skip PBKDF2 and the key schedule. Holds at most `max_size`
+    entries for `ttl` seconds each (None: no expiry); expired entries are
+    purged on every lookup. Once an evicted entry is no longer leased, its
+    `AES` round keys are overwritten (`AES.wipe`) and the entry dropped.
+    The derived keys themselves are immutable bytes: they are released,
+    not overwritten. `hits` and `misses` count lookups. Session blobs
+    bypass the cache; reuse a `Keyring` for those instead.
     """
-    Encrypts `plaintext` with `key` using AES-128, an HMAC to verify integrity,
-    and PBKDF2 to stretch the given key.
+    def __init__(self, max_size=128, ttl=300.0, clock=time.monotonic):
+        assert max_size > 0
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        # Fingerprints are keyed per cache so passwords are never stored, even hashed.
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fingerprint(self, password, salt, workload):
+        message = struct.pack('>QQ', len(password), workload) + password + bytes(salt)
+        return new_hmac(self._secret, message, 'sha256').digest()
+
+    @contextmanager
+    def lease(self, password, salt, workload):
+        """
+        Yields ((aes_key, hmac_key, iv), aes) for the given inputs, deriving
+        and caching them on a miss. The entry is not released before the
+        `with` block exits, even if it is evicted meanwhile.
+        """
+        entry = self._acquire(password, salt, workload)
+        try:
+            yield entry.keys, entry.aes
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                if entry.evicted and not entry.leases:
+                    entry.release()
+
+    def _acquire(self, password, salt, workload):
+        fingerprint = self.fingerprint(password, salt, workload)
+        with self._lock:
+            self._purge_expired()
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                self._entries.move_to_end(fingerprint)
+                self.hits += 1
+                entry.leases += 1
+                return entry
+            self.misses += 1
+
+        expires = None if self.ttl is None else self.clock() + self.ttl
+        entry = _KeyCacheEntry(get_key_iv(password, salt, workload), expires)
+        entry.leases = 1
+        with self._lock:
+            if fingerprint in self._entries:
+                self._evict(fingerprint)
+            self._entries[fingerprint] = entry
+            while len(self._entries) > self.max_size:
+                self._evict(next(iter(self._entries)))
+        return entry
+
+    def _purge_expired(self):
+        """ Evicts every entry past its TTL (with the lock held). """
+        if self.ttl is None:
+            return
+        now = self.clock()
+        for fingerprint in [f for f, entry in self._entries.items() if now >= entry.expires]:
+            self._evict(fingerprint)
+
+    def _evict(self, fingerprint):
+        """ Drops an entry (with the lock held), releasing it now if it is not leased. """
+        entry = self._entries.pop(fingerprint)
+        entry.evicted = True
+        if not entry.leases:
+            entry.release()
+
+    def purge(self):
+        """ Evicts the entries past their TTL without waiting for the next lookup. """
+        with self._lock:
+            self._purge_expired()
+
+    def clear(self):
+        """ Drops every entry, releasing those not currently leased. """
+        with self._lock:
+            while self._entries:
+                self._evict(next(iter(self._entries)))
+
+
+def encrypt(key, plaintext, workload=100000, mode='cbc', compress=None):
+    """
+    Encrypts `plaintext` with `key` using AES-128 and PBKDF2 to stretch the
+    given key. `mode` is 'cbc' (CBC with an HMAC-SHA256 to verify integrity),
+    'aead' (the single-pass CTR+GHASH `AES.encrypt_aead`), 'segmented'
+    (independently authenticated segments, see `SegmentedCipher`) or
+    'envelope' (a random data key wrapped by the password, see `rekey`).
+    The result starts with a versioned header naming the mode. `compress`
+    ('zlib' or 'lzma') compresses the plaintext first when `should_compress`
+    expects it to pay off, which is then flagged in the header.
 
     The exact algorithm is specified in the module docstring.
     """
+    assert mode in FORMAT_MODES
+    assert compress is None or compress in COMPRESSION_FLAGS
     if isinstance(key, str):
         key = key.encode('utf-8')
     if isinstance(plaintext, str):
         plaintext = plaintext.encode('utf-8')
+    plaintext, flags = compress_payload(plaintext, compress)
 
+    if mode == 'segmented':
+        return SegmentedCipher(key, os.urandom(SALT_SIZE), workload, flags=flags).encrypt(plaintext)
+    if mode == 'envelope':
+        data_key = os.urandom(ENVELOPE_KEY_SIZE)
+        aes, iv = _envelope_cipher(data_key)
+        header = _wrap_header(key, data_key, workload, flags)
+        return header + aes.encrypt_aead(plaintext, iv, header[:HEADER_SIZE])
+
+    header = pack_header(mode, flags)
     salt = os.urandom(SALT_SIZE)
-    key, hmac_key, iv = get_key_iv(key, salt, workload)
-    ciphertext = AES(key).encrypt_cbc(plaintext, iv)
-    hmac = new_hmac(hmac_key, salt + ciphertext, 'sha256').digest()
+    keys = get_key_iv(key, salt, workload)
+    return _seal(header, salt, plaintext, mode, keys, AES(keys[0]))
+
+
+def _seal(header, salt, plaintext, mode, keys, aes):
+    """
+    Encrypts `plaintext` in 'cbc' or 'aead' mode with the derived `keys` and
+    their `aes` cipher. `header` is everything before the salt and is
+    authenticated along with it.
+    """
+    key, hmac_key, iv = keys
+    if mode == 'aead':
+        return header + salt + aes.encrypt_aead(plaintext, iv, header + salt)
+
+    ciphertext = aes.encrypt_cbc(plaintext, iv)
+    hmac = new_hmac(hmac_key, header + salt + ciphertext, 'sha256').digest()
     assert len(hmac) == HMAC_SIZE
 
-    return hmac + salt + ciphertext
+    return header + hmac + salt + ciphertext
 
 
-def decrypt(key, ciphertext, workload=100000):
+def _unseal(header, body, mode, derive):
     """
-    Decrypts `ciphertext` with `key` using AES-128, an HMAC to verify integrity,
-    and PBKDF2 to stretch the given key.
+    Verifies and decrypts the 'cbc' or 'aead' `body` that follows `header`.
+    `derive(salt)` returns the keys and `AES` cipher of the message salt.
+    """
+    if mode == 'aead':
+        assert len(body) >= SALT_SIZE + TAG_SIZE, 'Ciphertext too short.'
+        salt, body = body[:SALT_SIZE], body[SALT_SIZE:]
+        (key, hmac_key, iv), aes = derive(salt)
+        return aes.decrypt_aead(body, iv, header + salt)
+
+    assert len(body) % 16 == 0, "Ciphertext must be made of full 16-byte blocks."
+    assert len(body) >= HMAC_SIZE + SALT_SIZE + 16, 'Ciphertext too short.'
+    hmac, body = body[:HMAC_SIZE], body[HMAC_SIZE:]
+    salt, body = body[:SALT_SIZE], body[SALT_SIZE:]
+    (key, hmac_key, iv), aes = derive(salt)
+
+    expected_hmac = new_hmac(hmac_key, header + salt + body, 'sha256').digest()
+    assert compare_digest(hmac, expected_hmac), 'Ciphertext corrupted or tampered.'
+
+    return aes.decrypt_cbc(body, iv)
+
+
+def decrypt(key, ciphertext, workload=100000, executor=None, cache=None):
+    """
+    Decrypts `ciphertext` with `key` using AES-128, verifying its integrity,
+    and PBKDF2 to stretch the given key. Both the versioned format written by
+    `encrypt` and the original headerless format are accepted. Segments of a
+    segmented container are verified over `executor` when one is given. A
+    `KeyCache` reuses the derived keys of salts already seen (except for
+    `Keyring` session blobs).
 
     The exact algorithm is specified in the module docstring.
     """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
 
+    header = parse_header(ciphertext)
+    with ExitStack() as leases:
+        if cache is None:
+            def derive(salt):
+                keys = get_key_iv(key, salt, workload)
+                return keys, AES(keys[0])
+        else:
+            def derive(salt):
+                return leases.enter_context(cache.lease(key, salt, workload))
+
+        if header is not None:
+            plaintext = _decrypt_versioned(key, ciphertext, workload, header, executor, derive)
+            return decompress_payload(plaintext, header[1])
+        # Only blobs without the magic and version are taken for the headerless format.
+        assert ciphertext[:5] != FORMAT_MAGIC + bytes([FORMAT_VERSION]), 'Unknown format mode.'
+        return _decrypt_legacy(ciphertext, derive)
+
+
+def _decrypt_versioned(key, ciphertext, workload, header, executor, derive):
+    mode, flags = header
+    if mode == 'segmented':
+        salt, segment_size = SegmentedCipher.parse(ciphertext)
+        keys, aes = derive(salt)
+        cipher = SegmentedCipher(key, salt, workload, segment_size, keys, flags, aes)
+        return cipher.decrypt(ciphertext, executor)
+    if mode == 'envelope':
+        data_key = _unwrap_header(ciphertext, derive)
+        aes, iv = _envelope_cipher(data_key)
+        body = ciphertext[ENVELOPE_HEADER_SIZE:]
+        assert len(body) >= TAG_SIZE, 'Ciphertext too short.'
+        return aes.decrypt_aead(body, iv, ciphertext[:HEADER_SIZE])
+    if flags & FLAG_SESSION:
+        session_salt = ciphertext[HEADER_SIZE:HEADER_SIZE + SALT_SIZE]
+        return Keyring(key, session_salt, workload).decrypt(ciphertext)
+    return _unseal(ciphertext[:HEADER_SIZE], ciphertext[HEADER_SIZE:], mode, derive)
+
+
+def _decrypt_legacy(ciphertext, derive):
     assert len(ciphertext) % 16 == 0, "Ciphertext must be made of full 16-byte blocks."
 
     assert len(ciphertext) >= 32, """
@@ -594,17 +2266,734 @@ def decrypt(key, ciphertext, workload=100000):
     encrypt or decrypt single blocks use `AES(key).decrypt_block(ciphertext)`.
     """
 
-    if isinstance(key, str):
-        key = key.encode('utf-8')
-
     hmac, ciphertext = ciphertext[:HMAC_SIZE], ciphertext[HMAC_SIZE:]
     salt, ciphertext = ciphertext[:SALT_SIZE], ciphertext[SALT_SIZE:]
-    key, hmac_key, iv = get_key_iv(key, salt, workload)
+    (key, hmac_key, iv), aes = derive(salt)
 
     expected_hmac = new_hmac(hmac_key, salt + ciphertext, 'sha256').digest()
     assert compare_digest(hmac, expected_hmac), 'Ciphertext corrupted or tampered.'
 
-    return AES(key).decrypt_cbc(ciphertext, iv)
+    return aes.decrypt_cbc(ciphertext, iv)
+
+
+# Header flag: keys come from a `Keyring` session instead of per-message PBKDF2.
+FLAG_SESSION = 0x02
+
+def hkdf(ikm, salt, info, length):
+    """ HKDF-SHA256 (RFC 5869): extracts a key from `ikm` and expands it to `length` bytes. """
+    prk = new_hmac(salt, ikm, 'sha256').digest()
+    blocks = []
+    block = b''
+    for i in range(1, -(-length // 32) + 1):
+        block = new_hmac(prk, block + info + bytes([i]), 'sha256').digest()
+        blocks.append(block)
+    return b''.join(blocks)[:length]
+
+
+class Keyring:
+    """
+    Session for encrypting many messages under one password. PBKDF2 runs
+    once per (password, session salt); each message still gets a fresh
+    salt, from which HKDF-SHA256 expands its own AES key, HMAC key and IV.
+    Blobs are the 'cbc' or 'aead' format of `encrypt` with FLAG_SESSION set
+    and the session salt after the header, so `decrypt` opens them on its
+    own too (with one PBKDF2 per call). The expanded `AES` instances are
+    kept in an LRU cache of `cache_size` messages, and the PBKDF2 outputs of
+    other sessions in one of `session_cache_size`. Safe to share between
+    threads.
+    """
+    def __init__(self, password, session_salt=None, workload=100000, cache_size=256, session_cache_size=16):
+        if isinstance(password, str):
+            password = password.encode('utf-8')
+        self.session_salt = bytes(session_salt or os.urandom(SALT_SIZE))
+        assert len(self.session_salt) == SALT_SIZE
+        self.workload = workload
+        self.cache_size = cache_size
+        self.session_cache_size = session_cache_size
+        self._password = password
+        self._own_session_key = pbkdf2_hmac('sha256', password, self.session_salt, workload, 32)
+        self._session_keys = OrderedDict()
+        self._ciphers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _session_key(self, session_salt):
+        """ Returns the PBKDF2 output of a session salt, computed once while cached. """
+        if session_salt == self.session_salt:
+            return self._own_session_key
+        with self._lock:
+            key = self._session_keys.get(session_salt)
+            if key is not None:
+                self._session_keys.move_to_end(session_salt)
+                return key
+        key = pbkdf2_hmac('sha256', self._password, session_salt, self.workload, 32)
+        with self._lock:
+            self._session_keys[session_salt] = key
+            while len(self._session_keys) > self.session_cache_size:
+                self._session_keys.popitem(last=False)
+        return key
+
+    def derive(self, salt, session_salt=None):
+        """
+        Returns the (aes_key, hmac_key, iv) of a message salt and their
+        cached `AES` instance.
+        """
+        session_salt = bytes(session_salt or self.session_salt)
+        cache_key = session_salt + bytes(salt)
+        with self._lock:
+            entry = self._ciphers.get(cache_key)
+            if entry is not None:
+                self._ciphers.move_to_end(cache_key)
+                return entry
+
+        stretched = hkdf(self._session_key(session_salt), bytes(salt), b'mod_aes message keys',
+                         AES_KEY_SIZE + HMAC_KEY_SIZE + IV_SIZE)
+        keys = (stretched[:AES_KEY_SIZE], stretched[AES_KEY_SIZE:AES_KEY_SIZE + HMAC_KEY_SIZE],
+                stretched[AES_KEY_SIZE + HMAC_KEY_SIZE:])
+        entry = (keys, AES(keys[0]))
+        with self._lock:
+            self._ciphers[cache_key] = entry
+            while len(self._ciphers) > self.cache_size:
+                self._ciphers.popitem(last=False)
+        return entry
+
+    def encrypt(self, plaintext, mode='cbc'):
+        """ Encrypts `plaintext` like `encrypt`, without a PBKDF2 run. """
+        assert mode in ('cbc', 'aead')
+        if isinstance(plaintext, str):
+            plaintext = plaintext.encode('utf-8')
+        header = pack_header(mode, FLAG_SESSION) + self.session_salt
+        salt = os.urandom(SALT_SIZE)
+        keys, aes = self.derive(salt)
+        return _seal(header, salt, plaintext, mode, keys, aes)
+
+    def decrypt(self, ciphertext):
+        """
+        Verifies and decrypts a blob of this or another session of the same
+        password; other sessions cost one PBKDF2 each, the first time.
+        """
+        header = parse_header(ciphertext)
+        assert header is not None and header[1] & FLAG_SESSION, 'Not a session blob.'
+        assert header[0] in ('cbc', 'aead')
+        split = HEADER_SIZE + SALT_SIZE
+        assert len(ciphertext) >= split, 'Ciphertext too short.'
+        session_salt = bytes(ciphertext[HEADER_SIZE:split])
+        return _unseal(ciphertext[:split], ciphertext[split:], header[0],
+                       lambda salt: self.derive(salt, session_salt))
+
+
+# Envelope blobs: header || salt || wrap_key(KEK, data key) || AEAD(payload) || tag.
+ENVELOPE_KEY_SIZE = 32
+WRAPPED_KEY_SIZE = ENVELOPE_KEY_SIZE + 8
+ENVELOPE_HEADER_SIZE = HEADER_SIZE + SALT_SIZE + WRAPPED_KEY_SIZE
+KEY_WRAP_IV = b'\xa6' * 8
+
+def wrap_key(aes, key):
+    """
+    Wraps `key` (a multiple of 8 bytes, at least 16) under the key-encryption
+    cipher `aes` with the RFC 3394 construction.
+    """
+    assert len(key) % 8 == 0 and len(key) >= 16
+    n = len(key) // 8
+    a = KEY_WRAP_IV
+    r = [key[i:i + 8] for i in range(0, len(key), 8)]
+    for j in range(6):
+        for i in range(n):
+            b = aes.encrypt_block(a + r[i])
+            a = xor_bytes(b[:8], (n * j + i + 1).to_bytes(8, 'big'))
+            r[i] = b[8:]
+    return a + b''.join(r)
+
+
+def unwrap_key(aes, wrapped):
+    """
+    Reverses `wrap_key`, raising AssertionError if the wrapped key was not
+    produced under `aes` or was modified.
+    """
+    assert len(wrapped) % 8 == 0 and len(wrapped) >= 24, 'Wrapped key truncated.'
+    n = len(wrapped) // 8 - 1
+    a = bytes(wrapped[:8])
+    r = [bytes(wrapped[i:i + 8]) for i in range(8, len(wrapped), 8)]
+    for j in range(5, -1, -1):
+        for i in range(n - 1, -1, -1):
+            b = aes.decrypt_block(xor_bytes(a, (n * j + i + 1).to_bytes(8, 'big')) + r[i])
+            a, r[i] = b[:8], b[8:]
+    assert compare_digest(a, KEY_WRAP_IV), 'Wrong password or wrapped key tampered.'
+    return b''.join(r)
+
+
+def _envelope_cipher(data_key):
+    """ Returns the payload `AES` and IV of an envelope data key. """
+    stretched = hkdf(data_key, b'', b'mod_aes envelope payload', AES_KEY_SIZE + IV_SIZE)
+    return AES(stretched[:AES_KEY_SIZE]), stretched[AES_KEY_SIZE:]
+
+
+def _wrap_header(password, data_key, workload, flags=0):
+    """ Returns a fresh envelope header wrapping `data_key` under `password`. """
+    salt = os.urandom(SALT_SIZE)
+    key, _, _ = get_key_iv(password, salt, workload)
+    return pack_header('envelope', flags) + salt + wrap_key(AES(key), data_key)
+
+
+def _unwrap_header(ciphertext, derive):
+    """ Returns the data key of an envelope blob, `derive` giving the KEK cipher. """
+    assert len(ciphertext) >= ENVELOPE_HEADER_SIZE, 'Envelope header truncated.'
+    salt = ciphertext[HEADER_SIZE:HEADER_SIZE + SALT_SIZE]
+    _, aes = derive(salt)
+    return unwrap_key(aes, ciphertext[HEADER_SIZE + SALT_SIZE:ENVELOPE_HEADER_SIZE])
+
+
+def rekey(ciphertext, old_key, new_key, workload=100000, new_workload=None):
+    """
+    Re-wraps the data key of an 'envelope' blob from `old_key` to `new_key`
+    without touching the payload. A bytearray (or writable mmap) is updated
+    in place and returned; otherwise a new bytes object is returned.
+    """
+    if isinstance(old_key, str):
+        old_key = old_key.encode('utf-8')
+    if isinstance(new_key, str):
+        new_key = new_key.encode('utf-8')
+    header = parse_header(ciphertext)
+    assert header is not None and header[0] == 'envelope', 'Not an envelope blob.'
+
+    def derive(salt):
+        key, _, _ = get_key_iv(old_key, salt, workload)
+        return None, AES(key)
+    data_key = _unwrap_header(ciphertext, derive)
+    new_header = _wrap_header(new_key, data_key, workload if new_workload is None else new_workload, header[1])
+    if isinstance(ciphertext, (bytearray, mmap.mmap)):
+        ciphertext[:ENVELOPE_HEADER_SIZE] = new_header
+        return ciphertext
+    return new_header + ciphertext[ENVELOPE_HEADER_SIZE:]
+
+
+def rekey_file(path, old_key, new_key, workload=100000, new_workload=None):
+    """ Re-wraps the data key of an 'envelope' file, rewriting only its header. """
+    with open(path, 'r+b') as f:
+        header = bytearray(f.read(ENVELOPE_HEADER_SIZE))
+        rekey(header, old_key, new_key, workload, new_workload)
+        f.seek(0)
+        f.write(header)
+
+
+SEGMENT_SIZE = 64 * 1024
+# Versioned header, salt and the 4-byte segment size.
+CONTAINER_HEADER_SIZE = HEADER_SIZE + SALT_SIZE + 4
+
+class SegmentedCipher:
+    """
+    Keys of one segmented container, stretched with PBKDF2 once. The payload
+    is split into `segment_size` segments, each encrypted with
+    `AES.encrypt_aead` under its own IV (the KW-Tweak mask of the segment
+    index) and authenticated together with the container header, the index
+    and a final-segment flag. Segments can be verified independently, in
+    any order or in parallel, while reordering and truncation are detected.
+
+    Layout: header(8) || salt(16) || segment_size(4) || segment_0 || ...,
+    each segment being its ciphertext || tag(16). Only the last segment may
+    be shorter than `segment_size`; an empty payload is one empty segment.
+    """
+    def __init__(self, key, salt, workload=100000, segment_size=SEGMENT_SIZE, keys=None, flags=0, aes=None):
+        """
+        `keys` may pass the result of `get_key_iv(key, salt, workload)` when
+        it was already computed elsewhere, e.g. on an executor, and `aes` an
+        `AES` instance of its key. `flags` go in the (authenticated) header;
+        see `COMPRESSION_FLAGS`.
+        """
+        if isinstance(key, str):
+            key = key.encode('utf-8')
+        assert len(salt) == SALT_SIZE
+        assert 0 < segment_size < 1 << 32
+        self.segment_size = segment_size
+        self.flags = flags
+        self.header = pack_header('segmented', flags) + bytes(salt) + struct.pack('>I', segment_size)
+        aes_key, _, iv = keys or get_key_iv(key, salt, workload)
+        self._aes_key = aes_key
+        self._aes = aes or AES(aes_key)
+        self._ivs = KWMaskGenerator(aes_key, iv)
+
+    @staticmethod
+    def parse(data):
+        """ Returns the salt and segment size from a container header. """
+        header = parse_header(data)
+        assert header is not None and header[0] == 'segmented', 'Not a segmented container.'
+        assert len(data) >= CONTAINER_HEADER_SIZE, 'Container header truncated.'
+        salt = bytes(data[HEADER_SIZE:HEADER_SIZE + SALT_SIZE])
+        segment_size, = struct.unpack('>I', data[HEADER_SIZE + SALT_SIZE:CONTAINER_HEADER_SIZE])
+        return salt, segment_size
+
+    @classmethod
+    def open(cls, key, data, workload=100000):
+        """ Returns the cipher of the container whose header starts `data`. """
+        salt, segment_size = cls.parse(data)
+        return cls(key, salt, workload, segment_size, flags=parse_header(data)[1])
+
+    def _segment_params(self, index, final):
+        """ Returns the IV and associated data of segment `index`. """
+        return self._ivs.mask(index), self.header + struct.pack('>QB', index, final)
+
+    def encrypt_segment(self, plaintext, index, final):
+        """ Returns segment `index` (ciphertext || tag) of `plaintext`. """
+        assert len(plaintext) <= self.segment_size
+        return self._aes.encrypt_aead(plaintext, *self._segment_params(index, final))
+
+    def decrypt_segment(self, segment, index, final):
+        """ Verifies and decrypts segment `index`, raising AssertionError if tampered. """
+        return self._aes.decrypt_aead(segment, *self._segment_params(index, final))
+
+    def segment_count(self, length):
+        """ Returns the number of segments of a container of `length` bytes. """
+        stride = self.segment_size + TAG_SIZE
+        return max(1, -(-(length - CONTAINER_HEADER_SIZE) // stride))
+
+    def read_segment(self, data, index):
+        """
+        Verifies and returns the plaintext of segment `index` of the container
+        `data` (e.g. bytes or an mmap) without processing any other segment.
+        """
+        count = self.segment_count(len(data))
+        assert 0 <= index < count
+        stride = self.segment_size + TAG_SIZE
+        start = CONTAINER_HEADER_SIZE + index * stride
+        return self.decrypt_segment(data[start:start + stride], index, index == count - 1)
+
+    def container_size(self, length):
+        """ Returns the size of the container of a `length`-byte payload. """
+        return CONTAINER_HEADER_SIZE + length + TAG_SIZE * max(1, -(-length // self.segment_size))
+
+    def plaintext_size(self, length):
+        """ Returns the payload size of a container of `length` bytes. """
+        return length - CONTAINER_HEADER_SIZE - TAG_SIZE * self.segment_count(length)
+
+    def encrypt_into(self, src, dst):
+        """
+        Writes the container of `src` into the writable buffer `dst` (e.g. an
+        mmap of `container_size(len(src))` bytes) one segment at a time, and
+        returns the number of bytes written.
+        """
+        src, dst = memoryview(src).cast('B'), memoryview(dst).cast('B')
+        size = self.segment_size
+        count = max(1, -(-len(src) // size))
+        dst[:CONTAINER_HEADER_SIZE] = self.header
+        position = CONTAINER_HEADER_SIZE
+        for i in range(count):
+            chunk = src[i * size:(i + 1) * size]
+            end = position + len(chunk)
+            tag = self._aes.encrypt_aead_into(chunk, dst[position:end], *self._segment_params(i, i == count - 1))
+            dst[end:end + TAG_SIZE] = tag
+            position = end + TAG_SIZE
+        return position
+
+    def decrypt_into(self, src, dst):
+        """
+        Verifies and decrypts the container `src` into the writable buffer
+        `dst` one segment at a time, and returns the payload length. A segment
+        is only written once it has been verified.
+        """
+        assert bytes(src[:CONTAINER_HEADER_SIZE]) == self.header, 'Container header mismatch.'
+        src, dst = memoryview(src).cast('B'), memoryview(dst).cast('B')
+        count = self.segment_count(len(src))
+        stride = self.segment_size + TAG_SIZE
+        written = 0
+        for i in range(count):
+            segment = src[CONTAINER_HEADER_SIZE + i * stride:CONTAINER_HEADER_SIZE + (i + 1) * stride]
+            assert len(segment) >= TAG_SIZE, 'Ciphertext is shorter than the tag.'
+            length = len(segment) - TAG_SIZE
+            iv, ad = self._segment_params(i, i == count - 1)
+            self._aes.decrypt_aead_into(segment[:length], dst[written:written + length], iv, segment[length:], ad)
+            written += length
+        return written
+
+    def _map(self, decrypt, pieces, executor):
+        """ Runs every (data, index, final) piece through the AEAD mode, in order. """
+        params = [self._segment_params(index, final) for _, index, final in pieces]
+        if executor is None:
+            method = self._aes.decrypt_aead if decrypt else self._aes.encrypt_aead
+            return [method(data, iv, ad) for (data, _, _), (iv, ad) in zip(pieces, params)]
+        return executor.map(_pool_aead, repeat(self._aes_key), repeat(decrypt),
+                            [bytes(data) for data, _, _ in pieces], *zip(*params))
+
+    def encrypt(self, plaintext, executor=None):
+        """ Returns the whole container of `plaintext`. """
+        size = self.segment_size
+        count = max(1, -(-len(plaintext) // size))
+        pieces = [(plaintext[i * size:(i + 1) * size], i, i == count - 1) for i in range(count)]
+        return self.header + b''.join(self._map(False, pieces, executor))
+
+    def decrypt(self, data, executor=None):
+        """
+        Verifies and decrypts the whole container `data`. With an `executor`
+        the segments are verified in parallel.
+        """
+        assert bytes(data[:CONTAINER_HEADER_SIZE]) == self.header, 'Container header mismatch.'
+        count = self.segment_count(len(data))
+        stride = self.segment_size + TAG_SIZE
+        pieces = []
+        for i in range(count):
+            start = CONTAINER_HEADER_SIZE + i * stride
+            pieces.append((data[start:start + stride], i, i == count - 1))
+        return b''.join(self._map(True, pieces, executor))
+
+
+def _read_full(source, n):
+    """ Reads up to `n` bytes from `source`, retrying short reads until EOF. """
+    parts = []
+    while n > 0:
+        part = source.read(n)
+        if not part:
+            break
+        parts.append(part)
+        n -= len(part)
+    return b''.join(parts)
+
+
+class _CompressingReader:
+    """ File-like view of `source` compressed on the fly, after `head`. """
+    def __init__(self, source, method, head=b''):
+        self._source = source
+        self._compressor = _compressor(method)
+        self._buffer = bytearray(self._compressor.compress(head))
+        self._eof = False
+
+    def read(self, n):
+        while len(self._buffer) < n and not self._eof:
+            chunk = self._source.read(n)
+            if chunk:
+                self._buffer += self._compressor.compress(chunk)
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+
+def encrypt_stream(key, source, workload=100000, segment_size=SEGMENT_SIZE, compress=None):
+    """
+    Reads the file-like `source` and yields a segmented container piece by
+    piece, holding at most two segments in memory. With `compress` the
+    stream is compressed on the fly if its first segment looks compressible.
+    """
+    assert compress is None or compress in COMPRESSION_FLAGS
+    chunk = _read_full(source, segment_size)
+    flags = 0
+    if compress is not None and should_compress(chunk):
+        flags = COMPRESSION_FLAGS[compress]
+        source = _CompressingReader(source, compress, chunk)
+        chunk = _read_full(source, segment_size)
+    cipher = SegmentedCipher(key, os.urandom(SALT_SIZE), workload, segment_size, flags=flags)
+    yield cipher.header
+    index = 0
+    while True:
+        following = _read_full(source, segment_size)
+        yield cipher.encrypt_segment(chunk, index, not following)
+        if not following:
+            return
+        chunk, index = following, index + 1
+
+
+def decrypt_stream(key, source, workload=100000):
+    """
+    Reads a segmented container from the file-like `source` and yields its
+    plaintext one verified segment at a time, with bounded memory. Compressed
+    containers are inflated on the fly, in pieces of at most a segment.
+    """
+    cipher = SegmentedCipher.open(key, _read_full(source, CONTAINER_HEADER_SIZE), workload)
+    if cipher.flags & COMPRESSION_MASK:
+        yield from decompress_chunks(_decrypt_segments(cipher, source), cipher.flags, cipher.segment_size)
+    else:
+        yield from _decrypt_segments(cipher, source)
+
+
+def _decrypt_segments(cipher, source):
+    """ Yields the verified plaintext of each segment read from `source`. """
+    stride = cipher.segment_size + TAG_SIZE
+    index = 0
+    segment = _read_full(source, stride)
+    while True:
+        following = _read_full(source, stride)
+        yield cipher.decrypt_segment(segment, index, not following)
+        if not following:
+            return
+        segment, index = following, index + 1
+
+
+async def _read_async(reader, n):
+    """ Reads `n` bytes from an asyncio.StreamReader, or fewer at EOF. """
+    try:
+        return await reader.readexactly(n)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+
+async def _pipe_segments(cipher, decrypt, reader, writer, read_size, executor, max_in_flight):
+    """
+    Runs the segments read from `reader` through the AEAD mode on `executor`
+    and writes the results to `writer` in order. At most `max_in_flight`
+    segments are queued; the oldest is awaited and written (and the writer
+    drained) before more is read, which gives backpressure both ways.
+    """
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    try:
+        index = 0
+        data = await _read_async(reader, read_size)
+        while True:
+            following = await _read_async(reader, read_size)
+            iv, associated_data = cipher._segment_params(index, not following)
+            pending.append(loop.run_in_executor(executor, _pool_aead, cipher._aes_key, decrypt,
+                                                data, iv, associated_data))
+            if not following:
+                break
+            while len(pending) >= max_in_flight:
+                writer.write(await pending.popleft())
+                await writer.drain()
+            data, index = following, index + 1
+        while pending:
+            writer.write(await pending.popleft())
+            await writer.drain()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def encrypt_async(key, reader, writer, workload=100000, executor=None, max_in_flight=4,
+                        segment_size=SEGMENT_SIZE):
+    """
+    Reads plaintext from the asyncio.StreamReader `reader` and writes a
+    segmented container to the asyncio.StreamWriter `writer`. PBKDF2 and the
+    segment encryptions run on `executor` (the loop's default executor if
+    None; a `ProcessPoolExecutor` keeps the cipher work off the loop's
+    thread), with at most `max_in_flight` segments queued at a time.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    salt = os.urandom(SALT_SIZE)
+    keys = await asyncio.get_running_loop().run_in_executor(executor, get_key_iv, key, salt, workload)
+    cipher = SegmentedCipher(key, salt, workload, segment_size, keys)
+    writer.write(cipher.header)
+    await _pipe_segments(cipher, False, reader, writer, segment_size, executor, max_in_flight)
+
+
+async def decrypt_async(key, reader, writer, workload=100000, executor=None, max_in_flight=4):
+    """
+    Reads a segmented container from the asyncio.StreamReader `reader` and
+    writes the plaintext of each verified segment to the asyncio.StreamWriter
+    `writer`, in order. Arguments as in `encrypt_async`; a tampered segment
+    raises AssertionError before anything from it is written.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    head = await _read_async(reader, CONTAINER_HEADER_SIZE)
+    salt, segment_size = SegmentedCipher.parse(head)
+    assert not parse_header(head)[1] & COMPRESSION_MASK, 'Use decrypt_stream for compressed containers.'
+    keys = await asyncio.get_running_loop().run_in_executor(executor, get_key_iv, key, salt, workload)
+    cipher = SegmentedCipher(key, salt, workload, segment_size, keys)
+    await _pipe_segments(cipher, True, reader, writer, segment_size + TAG_SIZE, executor, max_in_flight)
+
+
+# Header flag of an in-place encrypted file: salt, tag and header follow the data.
+FLAG_TRAILER = 0x01
+FILE_TRAILER_SIZE = SALT_SIZE + TAG_SIZE + HEADER_SIZE
+
+@contextmanager
+def _map_file(f, length, write=False):
+    """
+    Memory-maps the first `length` bytes of the open file `f`. An empty
+    file, which mmap rejects, maps to an empty bytearray.
+    """
+    if length == 0:
+        yield bytearray()
+        return
+    mapped = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_WRITE if write else mmap.ACCESS_READ)
+    try:
+        yield mapped
+    finally:
+        try:
+            if write:
+                mapped.flush()
+            mapped.close()
+        except BufferError:
+            # Views of it are still referenced by the traceback of the error
+            # being raised; the map closes once they are collected.
+            pass
+
+
+def encrypt_file(key, path, out_path=None, workload=100000):
+    """
+    Encrypts the file at `path` through memory maps, without reading it into
+    memory. With `out_path` a segmented container is written there.
+    Otherwise the file is encrypted in place with the CTR-based AEAD mode,
+    and the salt, tag and a header are appended after the data. The trailer
+    is made durable, with a zero tag placeholder, before any data is
+    overwritten, so an interrupted run never leaves data encrypted under a
+    salt that is not on disk. Returns the number of plaintext bytes
+    processed.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+
+    if out_path is None:
+        header = pack_header('aead', FLAG_TRAILER)
+        salt = os.urandom(SALT_SIZE)
+        aes_key, _, iv = get_key_iv(key, salt, workload)
+        with open(path, 'r+b') as f:
+            length = os.fstat(f.fileno()).st_size
+            f.seek(length)
+            f.write(salt + bytes(TAG_SIZE) + header)
+            f.flush()
+            os.fsync(f.fileno())
+            with _map_file(f, length, write=True) as data:
+                tag = AES(aes_key).encrypt_aead_into(data, data, iv, header + salt)
+            f.seek(length + SALT_SIZE)
+            f.write(tag)
+            f.flush()
+            os.fsync(f.fileno())
+        return length
+
+    assert not os.path.exists(out_path) or not os.path.samefile(path, out_path), 'Omit out_path to work in place.'
+    cipher = SegmentedCipher(key, os.urandom(SALT_SIZE), workload)
+    with open(path, 'rb') as src, open(out_path, 'w+b') as dst:
+        length = os.fstat(src.fileno()).st_size
+        size = cipher.container_size(length)
+        dst.truncate(size)
+        with _map_file(src, length) as data, _map_file(dst, size, write=True) as out:
+            cipher.encrypt_into(data, out)
+    return length
+
+
+def decrypt_file(key, path, out_path=None, workload=100000):
+    """
+    Decrypts a file written by `encrypt_file` through memory maps, into
+    `out_path` or, for in-place encrypted files, in place when `out_path` is
+    omitted. Data is only written after its tag has been verified. Returns
+    the number of plaintext bytes.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    assert out_path is None or not os.path.exists(out_path) or not os.path.samefile(path, out_path), \
+        'Omit out_path to work in place.'
+
+    with open(path, 'rb' if out_path else 'r+b') as f:
+        total = os.fstat(f.fileno()).st_size
+        head = f.read(CONTAINER_HEADER_SIZE)
+        header = parse_header(head)
+        if header is not None and header[0] == 'segmented':
+            assert out_path is not None, 'Segmented containers cannot be decrypted in place.'
+            cipher = SegmentedCipher.open(key, head, workload)
+            assert not cipher.flags & COMPRESSION_MASK, 'Use decrypt_stream for compressed containers.'
+            length = cipher.plaintext_size(total)
+            with open(out_path, 'w+b') as dst:
+                dst.truncate(length)
+                with _map_file(f, total) as data, _map_file(dst, length, write=True) as out:
+                    cipher.decrypt_into(data, out)
+            return length
+
+        assert total >= FILE_TRAILER_SIZE, 'Not an encrypted file.'
+        length = total - FILE_TRAILER_SIZE
+        f.seek(length)
+        trailer = f.read()
+        salt, tag, header = trailer[:SALT_SIZE], trailer[SALT_SIZE:-HEADER_SIZE], trailer[-HEADER_SIZE:]
+        assert parse_header(header) == ('aead', FLAG_TRAILER), 'Not an encrypted file.'
+        assert tag != bytes(TAG_SIZE), 'Encryption of this file was interrupted.'
+        aes_key, _, iv = get_key_iv(key, salt, workload)
+        aes = AES(aes_key)
+
+        if out_path is None:
+            with _map_file(f, length, write=True) as data:
+                aes.decrypt_aead_into(data, data, iv, tag, header + salt)
+            f.truncate(length)
+            return length
+
+        with open(out_path, 'w+b') as dst:
+            dst.truncate(length)
+            with _map_file(f, length) as data, _map_file(dst, length, write=True) as out:
+                aes.decrypt_aead_into(data, out, iv, tag, header + salt)
+        return length
+
+
+# Process pool shared by encrypt_many/decrypt_many, started on first use.
+_records_pool = None
+
+def records_pool():
+    """
+    Returns the persistent process pool used by `encrypt_many`/`decrypt_many`,
+    shut down at interpreter exit or by `shutdown_records_pool`.
+    """
+    global _records_pool
+    if _records_pool is None:
+        _records_pool = ProcessPoolExecutor()
+        atexit.register(shutdown_records_pool)
+    return _records_pool
+
+
+def shutdown_records_pool():
+    """ Shuts down the pool of `records_pool`, if it was started. """
+    global _records_pool
+    pool, _records_pool = _records_pool, None
+    if pool is not None:
+        atexit.unregister(shutdown_records_pool)
+        pool.shutdown()
+
+
+def _encrypt_records(key, plaintexts, workload, mode):
+    results = []
+    for plaintext in plaintexts:
+        try:
+            results.append(encrypt(key, plaintext, workload, mode))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _decrypt_records(key, ciphertexts, workload):
+    results = []
+    for ciphertext in ciphertexts:
+        try:
+            results.append(decrypt(key, ciphertext, workload))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _map_records(executor, task, items, chunksize, max_in_flight):
+    """
+    Submits `task(chunk)` for successive chunks of `items` with at most
+    `max_in_flight` chunks outstanding, yielding their results in order.
+    """
+    items = iter(items)
+    pending = deque()
+    for chunk in iter(lambda: list(islice(items, chunksize)), []):
+        pending.append(executor.submit(task, chunk))
+        if len(pending) >= max_in_flight:
+            yield from pending.popleft().result()
+    while pending:
+        yield from pending.popleft().result()
+
+
+def encrypt_many(key, plaintexts, workload=100000, mode='cbc', executor=None, chunksize=16, max_in_flight=32):
+    """
+    Encrypts every item of the iterable `plaintexts` as `encrypt` would,
+    spread over the persistent `records_pool()` (or `executor`). Yields the
+    results in input order, with at most `max_in_flight` chunks of
+    `chunksize` items queued; an item that failed yields its exception
+    instead of raising it.
+    """
+    executor = executor or records_pool()
+    task = partial(_encrypt_records, key, workload=workload, mode=mode)
+    return _map_records(executor, task, plaintexts, chunksize, max_in_flight)
+
+
+def decrypt_many(key, ciphertexts, workload=100000, executor=None, chunksize=16, max_in_flight=32):
+    """
+    Decrypts every item of the iterable `ciphertexts` as `decrypt` would,
+    spread over the persistent `records_pool()` (or `executor`). Yields the
+    results in input order, bounded as in `encrypt_many`; an item that
+    failed to verify yields its exception (usually an AssertionError)
+    instead of raising it.
+    """
+    executor = executor or records_pool()
+    task = partial(_decrypt_records, key, workload=workload)
+    return _map_records(executor, task, ciphertexts, chunksize, max_in_flight)
 
 
 def benchmark():
@@ -614,7 +3003,20 @@ def benchmark():
     for i in range(30000):
         aes.encrypt_block(message)
 
-__all__ = ["encrypt", "decrypt", "AES"]
+__all__ = [
+    "encrypt", "decrypt", "AES",
+    "KeystreamReservoir",
+    "ModeContext",
+    "GHash",
+    "SegmentedCipher", "encrypt_stream", "decrypt_stream",
+    "encrypt_file", "decrypt_file",
+    "encrypt_async", "decrypt_async",
+    "encrypt_many", "decrypt_many", "records_pool", "shutdown_records_pool",
+    "Keyring", "hkdf",
+    "KeyCache",
+    "wrap_key", "unwrap_key", "rekey", "rekey_file",
+    "should_compress", "compress_payload", "decompress_payload", "decompress_chunks",
+]
 
 if __name__ == '__main__':
     import sys
@@ -623,9 +3025,18 @@ if __name__ == '__main__':
 
     if len(sys.argv) < 2:
         print('Usage: ./aes.py encrypt "key" "message"')
+        print('       ./aes.py encrypt-file "key" input [output]')
+        print('       ./aes.py decrypt-file "key" input [output]')
         print('Running tests...')
         from mod_tests import run
         run()
+    elif len(sys.argv) in (4, 5) and sys.argv[1] in ('encrypt-file', 'decrypt-file'):
+        process = encrypt_file if sys.argv[1] == 'encrypt-file' else decrypt_file
+        start = time.perf_counter()
+        length = process(sys.argv[2], *sys.argv[3:])
+        elapsed = time.perf_counter() - start
+        print('{} bytes in {:.2f}s ({:.2f} MB/s)'.format(length, elapsed, length / elapsed / 1e6))
+        exit()
     elif len(sys.argv) == 2 and sys.argv[1] == 'benchmark':
         benchmark()
         exit()
@@ -1,5 +1,6 @@
 import unittest
-from mod_aes import AES, encrypt, decrypt
+import mod_aes
+from mod_aes import AES, encrypt, decrypt, get_round_functions
 
 class TestBlock(unittest.TestCase):
     """
@@ -36,6 +37,14 @@ class TestBlock(unittest.TestCase):
         ciphertext = AES(bytes(key)).encrypt_block(bytes(message))
         self.assertEqual(ciphertext, b'\x39\x25\x84\x1D\x02\xDC\x09\xFB\xDC\x11\x85\x97\x19\x6A\x0B\x32')
 
+    def test_trace_matches_block(self):
+        """ The list-based round trace must end in the integer core's output. """
+        for key_size in AES.rounds_by_key_size:
+            aes = AES(bytes(range(key_size)))
+            rounds = aes.trace_encrypt_rounds(b'a secret message')
+            self.assertEqual(len(rounds), aes.n_rounds)
+            self.assertEqual(rounds[-1], aes._encrypt_int(int.from_bytes(b'a secret message', 'big')).to_bytes(16, 'big'))
+
 class TestKeySizes(unittest.TestCase):
     """
     Tests encrypt and decryption using 192- and 256-bit keys.
@@ -66,6 +75,715 @@ class TestKeySizes(unittest.TestCase):
         self.assertEqual(ciphertext, b'\x8e\xa2\xb7\xca\x51\x67\x45\xbf\xea\xfc\x49\x90\x4b\x49\x60\x89')
         self.assertEqual(aes.decrypt_block(ciphertext), message)
 
+class TestTTable(unittest.TestCase):
+    """
+    Tests the T-table round engine against the reference matrix rounds.
+    """
+    message = b'\x00\x11\x22\x33\x44\x55\x66\x77\x88\x99\xAA\xBB\xCC\xDD\xEE\xFF'
+    # (key, KDRP permutation, ciphertext, ciphertext for block_index=3 and tweak_iv=b'\x01' * 16)
+    vectors = [
+        ('030102000405060708090a0b0c0d0e0f', [3, 1, 2, 0],
+         '2d2fb41b211b4d0d2141eb41b49d358e', '6954f24288dd869fd265d1ed5f666807'),
+        ('2b7e15160405060708090a0b0c0d0e0f1011121314151617', [2, 3, 0, 1],
+         '3dee2f6b0c2eeaf64406c3dcec27085a', '670bccf817820f2ddb4854fb6daf70ca'),
+        ('ff00ff100405060708090a0b0c0d0e0f101112131415161718191a1b1c1d1e1f', [1, 3, 0, 2],
+         'e7113229f6929dd1ba3dd3c8d1c84c73', 'f4ca589e6a2cce5a8425a37d6f9660ad'),
+    ]
+
+    def test_bad_engine(self):
+        with self.assertRaises(AssertionError):
+            AES(b'\x00' * 16, engine='unknown')
+
+    def test_expected_values(self):
+        """ Both engines must match the KW-Tweak + KDRP reference outputs. """
+        for key, perm, expected, expected_tweaked in self.vectors:
+            for engine in AES.engines:
+                aes = AES(bytes.fromhex(key), engine=engine)
+                self.assertEqual(aes.perm, perm)
+                self.assertEqual(aes.encrypt_block(self.message).hex(), expected)
+                ciphertext = aes.encrypt_block(self.message, block_index=3, tweak_iv=b'\x01' * 16)
+                self.assertEqual(ciphertext.hex(), expected_tweaked)
+
+    def test_engines_agree(self):
+        """ Every KDRP permutation and key size must give identical output. """
+        import itertools
+        for key_size in AES.rounds_by_key_size:
+            for prefix in itertools.permutations(range(4)):
+                key = bytes(prefix) + bytes(range(4, key_size))
+                matrix = AES(key, engine='matrix')
+                for engine in ('ttable', 'bytes'):
+                    aes = AES(key, engine=engine)
+                    for i in range(4):
+                        message = bytes((i * 37 + j * 11) & 0xFF for j in range(16))
+                        self.assertEqual(aes.encrypt_block(message, block_index=i),
+                                         matrix.encrypt_block(message, block_index=i))
+                        self.assertEqual(aes.encrypt_cbc(message * 3, b'\x02' * 16),
+                                         matrix.encrypt_cbc(message * 3, b'\x02' * 16))
+
+    def test_lazy_decryption_tables(self):
+        """ Decryption round keys are only built on the first decryption. """
+        aes = AES(bytes.fromhex(self.vectors[0][0]))
+        ciphertext = aes.encrypt_block(self.message)
+        self.assertIsNone(aes._dec_key_matrices)
+        self.assertEqual(aes.decrypt_block(ciphertext), self.message)
+        self.assertEqual(len(aes._dec_key_matrices), aes.n_rounds + 1)
+
+    def test_round_functions_cached(self):
+        """ Instances with the same rounds and permutation share code. """
+        a = AES(bytes.fromhex('03010200') + b'\x11' * 12)
+        b = AES(bytes.fromhex('09020501') + b'\x22' * 12)
+        c = AES(bytes.fromhex('03010200') + b'\x11' * 20)
+        self.assertEqual(a.perm, b.perm)
+        self.assertIs(a._round_functions, b._round_functions)
+        self.assertIsNot(a._round_functions, c._round_functions)
+        self.assertIs(a._round_functions, get_round_functions(10, [3, 1, 2, 0]))
+
+    def test_decryption_engines_agree(self):
+        """ The equivalent inverse cipher must invert every permutation. """
+        import itertools
+        for key_size in AES.rounds_by_key_size:
+            for prefix in itertools.permutations(range(4)):
+                key = bytes(prefix) + bytes(range(4, key_size))
+                matrix = AES(key, engine='matrix')
+                ciphertext = matrix.encrypt_block(self.message, block_index=5, tweak_iv=b'\x03' * 16)
+                pcbc = matrix.encrypt_pcbc(self.message * 3, b'\x02' * 16)
+                for engine in ('ttable', 'bytes'):
+                    aes = AES(key, engine=engine)
+                    self.assertEqual(aes.decrypt_block(ciphertext, block_index=5, tweak_iv=b'\x03' * 16),
+                                     self.message)
+                    self.assertEqual(aes.decrypt_pcbc(pcbc, b'\x02' * 16), self.message * 3)
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Tests the batched ECB core against single-block calls.
+    """
+    def setUp(self):
+        self.aes = AES(bytes.fromhex('2b7e1516') + b'\x05' * 12)
+        self.data = bytes(range(256)) * 2
+        self.iv = b'\x01' * 16
+        self.indices = list(range(3, 3 + len(self.data) // 16))
+
+    def test_matches_single_blocks(self):
+        expected = b''.join(self.aes.encrypt_block(self.data[i:i+16], block_index=self.indices[i // 16], tweak_iv=self.iv)
+                            for i in range(0, len(self.data), 16))
+        ciphertext = self.aes.encrypt_blocks(self.data, block_index=self.indices, tweak_iv=self.iv)
+        self.assertEqual(ciphertext, expected)
+        self.assertEqual(self.aes.decrypt_blocks(ciphertext, block_index=self.indices, tweak_iv=self.iv), self.data)
+
+    def test_default_index(self):
+        """ Without `block_index` every block uses index 0, like `encrypt_block`. """
+        expected = b''.join(self.aes.encrypt_block(self.data[i:i+16]) for i in range(0, len(self.data), 16))
+        self.assertEqual(self.aes.encrypt_blocks(self.data), expected)
+
+    def test_backends_agree(self):
+        expected = self.aes.encrypt_blocks(self.data, block_index=self.indices, tweak_iv=self.iv, backend='loop')
+        for backend in ('bitsliced', 'loop'):
+            ciphertext = self.aes.encrypt_blocks(self.data, block_index=self.indices, tweak_iv=self.iv, backend=backend)
+            self.assertEqual(ciphertext, expected)
+            plaintext = self.aes.decrypt_blocks(ciphertext, block_index=self.indices, tweak_iv=self.iv, backend=backend)
+            self.assertEqual(plaintext, self.data)
+
+    def test_small_batches_skip_numpy(self):
+        self.assertEqual(self.aes._batch_backend(None, AES.numpy_min_blocks - 1), 'loop')
+        if mod_aes.np is not None:
+            self.assertEqual(self.aes._batch_backend(None, AES.numpy_min_blocks), 'numpy')
+
+    def test_bitsliced_sbox(self):
+        """ The Boolean S-box circuits must reproduce the lookup tables. """
+        for x in range(256):
+            planes = [x >> i & 1 for i in range(8)]
+            forward = mod_aes.bs_sub_byte(planes, 1)
+            inverse = mod_aes.bs_inv_sub_byte(planes, 1)
+            self.assertEqual(sum(bit << i for i, bit in enumerate(forward)), mod_aes.s_box[x])
+            self.assertEqual(sum(bit << i for i, bit in enumerate(inverse)), mod_aes.inv_s_box[x])
+
+    @unittest.skipIf(mod_aes.np is None, 'NumPy not installed')
+    def test_lazy_numpy_tables_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        data = self.data * 2
+        expected = self.aes.encrypt_blocks(data, backend='loop')
+        for _ in range(20):
+            aes = AES(self.aes._master_key)
+            with ThreadPoolExecutor(4) as executor:
+                results = list(executor.map(lambda _: aes.encrypt_blocks(data, backend='numpy'), range(4)))
+            self.assertEqual(results, [expected] * 4)
+
+    @unittest.skipIf(mod_aes.np is None, 'NumPy not installed')
+    def test_array(self):
+        np = mod_aes.np
+        blocks = np.frombuffer(self.data, dtype=np.uint8).reshape(-1, 16)
+        ciphertext = self.aes.encrypt_blocks(blocks, block_index=np.array(self.indices), tweak_iv=self.iv)
+        self.assertEqual(ciphertext.shape, blocks.shape)
+        self.assertEqual(ciphertext.tobytes(), self.aes.encrypt_blocks(self.data, block_index=self.indices, tweak_iv=self.iv))
+        plaintext = self.aes.decrypt_blocks(ciphertext, block_index=np.array(self.indices), tweak_iv=self.iv)
+        self.assertTrue((plaintext == blocks).all())
+
+
+class TestMaskGenerator(unittest.TestCase):
+    """
+    Tests the per-message KW-Tweak mask generator.
+    """
+    def test_matches_whitening_mask(self):
+        aes = AES(b'\x07' * 24)
+        for iv in (None, b'', b'\x01' * 16):
+            masks = mod_aes.KWMaskGenerator(b'\x07' * 24, iv)
+            for i in (0, 1, 255, 2**40):
+                expected = aes._kw_whitening_mask(aes._kw_tweak_bytes(i, iv))
+                self.assertEqual(masks.mask(i), expected)
+            self.assertEqual(masks.masks(range(3)), b''.join(masks.mask(i) for i in range(3)))
+            self.assertEqual(masks.tape(4, start=2), b''.join(masks.mask(i) for i in range(2, 6)))
+
+
+class TestXor(unittest.TestCase):
+    """
+    Tests the bulk xor_bytes primitive on both size paths.
+    """
+    def test_xor(self):
+        for n in (0, 5, 16, 1000):
+            a = bytes(i * 7 & 0xFF for i in range(n))
+            b = bytes(i * 13 + 5 & 0xFF for i in range(n))
+            expected = bytes(i ^ j for i, j in zip(a, b))
+            self.assertEqual(mod_aes.xor_bytes(a, b), expected)
+            self.assertEqual(mod_aes.xor_bytes(memoryview(a), b + b'tail'), expected)
+            out = bytearray(a)
+            self.assertIs(mod_aes.xor_bytes(out, b, out=out), out)
+            self.assertEqual(out, expected)
+
+
+class TestParallelDecrypt(unittest.TestCase):
+    """
+    Tests the batched CBC/PCBC/CFB decryption, in-process and over an executor.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.aes.pool_chunk_blocks = 4
+        self.iv = bytes(range(16))
+        self.message = bytes(range(256)) * 3 + b'tail'
+
+    def test_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(2) as executor:
+            for mode in ('cbc', 'pcbc', 'cfb'):
+                ciphertext = getattr(self.aes, 'encrypt_' + mode)(self.message, self.iv)
+                decrypt = getattr(self.aes, 'decrypt_' + mode)
+                self.assertEqual(decrypt(ciphertext, self.iv), self.message)
+                self.assertEqual(decrypt(ciphertext, self.iv, executor=executor), self.message)
+
+    def test_process_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+        ciphertext = self.aes.encrypt_cbc(self.message, self.iv)
+        with ProcessPoolExecutor(2) as executor:
+            self.assertEqual(self.aes.decrypt_cbc(ciphertext, self.iv, executor=executor), self.message)
+
+
+class TestReservoir(unittest.TestCase):
+    """
+    Tests CTR/OFB encryption from keystreams precomputed in a reservoir.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.iv = bytes(range(16))
+        self.message = bytes(range(256)) + b'tail'
+        self.expected = {mode: getattr(self.aes, 'encrypt_' + mode)(self.message, self.iv)
+                         for mode in mod_aes.KeystreamReservoir.modes}
+        self.aes.reservoir = mod_aes.KeystreamReservoir(self.aes)
+
+    def tearDown(self):
+        self.aes.reservoir.close()
+
+    def test_reserved(self):
+        for mode, expected in self.expected.items():
+            self.aes.reservoir.reserve(self.iv, len(self.message), mode)
+            self.assertEqual(getattr(self.aes, 'encrypt_' + mode)(self.message, self.iv), expected)
+            # Consumed: a second call computes the keystream itself.
+            self.assertIsNone(self.aes.reservoir.take(self.iv, 1, mode))
+            self.assertEqual(getattr(self.aes, 'encrypt_' + mode)(self.message, self.iv), expected)
+
+    def test_too_short(self):
+        self.aes.reservoir.reserve(self.iv, 16, 'ctr')
+        self.assertEqual(self.aes.encrypt_ctr(self.message, self.iv), self.expected['ctr'])
+
+    def test_ready_capped(self):
+        import time
+        reservoir = mod_aes.KeystreamReservoir(self.aes, max_ready=2)
+        ivs = [bytes([i]) * 16 for i in range(4)]
+        for iv in ivs:
+            reservoir.reserve(iv, 32, 'ctr')
+        deadline = time.monotonic() + 10
+        while (reservoir._queued or reservoir._running or not reservoir._queue.empty()) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(list(reservoir._ready), [('ctr', iv) for iv in ivs[2:]])
+        self.assertIsNone(reservoir.take(ivs[0], 2, 'ctr'))
+        self.assertEqual(reservoir.take(ivs[3], 2, 'ctr'), self.aes._ctr_keystream(ivs[3], 2))
+        reservoir.close()
+
+
+class TestModeContext(unittest.TestCase):
+    """
+    Tests incremental encryptor/decryptor objects against the one-shot modes.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.iv = bytes(range(16))
+
+    def run_chunks(self, context, data, sizes):
+        out = []
+        i = 0
+        for size in sizes * len(data):
+            if i >= len(data):
+                break
+            out.append(context.update(data[i:i+size]))
+            i += size
+        out.append(context.finalize())
+        return b''.join(out)
+
+    def test_matches_one_shot(self):
+        for mode in AES.modes:
+            for length in (0, 15, 16, 17, 100):
+                message = bytes(range(length))
+                expected = getattr(self.aes, 'encrypt_' + mode)(message, self.iv)
+                for sizes in ([1], [7, 16], [16], [33, 0]):
+                    ciphertext = self.run_chunks(self.aes.encryptor(mode, self.iv), message, sizes)
+                    self.assertEqual(ciphertext, expected)
+                    plaintext = self.run_chunks(self.aes.decryptor(mode, self.iv), ciphertext, sizes)
+                    self.assertEqual(plaintext, message)
+
+    def test_finalized(self):
+        context = self.aes.encryptor('cbc', self.iv)
+        context.finalize()
+        with self.assertRaises(AssertionError):
+            context.update(b'M')
+
+
+class TestInto(unittest.TestCase):
+    """
+    Tests the encrypt_*_into/decrypt_*_into buffer APIs, including in place.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.aes.pool_chunk_blocks = 2
+        self.iv = bytes(range(16))
+
+    def test_matches_one_shot(self):
+        for mode in AES.modes:
+            for length in (0, 15, 16, 100):
+                message = bytes(range(length))
+                expected = getattr(self.aes, 'encrypt_' + mode)(message, self.iv)
+                dst = bytearray(len(expected) + 3)
+                written = getattr(self.aes, 'encrypt_%s_into' % mode)(memoryview(message), dst, self.iv)
+                self.assertEqual(bytes(dst[:written]), expected)
+                out = bytearray(len(expected))
+                written = getattr(self.aes, 'decrypt_%s_into' % mode)(expected, out, self.iv)
+                self.assertEqual(bytes(out[:written]), message)
+
+    def test_in_place(self):
+        message = bytes(range(100))
+        for mode in ('cfb', 'ofb', 'ctr'):
+            buffer = bytearray(message)
+            getattr(self.aes, 'encrypt_%s_into' % mode)(buffer, buffer, self.iv)
+            self.assertEqual(bytes(buffer), getattr(self.aes, 'encrypt_' + mode)(message, self.iv))
+            getattr(self.aes, 'decrypt_%s_into' % mode)(buffer, buffer, self.iv)
+            self.assertEqual(bytes(buffer), message)
+
+
+class TestAead(unittest.TestCase):
+    """
+    Tests the CTR+GHASH authenticated mode.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.aes.pool_chunk_blocks = 2
+        self.iv = bytes(range(16))
+
+    def test_ghash(self):
+        """ GHASH value of GCM test case 2. """
+        ghash = mod_aes.GHash(bytes.fromhex('66e94bd4ef8a2c3b884cfa59ca342b2e'))
+        y = ghash.update(0, bytes.fromhex('0388dace60b6a392f328c2b971b2fe78'))
+        y = ghash.update(y, (128).to_bytes(16, 'big'))
+        self.assertEqual(y.to_bytes(16, 'big'), bytes.fromhex('f38cbb1ad69223dcc3457ae5b6b0f885'))
+
+    def test_success(self):
+        for length in (0, 15, 16, 100):
+            message = bytes(range(length))
+            ciphertext = self.aes.encrypt_aead(message, self.iv, b'header')
+            self.assertEqual(len(ciphertext), length + 16)
+            # The payload is the CTR keystream from block 1 on.
+            self.assertEqual(ciphertext[:-16], self.aes.ctr_crypt(message, self.iv, offset=16))
+            self.assertEqual(self.aes.decrypt_aead(ciphertext, self.iv, b'header'), message)
+
+    def test_integrity(self):
+        ciphertext = self.aes.encrypt_aead(b'secret message', self.iv, b'header')
+        for i in (0, len(ciphertext) - 1):
+            tampered = bytearray(ciphertext)
+            tampered[i] ^= 1
+            with self.assertRaises(AssertionError):
+                self.aes.decrypt_aead(bytes(tampered), self.iv, b'header')
+        with self.assertRaises(AssertionError):
+            self.aes.decrypt_aead(ciphertext, self.iv, b'Header')
+
+
+class TestSector(unittest.TestCase):
+    """
+    Tests the sector (disk) mode and its bulk form.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.aes.sector_size = 64
+        self.data = bytes(range(256))
+
+    def test_block_tweaks(self):
+        ciphertext = self.aes.encrypt_sector(self.data[:64], 7)
+        self.assertEqual(len(ciphertext), 64)
+        self.assertEqual(ciphertext[16:32], self.aes.encrypt_block(self.data[16:32], 7 * 4 + 1, mod_aes.SECTOR_TWEAK_IV))
+        self.assertNotEqual(ciphertext, self.aes.encrypt_sector(self.data[:64], 8))
+        self.assertEqual(self.aes.decrypt_sector(ciphertext, 7), self.data[:64])
+
+    def test_bulk(self):
+        from concurrent.futures import ThreadPoolExecutor
+        expected = b''.join(self.aes.encrypt_sector(self.data[i:i+64], 3 + i // 64) for i in range(0, 256, 64))
+        self.assertEqual(self.aes.encrypt_sectors(self.data, 3), expected)
+        self.assertEqual(self.aes.decrypt_sectors(expected, [3, 4, 5, 6]), self.data)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(self.aes.encrypt_sectors(self.data, [3, 4, 5, 6], executor=executor), expected)
+
+
+class TestSegmented(unittest.TestCase):
+    """
+    Tests the segmented container: whole, streamed, random access and tampering.
+    """
+    def setUp(self):
+        self.cipher = mod_aes.SegmentedCipher(b'master key', b'\x05' * 16, 1000, segment_size=64)
+        self.message = bytes(range(200))
+        self.container = self.cipher.encrypt(self.message)
+
+    def test_success(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.assertEqual(self.cipher.segment_count(len(self.container)), 4)
+        self.assertEqual(decrypt(b'master key', self.container, 1000), self.message)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(decrypt(b'master key', self.container, 1000, executor), self.message)
+        self.assertEqual(decrypt(b'master key', encrypt(b'master key', b'', 1000, mode='segmented'), 1000), b'')
+
+    def test_random_access(self):
+        for i in range(4):
+            self.assertEqual(self.cipher.read_segment(self.container, i), self.message[64 * i:64 * i + 64])
+
+    def test_stream(self):
+        import io
+        container = b''.join(mod_aes.encrypt_stream(b'master key', io.BytesIO(self.message), 1000, 64))
+        plaintext = b''.join(mod_aes.decrypt_stream(b'master key', io.BytesIO(container), 1000))
+        self.assertEqual(plaintext, self.message)
+
+    def test_integrity(self):
+        stride = 64 + 16
+        header = mod_aes.CONTAINER_HEADER_SIZE
+        # Truncated at a segment boundary.
+        with self.assertRaises(AssertionError):
+            self.cipher.decrypt(self.container[:header + 2 * stride])
+        # Two segments swapped.
+        swapped = (self.container[:header] + self.container[header + stride:header + 2 * stride] +
+                   self.container[header:header + stride] + self.container[header + 2 * stride:])
+        with self.assertRaises(AssertionError):
+            self.cipher.decrypt(swapped)
+
+
+class TestFiles(unittest.TestCase):
+    """
+    Tests the mmap-backed file encryption, to a new file and in place.
+    """
+    def setUp(self):
+        import os
+        import tempfile
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.dir.name, name)
+        self.message = bytes(range(256)) * 300
+        with open(self.path('plain'), 'wb') as f:
+            f.write(self.message)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def read(self, name):
+        with open(self.path(name), 'rb') as f:
+            return f.read()
+
+    def test_container(self):
+        mod_aes.encrypt_file(b'key', self.path('plain'), self.path('enc'), 1000)
+        self.assertEqual(mod_aes.parse_header(self.read('enc'))[0], 'segmented')
+        self.assertEqual(decrypt(b'key', self.read('enc'), 1000), self.message)
+        mod_aes.decrypt_file(b'key', self.path('enc'), self.path('dec'), 1000)
+        self.assertEqual(self.read('dec'), self.message)
+
+    def test_in_place(self):
+        mod_aes.encrypt_file(b'key', self.path('plain'), workload=1000)
+        ciphertext = self.read('plain')
+        self.assertEqual(len(ciphertext), len(self.message) + mod_aes.FILE_TRAILER_SIZE)
+        self.assertNotEqual(ciphertext[:len(self.message)], self.message)
+        with open(self.path('tampered'), 'wb') as f:
+            f.write(b'x' + ciphertext[1:])
+        with self.assertRaises(AssertionError):
+            mod_aes.decrypt_file(b'key', self.path('tampered'), workload=1000)
+        self.assertEqual(self.read('tampered')[1:], ciphertext[1:])
+        mod_aes.decrypt_file(b'key', self.path('plain'), workload=1000)
+        self.assertEqual(self.read('plain'), self.message)
+
+    def test_in_place_interrupted(self):
+        """ The salt is on disk before any data is overwritten. """
+        from unittest import mock
+        with mock.patch.object(AES, 'encrypt_aead_into', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                mod_aes.encrypt_file(b'key', self.path('plain'), workload=1000)
+        trailer = self.read('plain')[len(self.message):]
+        self.assertEqual(len(trailer), mod_aes.FILE_TRAILER_SIZE)
+        self.assertEqual(trailer[mod_aes.SALT_SIZE:-mod_aes.HEADER_SIZE], bytes(mod_aes.TAG_SIZE))
+        with self.assertRaises(AssertionError):
+            mod_aes.decrypt_file(b'key', self.path('plain'), workload=1000)
+
+
+class TestAsync(unittest.TestCase):
+    """
+    Tests the asyncio stream API against the synchronous container format.
+    """
+    class Writer:
+        def __init__(self):
+            self.data = bytearray()
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+    def pipe(self, function, data, *args):
+        import asyncio
+
+        async def run():
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            writer = TestAsync.Writer()
+            await function(b'key', reader, writer, 1000, None, *args)
+            return bytes(writer.data)
+        return asyncio.run(run())
+
+    def test_round_trip(self):
+        for message in (b'', bytes(range(256)) * 3):
+            container = self.pipe(mod_aes.encrypt_async, message, 2, 64)
+            self.assertEqual(decrypt(b'key', container, 1000), message)
+            self.assertEqual(self.pipe(mod_aes.decrypt_async, container, 3), message)
+
+    def test_pool_ciphers_bounded(self):
+        for _ in range(mod_aes.POOL_CIPHER_CACHE_SIZE + 3):
+            self.pipe(mod_aes.encrypt_async, b'message')
+        self.assertLessEqual(len(mod_aes._pool_ciphers), mod_aes.POOL_CIPHER_CACHE_SIZE)
+        mod_aes.clear_pool_ciphers()
+        self.assertEqual(len(mod_aes._pool_ciphers), 0)
+
+    def test_integrity(self):
+        container = bytearray(self.pipe(mod_aes.encrypt_async, bytes(200), 2, 64))
+        container[-1] ^= 1
+        with self.assertRaises(AssertionError):
+            self.pipe(mod_aes.decrypt_async, bytes(container))
+
+
+class TestKeyring(unittest.TestCase):
+    """
+    Tests session blobs: one PBKDF2 per session, per-message HKDF keys.
+    """
+    def setUp(self):
+        self.keyring = mod_aes.Keyring(b'key', workload=1000, cache_size=2)
+
+    def test_round_trip(self):
+        for mode in ('cbc', 'aead'):
+            ciphertext = self.keyring.encrypt(b'message', mode)
+            self.assertEqual(mod_aes.parse_header(ciphertext), (mode, mod_aes.FLAG_SESSION))
+            self.assertEqual(self.keyring.decrypt(ciphertext), b'message')
+            self.assertEqual(decrypt(b'key', ciphertext, 1000), b'message')
+
+    def test_fresh_keys(self):
+        first, second = self.keyring.encrypt(b'message'), self.keyring.encrypt(b'message')
+        self.assertNotEqual(first[-16:], second[-16:])
+        self.assertEqual(len(self.keyring._session_keys), 0)
+        self.assertEqual(len(self.keyring._ciphers), 2)
+
+    def test_other_session(self):
+        ciphertext = mod_aes.Keyring(b'key', workload=1000).encrypt(b'message', 'aead')
+        self.assertEqual(self.keyring.decrypt(ciphertext), b'message')
+        with self.assertRaises(AssertionError):
+            mod_aes.Keyring(b'other', workload=1000).decrypt(ciphertext)
+
+    def test_bounded_sessions_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        keyring = mod_aes.Keyring(b'key', workload=1000, cache_size=2, session_cache_size=2)
+        ciphertexts = [mod_aes.Keyring(b'key', workload=1000).encrypt(b'%d' % i) for i in range(4)]
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(keyring.decrypt, ciphertexts * 3))
+        self.assertEqual(results, [b'%d' % i for i in range(4)] * 3)
+        self.assertEqual(len(keyring._session_keys), 2)
+        self.assertEqual(len(keyring._ciphers), 2)
+
+    def test_integrity(self):
+        ciphertext = bytearray(self.keyring.encrypt(b'message'))
+        ciphertext[mod_aes.HEADER_SIZE] ^= 1
+        with self.assertRaises(AssertionError):
+            self.keyring.decrypt(bytes(ciphertext))
+
+
+class TestKeyCache(unittest.TestCase):
+    """
+    Tests the opt-in derived-key cache of `decrypt`.
+    """
+    def setUp(self):
+        self.now = 0
+        self.cache = mod_aes.KeyCache(max_size=2, ttl=10, clock=lambda: self.now)
+        self.blobs = [encrypt(b'key', b'message', 1000, mode) for mode in ('cbc', 'aead', 'segmented')]
+
+    def test_hits(self):
+        for _ in range(2):
+            for blob in self.blobs[:2]:
+                self.assertEqual(decrypt(b'key', blob, 1000, cache=self.cache), b'message')
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 2))
+        with self.assertRaises(AssertionError):
+            decrypt(b'other', self.blobs[0], 1000, cache=self.cache)
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_eviction_wipes(self):
+        with self.cache.lease(b'key', bytes(16), 1000) as (keys, aes):
+            entry = next(iter(self.cache._entries.values()))
+            for blob in self.blobs:
+                decrypt(b'key', blob, 1000, cache=self.cache)
+            self.assertEqual(len(self.cache), 2)
+            # Evicted while leased: still usable.
+            self.assertIsInstance(keys[0], bytes)
+            self.assertEqual(aes.decrypt_block(aes.encrypt_block(bytes(16))), bytes(16))
+        self.assertIsNone(entry.keys)
+        self.assertEqual(vars(aes), {})
+
+    def test_wipe(self):
+        aes = AES(bytes(range(16)), engine='bytes')
+        aes.decrypt_block(aes.encrypt_block(bytes(16)))
+        aes.encrypt_aead(b'message', bytes(16))
+        schedules = aes._key_matrices, aes._round_key_ints, aes._ghash._tables[0]
+        aes.wipe()
+        aes.wipe()
+        self.assertEqual(vars(aes), {})
+        self.assertFalse(any(any(k) for k in schedules[0]))
+        self.assertFalse(any(schedules[1]) or any(schedules[2]))
+
+    def test_executor_and_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        cache = mod_aes.KeyCache(max_size=1)
+        blobs = [encrypt(b'key', bytes(100), 1000, mode) for mode in ('segmented', 'aead', 'cbc', 'segmented')]
+        with ThreadPoolExecutor(4) as executor:
+            self.assertEqual(decrypt(b'key', blobs[0], 1000, executor, cache), bytes(100))
+            results = list(executor.map(lambda blob: decrypt(b'key', blob, 1000, cache=cache), blobs * 5))
+        self.assertEqual(results, [bytes(100)] * 20)
+
+    def test_ttl(self):
+        decrypt(b'key', self.blobs[0], 1000, cache=self.cache)
+        self.now = 10
+        decrypt(b'key', self.blobs[0], 1000, cache=self.cache)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl_purges_all_expired(self):
+        cache = mod_aes.KeyCache(max_size=10, ttl=10, clock=lambda: self.now)
+        with cache.lease(b'key', bytes(16), 1000) as (keys, aes):
+            entry = next(iter(cache._entries.values()))
+        self.now = 1000
+        for i in range(5):
+            with cache.lease(b'key', bytes([i + 1]) * 16, 1000):
+                pass
+        self.assertEqual(len(cache), 5)
+        self.assertIsNone(entry.keys)
+        self.assertEqual(vars(aes), {})
+        self.now = 2000
+        cache.purge()
+        self.assertEqual(len(cache), 0)
+
+
+class TestEnvelope(unittest.TestCase):
+    """
+    Tests the envelope format: password changes only rewrap the data key.
+    """
+    def test_key_wrap(self):
+        aes = AES(bytes(range(16)))
+        key = bytes(range(100, 132))
+        wrapped = mod_aes.wrap_key(aes, key)
+        self.assertEqual(len(wrapped), mod_aes.WRAPPED_KEY_SIZE)
+        self.assertEqual(mod_aes.unwrap_key(aes, wrapped), key)
+        with self.assertRaises(AssertionError):
+            mod_aes.unwrap_key(AES(bytes(16)), wrapped)
+
+    def test_rekey(self):
+        message = bytes(i % 251 for i in range(5000))
+        ciphertext = encrypt(b'old', message, 1000, 'envelope')
+        self.assertEqual(decrypt(b'old', ciphertext, 1000), message)
+        rekeyed = mod_aes.rekey(ciphertext, b'old', b'new', 1000)
+        self.assertEqual(rekeyed[mod_aes.ENVELOPE_HEADER_SIZE:], ciphertext[mod_aes.ENVELOPE_HEADER_SIZE:])
+        self.assertEqual(decrypt(b'new', rekeyed, 1000), message)
+        with self.assertRaises(AssertionError):
+            decrypt(b'old', rekeyed, 1000)
+        with self.assertRaises(AssertionError):
+            mod_aes.rekey(rekeyed, b'old', b'other', 1000)
+
+    def test_rekey_file(self):
+        import os, tempfile
+        ciphertext = encrypt(b'old', b'message', 1000, 'envelope')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'blob')
+            with open(path, 'wb') as f:
+                f.write(ciphertext)
+            mod_aes.rekey_file(path, b'old', b'new', 1000)
+            with open(path, 'rb') as f:
+                self.assertEqual(decrypt(b'new', f.read(), 1000), b'message')
+
+    def test_integrity(self):
+        ciphertext = bytearray(encrypt(b'key', b'message', 1000, 'envelope'))
+        ciphertext[-1] ^= 1
+        with self.assertRaises(AssertionError):
+            decrypt(b'key', bytes(ciphertext), 1000)
+
+
+class TestCompression(unittest.TestCase):
+    """
+    Tests the optional compression stage of `encrypt` and `encrypt_stream`.
+    """
+    message = b'{"id": 1, "name": "user"}, ' * 2000
+
+    def test_round_trip(self):
+        for mode in ('cbc', 'aead', 'segmented', 'envelope'):
+            for method in ('zlib', 'lzma'):
+                ciphertext = encrypt(b'key', self.message, 1000, mode, compress=method)
+                self.assertEqual(mod_aes.parse_header(ciphertext)[1], mod_aes.COMPRESSION_FLAGS[method])
+                self.assertLess(len(ciphertext), len(self.message) // 5)
+                self.assertEqual(decrypt(b'key', ciphertext, 1000), self.message)
+
+    def test_incompressible(self):
+        import os
+        noise = os.urandom(20000)
+        self.assertFalse(mod_aes.should_compress(noise))
+        self.assertFalse(mod_aes.should_compress(b'short'))
+        ciphertext = encrypt(b'key', noise, 1000, 'aead', compress='zlib')
+        self.assertEqual(mod_aes.parse_header(ciphertext), ('aead', 0))
+
+    def test_stream(self):
+        import io
+        pieces = list(mod_aes.encrypt_stream(b'key', io.BytesIO(self.message), 1000, 1024, 'zlib'))
+        container = b''.join(pieces)
+        self.assertEqual(mod_aes.parse_header(container), ('segmented', mod_aes.COMPRESSION_FLAGS['zlib']))
+        chunks = list(mod_aes.decrypt_stream(b'key', io.BytesIO(container), 1000))
+        self.assertEqual(b''.join(chunks), self.message)
+        self.assertLessEqual(max(map(len, chunks)), 1024)
+        self.assertEqual(decrypt(b'key', container, 1000), self.message)
+
+    def test_bounded_chunks(self):
+        import zlib
+        chunks = mod_aes.decompress_chunks([zlib.compress(bytes(10 ** 6))], mod_aes.COMPRESSION_FLAGS['zlib'], 4096)
+        self.assertEqual(sum(len(chunk) for chunk in chunks if len(chunk) <= 4096), 10 ** 6)
+
 
 class TestCbc(unittest.TestCase):
     """
@@ -84,6 +802,13 @@ class TestCbc(unittest.TestCase):
         # Since len(message) < block size, padding won't create a new block.
         self.assertEqual(len(ciphertext), 16)
 
+    def test_memoryview(self):
+        """ Buffers such as memoryviews are accepted for the data and the IV. """
+        message = self.message * 5
+        ciphertext = self.aes.encrypt_cbc(message, self.iv)
+        self.assertEqual(self.aes.encrypt_cbc(memoryview(message), memoryview(self.iv)), ciphertext)
+        self.assertEqual(self.aes.decrypt_cbc(memoryview(ciphertext), memoryview(self.iv)), message)
+
     def test_wrong_iv(self):
         """ CBC mode should verify the IVs are of correct length."""
         with self.assertRaises(AssertionError):
@@ -141,6 +866,13 @@ class TestPcbc(unittest.TestCase):
         # Since len(message) < block size, padding won't create a new block.
         self.assertEqual(len(ciphertext), 16)
 
+    def test_memoryview(self):
+        """ Buffers such as memoryviews are accepted for the data and the IV. """
+        message = self.message * 5
+        ciphertext = self.aes.encrypt_pcbc(message, self.iv)
+        self.assertEqual(self.aes.encrypt_pcbc(memoryview(message), memoryview(self.iv)), ciphertext)
+        self.assertEqual(self.aes.decrypt_pcbc(memoryview(ciphertext), memoryview(self.iv)), message)
+
     def test_wrong_iv(self):
         """ CBC mode should verify the IVs are of correct length."""
         with self.assertRaises(AssertionError):
@@ -348,6 +1080,27 @@ class TestCtr(unittest.TestCase):
         ciphertext = self.aes.encrypt_ctr(long_message, self.iv)
         self.assertEqual(self.aes.decrypt_ctr(ciphertext, self.iv), long_message)
 
+    def test_seek(self):
+        message = bytes(range(256)) * 2
+        ciphertext = self.aes.encrypt_ctr(message, self.iv)
+        for a, b in ((0, 5), (7, 40), (16, 32), (100, 512)):
+            self.assertEqual(self.aes.ctr_crypt(ciphertext[a:b], self.iv, offset=a), message[a:b])
+
+    def test_counter_wraps(self):
+        iv = b'\xFF' * 16
+        ciphertext = self.aes.encrypt_ctr(b'M' * 48, iv)
+        keystream = self.aes.encrypt_block(bytes(16), 1, iv)
+        self.assertEqual(ciphertext[16:32], mod_aes.xor_bytes(b'M' * 16, keystream))
+
+    def test_executor(self):
+        from concurrent.futures import ThreadPoolExecutor
+        self.aes.pool_chunk_blocks = 3
+        message = bytes(range(256)) * 2
+        ciphertext = self.aes.encrypt_ctr(message, self.iv)
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(self.aes.decrypt_ctr(ciphertext, self.iv, executor=executor), message)
+            self.assertEqual(self.aes.ctr_crypt(ciphertext[40:300], self.iv, 40, executor), message[40:300])
+
 class TestFunctions(unittest.TestCase):
     """
     Tests the module functions `encrypt` and `decrypt`, as well as basic
@@ -403,6 +1156,80 @@ class TestFunctions(unittest.TestCase):
             self.decrypt(self.key, ciphertext)
 
 
+    def test_aead(self):
+        ciphertext = encrypt(self.key, self.message, 10000, mode='aead')
+        self.assertEqual(mod_aes.parse_header(ciphertext), ('aead', 0))
+        self.assertEqual(self.decrypt(self.key, ciphertext), self.message)
+        with self.assertRaises(AssertionError):
+            self.decrypt(self.key, ciphertext[:-1] + b'a')
+
+    def test_many(self):
+        from concurrent.futures import ThreadPoolExecutor
+        messages = [self.message, b'', 'text']
+        with ThreadPoolExecutor(2) as executor:
+            ciphertexts = list(mod_aes.encrypt_many(self.key, messages, 10000, executor=executor))
+            ciphertexts[1] = ciphertexts[1][:-1] + b'a'
+            results = list(mod_aes.decrypt_many(self.key, ciphertexts + [b'short'], 10000, executor=executor))
+        self.assertEqual(results[0], self.message)
+        self.assertIsInstance(results[1], AssertionError)
+        self.assertEqual(results[2], b'text')
+        self.assertIsInstance(results[3], AssertionError)
+
+    def test_many_process_pool(self):
+        ciphertexts = mod_aes.encrypt_many(self.key, [self.message] * 3, 10000, mode='aead')
+        self.assertEqual(list(mod_aes.decrypt_many(self.key, ciphertexts, 10000)), [self.message] * 3)
+
+    def test_many_bounded(self):
+        """ Results stream out of an unbounded input with a bounded window. """
+        from concurrent.futures import ThreadPoolExecutor
+        from itertools import count, islice
+        consumed = []
+        plaintexts = (consumed.append(i) or b'%d' % i for i in count())
+        with ThreadPoolExecutor(2) as executor:
+            results = mod_aes.encrypt_many(self.key, plaintexts, 1000, executor=executor, chunksize=2, max_in_flight=3)
+            first = list(islice(results, 3))
+            results.close()
+        self.assertEqual([decrypt(self.key, c, 1000) for c in first], [b'0', b'1', b'2'])
+        self.assertLessEqual(len(consumed), 2 * (3 + 1))
+
+    def test_tampered_versioned_no_fallback(self):
+        """ A tampered versioned blob fails after one key derivation. """
+        from unittest import mock
+        for mode in ('cbc', 'envelope'):
+            ciphertext = bytearray(encrypt(self.key, bytes(32), 1000, mode))
+            ciphertext[-1] ^= 1
+            with mock.patch.object(mod_aes, 'get_key_iv', wraps=mod_aes.get_key_iv) as get_key_iv:
+                with self.assertRaises(AssertionError):
+                    decrypt(self.key, bytes(ciphertext), 1000)
+            self.assertEqual(get_key_iv.call_count, 1)
+
+    def test_public_api(self):
+        namespace = {}
+        exec('from mod_aes import *', namespace)
+        for name in (
+            'KeystreamReservoir',
+            'ModeContext',
+            'GHash',
+            'SegmentedCipher', 'encrypt_stream', 'decrypt_stream',
+            'encrypt_file', 'decrypt_file',
+            'encrypt_async', 'decrypt_async',
+            'encrypt_many', 'decrypt_many', 'records_pool', 'shutdown_records_pool',
+            'Keyring', 'hkdf',
+            'KeyCache',
+            'wrap_key', 'unwrap_key', 'rekey', 'rekey_file',
+            'should_compress', 'compress_payload', 'decompress_payload', 'decompress_chunks',
+        ):
+            self.assertIn(name, namespace)
+
+    def test_legacy_format(self):
+        """ Headerless HMAC || salt || CBC blobs still decrypt. """
+        salt = b'\x05' * 16
+        key, hmac_key, iv = mod_aes.get_key_iv(self.key, salt, 10000)
+        ciphertext = AES(key).encrypt_cbc(self.message, iv)
+        hmac = mod_aes.new_hmac(hmac_key, salt + ciphertext, 'sha256').digest()
+        self.assertEqual(self.decrypt(self.key, hmac + salt + ciphertext), self.message)
+
+
 def run():
     unittest.main()
 
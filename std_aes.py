@@ -12,6 +12,14 @@ Although this is an exercise, the `encrypt` and `decrypt` functions should
 provide reasonable security to encrypted messages.
 """
 
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    # NumPy is optional; the batch APIs fall back to pure Python without it.
+    np = None
+
 
 s_box = (
     0x63, 0x7C, 0x77, 0x7B, 0xF2, 0x6B, 0x6F, 0xC5, 0x30, 0x01, 0x67, 0x2B, 0xFE, 0xD7, 0xAB, 0x76,
@@ -113,6 +121,101 @@ def inv_mix_columns(s):
     mix_columns(s)
 
 
+def _build_enc_tables():
+    """
+    Builds the four encryption T-tables. Each entry fuses SubBytes and
+    MixColumns for one byte of a column; words are big-endian, with row 0 in
+    the most significant byte.
+    """
+    te0 = []
+    for x in range(256):
+        s = s_box[x]
+        s2 = xtime(s)
+        te0.append((s2 << 24) | (s << 16) | (s << 8) | (s2 ^ s))
+    te1 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in te0]
+    te2 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in te1]
+    te3 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in te2]
+    return tuple(te0), tuple(te1), tuple(te2), tuple(te3)
+
+te0, te1, te2, te3 = _build_enc_tables()
+
+
+def gf_mul(a, b):
+    """ Multiplies two bytes in GF(2^8) modulo the AES polynomial. """
+    p = 0
+    while b:
+        if b & 1:
+            p ^= a
+        a = xtime(a)
+        b >>= 1
+    return p
+
+
+def _build_dec_tables():
+    """
+    Builds the four decryption T-tables for the equivalent inverse cipher,
+    fusing InvSubBytes and InvMixColumns. Same word layout as the encryption
+    tables.
+    """
+    td0 = []
+    for x in range(256):
+        s = inv_s_box[x]
+        td0.append((gf_mul(s, 14) << 24) | (gf_mul(s, 9) << 16) | (gf_mul(s, 13) << 8) | gf_mul(s, 11))
+    td1 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td0]
+    td2 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td1]
+    td3 = [((w >> 8) | (w << 24)) & 0xFFFFFFFF for w in td2]
+    return tuple(td0), tuple(td1), tuple(td2), tuple(td3)
+
+td0, td1, td2, td3 = _build_dec_tables()
+
+
+def sub_word(w):
+    """ Applies the S-box to each byte of a 32-bit word. """
+    return (s_box[w >> 24] << 24 | s_box[w >> 16 & 0xFF] << 16 |
+            s_box[w >> 8 & 0xFF] << 8 | s_box[w & 0xFF])
+
+
+def inv_mix_column_word(w):
+    """ Applies InvMixColumns to a single 32-bit column word. """
+    return (td0[s_box[w >> 24]] ^ td1[s_box[w >> 16 & 0xFF]] ^
+            td2[s_box[w >> 8 & 0xFF]] ^ td3[s_box[w & 0xFF]])
+
+
+# Translation tables for the byte-buffer rounds: bytes.translate applies
+# SubBytes (optionally fused with a MixColumns coefficient) to all 16 bytes.
+s_box_bytes = bytes(s_box)
+inv_s_box_bytes = bytes(inv_s_box)
+s_box_mul2 = bytes(gf_mul(s_box[x], 2) for x in range(256))
+s_box_mul3 = bytes(gf_mul(s_box[x], 3) for x in range(256))
+mul9 = bytes(gf_mul(x, 9) for x in range(256))
+mul11 = bytes(gf_mul(x, 11) for x in range(256))
+mul13 = bytes(gf_mul(x, 13) for x in range(256))
+mul14 = bytes(gf_mul(x, 14) for x in range(256))
+
+def byte_round_getters(gather):
+    """
+    Returns four itemgetters over the 16 state bytes for one round: getter k
+    yields, at position 4c + r, the byte that row r + k of output column c
+    takes from the gather plan. MixColumns output byte r is then
+    2*g0 ^ 3*g1 ^ g2 ^ g3.
+    """
+    return tuple(itemgetter(*[4 * gather[c][(r + k) % 4] + (r + k) % 4 for c in range(4) for r in range(4)])
+                 for k in range(4))
+
+def byte_inv_round_getters(inv_gather):
+    """
+    Returns four itemgetters fusing InvMixColumns with the inverse row gather:
+    output byte r of column c is 14*g0 ^ 11*g1 ^ 13*g2 ^ 9*g3, read from
+    column inv_gather[c][r] before the inverse shift.
+    """
+    return tuple(itemgetter(*[4 * inv_gather[c][r] + (r + k) % 4 for c in range(4) for r in range(4)])
+                 for k in range(4))
+
+# Row gather plans of the fixed ShiftRows: output (c, r) reads column c +/- r.
+SHIFT_ROWS_GATHER = tuple(tuple((c + r) % 4 for r in range(4)) for c in range(4))
+INV_SHIFT_ROWS_GATHER = tuple(tuple((c - r) % 4 for r in range(4)) for c in range(4))
+
+
 r_con = (
     0x00, 0x01, 0x02, 0x04, 0x08, 0x10, 0x20, 0x40,
     0x80, 0x1B, 0x36, 0x6C, 0xD8, 0xAB, 0x4D, 0x9A,
@@ -127,11 +230,30 @@ def bytes2matrix(text):
 
 def matrix2bytes(matrix):
     """ Converts a 4x4 matrix into a 16-byte array.  """
-    return bytes(sum(matrix, []))
+    return bytes(b for column in matrix for b in column)
+
+# Below this size the big-int XOR beats NumPy's call overhead.
+XOR_NUMPY_MIN = 256
 
-def xor_bytes(a, b):
-    """ Returns a new byte array with the elements xor'ed. """
-    return bytes(i^j for i, j in zip(a, b))
+def xor_bytes(a, b, out=None):
+    """
+    XORs two byte buffers (bytes, bytearray or memoryview) as one bulk
+    operation, truncating to the shorter one. Returns new bytes, or writes the
+    result into the writable buffer `out` (which may alias `a`) and returns it.
+    """
+    n = min(len(a), len(b))
+    if np is not None and n >= XOR_NUMPY_MIN:
+        x = np.frombuffer(a, dtype=np.uint8, count=n)
+        y = np.frombuffer(b, dtype=np.uint8, count=n)
+        if out is None:
+            return np.bitwise_xor(x, y).tobytes()
+        np.bitwise_xor(x, y, out=np.frombuffer(out, dtype=np.uint8, count=n))
+        return out
+    result = (int.from_bytes(a[:n], 'big') ^ int.from_bytes(b[:n], 'big')).to_bytes(n, 'big')
+    if out is None:
+        return result
+    out[:n] = result
+    return out
 
 def inc_bytes(a):
     """ Returns a new byte array with the value increment by 1 """
@@ -152,7 +274,7 @@ def pad(plaintext):
     """
     padding_len = 16 - (len(plaintext) % 16)
     padding = bytes([padding_len] * padding_len)
-    return plaintext + padding
+    return b''.join((plaintext, padding))
 
 def unpad(plaintext):
     """
@@ -166,8 +288,52 @@ def unpad(plaintext):
     return message
 
 def split_blocks(message, block_size=16, require_padding=True):
-        assert len(message) % block_size == 0 or not require_padding
-        return [message[i:i+16] for i in range(0, len(message), block_size)]
+    """
+    Iterates over the `block_size`-byte blocks of `message`, slicing each one
+    only when it is reached.
+    """
+    assert len(message) % block_size == 0 or not require_padding
+    return (message[i:i+block_size] for i in range(0, len(message), block_size))
+
+
+if np is not None:
+    np_s_box = np.array(s_box, dtype=np.uint8)
+    np_inv_s_box = np.array(inv_s_box, dtype=np.uint8)
+    np_xtime = np.array([xtime(x) for x in range(256)], dtype=np.uint8)
+    np_xtime2 = np_xtime[np_xtime]
+
+def np_mix_columns(state):
+    """ MixColumns over an (N, 16) uint8 state, using xtime table lookups. """
+    a = state.reshape(-1, 4, 4)
+    t = a[:, :, 0] ^ a[:, :, 1] ^ a[:, :, 2] ^ a[:, :, 3]
+    a = a ^ t[:, :, None] ^ np_xtime[a ^ np.roll(a, -1, axis=2)]
+    return a.reshape(-1, 16)
+
+def np_inv_mix_columns(state):
+    """ InvMixColumns over an (N, 16) uint8 state, see `inv_mix_columns`. """
+    a = state.reshape(-1, 4, 4)
+    u = np_xtime2[a[:, :, 0] ^ a[:, :, 2]]
+    v = np_xtime2[a[:, :, 1] ^ a[:, :, 3]]
+    a = a ^ np.stack((u, v, u, v), axis=2)
+    return np_mix_columns(a.reshape(-1, 16))
+
+def gather_index(gather):
+    """
+    Flattens a per-column row gather plan into a 16-entry index over the
+    column-major state bytes.
+    """
+    return [4 * gather[c][r] + r for c in range(4) for r in range(4)]
+
+def as_block_array(blocks):
+    """
+    Returns a writable (N, 16) uint8 copy of `blocks`, which may be an array
+    of any shape with 16N elements or a bytes-like object.
+    """
+    if isinstance(blocks, np.ndarray):
+        state = np.array(blocks, dtype=np.uint8).reshape(-1, 16)
+    else:
+        state = np.frombuffer(bytes(blocks), dtype=np.uint8).reshape(-1, 16).copy()
+    return state
 
 
 class AES:
@@ -178,47 +344,73 @@ class AES:
     management. Unless you need that, please use `encrypt` and `decrypt`.
     """
     rounds_by_key_size = {16: 10, 24: 12, 32: 14}
-    def __init__(self, master_key):
+    engines = ('ttable', 'bytes')
+    # Below this many blocks NumPy's per-call setup outweighs its vectorised rounds.
+    numpy_min_blocks = 16
+    def __init__(self, master_key, engine='ttable'):
         """
         Initializes the object with a given key.
+
+        `engine` selects the round implementation: 'ttable' runs on 32-bit
+        column words with fused SubBytes/MixColumns tables, 'bytes' keeps the
+        state in a 16-byte buffer driven by `bytes.translate`.
         """
         assert len(master_key) in AES.rounds_by_key_size
+        assert engine in AES.engines
         self.n_rounds = AES.rounds_by_key_size[len(master_key)]
         self._key_matrices = self._expand_key(master_key)
+        self.engine = engine
+        if engine == 'ttable':
+            self._encrypt_int = self._encrypt_int_ttable
+            self._decrypt_int = self._decrypt_int_ttable
+        else:
+            self._prepare_bytes_engine()
+            self._encrypt_int = self._encrypt_int_bytes
+            self._decrypt_int = self._decrypt_int_bytes
+        # Equivalent-inverse-cipher round keys, built on the first decryption.
+        self._dec_key_matrices = None
+        # Batch (NumPy) round keys and gather indices, built on first use.
+        self._np_round_keys = None
 
     def _expand_key(self, master_key):
         """
-        Expands and returns a list of key matrices for the given master_key.
+        Expands and returns a list of round keys for the given master_key.
+        Each round key is a tuple of four 32-bit column words.
         """
         # Initialize round keys with raw key material.
-        key_columns = bytes2matrix(master_key)
+        key_columns = [int.from_bytes(master_key[i:i+4], 'big') for i in range(0, len(master_key), 4)]
         iteration_size = len(master_key) // 4
 
         i = 1
         while len(key_columns) < (self.n_rounds + 1) * 4:
             # Copy previous word.
-            word = list(key_columns[-1])
+            word = key_columns[-1]
 
             # Perform schedule_core once every "row".
             if len(key_columns) % iteration_size == 0:
                 # Circular shift.
-                word.append(word.pop(0))
+                word = ((word << 8) | (word >> 24)) & 0xFFFFFFFF
                 # Map to S-BOX.
-                word = [s_box[b] for b in word]
+                word = sub_word(word)
                 # XOR with first byte of R-CON, since the others bytes of R-CON are 0.
-                word[0] ^= r_con[i]
+                word ^= r_con[i] << 24
                 i += 1
             elif len(master_key) == 32 and len(key_columns) % iteration_size == 4:
                 # Run word through S-box in the fourth iteration when using a
                 # 256-bit key.
-                word = [s_box[b] for b in word]
+                word = sub_word(word)
 
             # XOR with equivalent word from previous iteration.
-            word = xor_bytes(word, key_columns[-iteration_size])
-            key_columns.append(word)
+            key_columns.append(word ^ key_columns[-iteration_size])
+
+        # Group key words in rounds of four columns.
+        return [tuple(key_columns[4*i : 4*(i+1)]) for i in range(len(key_columns) // 4)]
 
-        # Group key words in 4x4 byte matrices.
-        return [key_columns[4*i : 4*(i+1)] for i in range(len(key_columns) // 4)]
+    def _round_key_matrix(self, i):
+        """
+        Materialises round key `i` as a 4x4 matrix for the list-based rounds.
+        """
+        return [list(word.to_bytes(4, 'big')) for word in self._key_matrices[i]]
 
     def encrypt_block(self, plaintext):
         """
@@ -226,21 +418,36 @@ class AES:
         """
         assert len(plaintext) == 16
 
-        plain_state = bytes2matrix(plaintext)
+        return self._encrypt_int(int.from_bytes(plaintext, 'big')).to_bytes(16, 'big')
 
-        add_round_key(plain_state, self._key_matrices[0])
+    def _encrypt_int_ttable(self, state):
+        """
+        Runs the AES rounds on a 128-bit block held as four 32-bit column
+        words, with SubBytes, ShiftRows and MixColumns fused into T-tables.
+        """
+        rk = self._key_matrices
+        k0, k1, k2, k3 = rk[0]
+        s0 = state >> 96 ^ k0
+        s1 = state >> 64 & 0xFFFFFFFF ^ k1
+        s2 = state >> 32 & 0xFFFFFFFF ^ k2
+        s3 = state & 0xFFFFFFFF ^ k3
 
         for i in range(1, self.n_rounds):
-            sub_bytes(plain_state)
-            shift_rows(plain_state)
-            mix_columns(plain_state)
-            add_round_key(plain_state, self._key_matrices[i])
-
-        sub_bytes(plain_state)
-        shift_rows(plain_state)
-        add_round_key(plain_state, self._key_matrices[-1])
-
-        return matrix2bytes(plain_state)
+            k0, k1, k2, k3 = rk[i]
+            s0, s1, s2, s3 = (
+                te0[s0 >> 24] ^ te1[s1 >> 16 & 0xFF] ^ te2[s2 >> 8 & 0xFF] ^ te3[s3 & 0xFF] ^ k0,
+                te0[s1 >> 24] ^ te1[s2 >> 16 & 0xFF] ^ te2[s3 >> 8 & 0xFF] ^ te3[s0 & 0xFF] ^ k1,
+                te0[s2 >> 24] ^ te1[s3 >> 16 & 0xFF] ^ te2[s0 >> 8 & 0xFF] ^ te3[s1 & 0xFF] ^ k2,
+                te0[s3 >> 24] ^ te1[s0 >> 16 & 0xFF] ^ te2[s1 >> 8 & 0xFF] ^ te3[s2 & 0xFF] ^ k3)
+
+        # Final round: SubBytes and ShiftRows only, no MixColumns.
+        k0, k1, k2, k3 = rk[-1]
+        return (
+            ((s_box[s0 >> 24] << 24 | s_box[s1 >> 16 & 0xFF] << 16 | s_box[s2 >> 8 & 0xFF] << 8 | s_box[s3 & 0xFF]) ^ k0) << 96 |
+            ((s_box[s1 >> 24] << 24 | s_box[s2 >> 16 & 0xFF] << 16 | s_box[s3 >> 8 & 0xFF] << 8 | s_box[s0 & 0xFF]) ^ k1) << 64 |
+            ((s_box[s2 >> 24] << 24 | s_box[s3 >> 16 & 0xFF] << 16 | s_box[s0 >> 8 & 0xFF] << 8 | s_box[s1 & 0xFF]) ^ k2) << 32 |
+            ((s_box[s3 >> 24] << 24 | s_box[s0 >> 16 & 0xFF] << 16 | s_box[s1 >> 8 & 0xFF] << 8 | s_box[s2 & 0xFF]) ^ k3)
+        )
 
     def decrypt_block(self, ciphertext):
         """
@@ -248,21 +455,180 @@ class AES:
         """
         assert len(ciphertext) == 16
 
-        cipher_state = bytes2matrix(ciphertext)
+        return self._decrypt_int(int.from_bytes(ciphertext, 'big')).to_bytes(16, 'big')
+
+    def _prepare_decryption(self):
+        """
+        Builds the equivalent-inverse-cipher round keys: InvMixColumns applied
+        to the inner round keys, in reverse order.
+        """
+        rk = self._key_matrices
+        dk = [rk[-1]]
+        for i in range(self.n_rounds - 1, 0, -1):
+            dk.append(tuple(inv_mix_column_word(w) for w in rk[i]))
+        dk.append(rk[0])
+        self._dec_key_matrices = dk
+
+    def _decrypt_int_ttable(self, state):
+        """
+        Runs the inverse AES rounds on a 128-bit block using the equivalent
+        inverse cipher and the decryption T-tables.
+        """
+        if self._dec_key_matrices is None:
+            self._prepare_decryption()
+        dk = self._dec_key_matrices
+        k0, k1, k2, k3 = dk[0]
+        s0 = state >> 96 ^ k0
+        s1 = state >> 64 & 0xFFFFFFFF ^ k1
+        s2 = state >> 32 & 0xFFFFFFFF ^ k2
+        s3 = state & 0xFFFFFFFF ^ k3
+
+        for i in range(1, self.n_rounds):
+            k0, k1, k2, k3 = dk[i]
+            s0, s1, s2, s3 = (
+                td0[s0 >> 24] ^ td1[s3 >> 16 & 0xFF] ^ td2[s2 >> 8 & 0xFF] ^ td3[s1 & 0xFF] ^ k0,
+                td0[s1 >> 24] ^ td1[s0 >> 16 & 0xFF] ^ td2[s3 >> 8 & 0xFF] ^ td3[s2 & 0xFF] ^ k1,
+                td0[s2 >> 24] ^ td1[s1 >> 16 & 0xFF] ^ td2[s0 >> 8 & 0xFF] ^ td3[s3 & 0xFF] ^ k2,
+                td0[s3 >> 24] ^ td1[s2 >> 16 & 0xFF] ^ td2[s1 >> 8 & 0xFF] ^ td3[s0 & 0xFF] ^ k3)
+
+        # Final round: InvSubBytes and InvShiftRows only.
+        k0, k1, k2, k3 = dk[-1]
+        return (
+            ((inv_s_box[s0 >> 24] << 24 | inv_s_box[s3 >> 16 & 0xFF] << 16 | inv_s_box[s2 >> 8 & 0xFF] << 8 | inv_s_box[s1 & 0xFF]) ^ k0) << 96 |
+            ((inv_s_box[s1 >> 24] << 24 | inv_s_box[s0 >> 16 & 0xFF] << 16 | inv_s_box[s3 >> 8 & 0xFF] << 8 | inv_s_box[s2 & 0xFF]) ^ k1) << 64 |
+            ((inv_s_box[s2 >> 24] << 24 | inv_s_box[s1 >> 16 & 0xFF] << 16 | inv_s_box[s0 >> 8 & 0xFF] << 8 | inv_s_box[s3 & 0xFF]) ^ k2) << 32 |
+            ((inv_s_box[s3 >> 24] << 24 | inv_s_box[s2 >> 16 & 0xFF] << 16 | inv_s_box[s1 >> 8 & 0xFF] << 8 | inv_s_box[s0 & 0xFF]) ^ k3)
+        )
+
+    def _prepare_bytes_engine(self):
+        """
+        Builds the 128-bit round keys and the itemgetter gathers used by the
+        byte-buffer rounds.
+        """
+        self._round_key_ints = [k0 << 96 | k1 << 64 | k2 << 32 | k3 for k0, k1, k2, k3 in self._key_matrices]
+        self._byte_getters = byte_round_getters(SHIFT_ROWS_GATHER)
+        self._byte_inv_getters = byte_inv_round_getters(INV_SHIFT_ROWS_GATHER)
+        self._byte_inv_shift = itemgetter(*gather_index(INV_SHIFT_ROWS_GATHER))
 
-        add_round_key(cipher_state, self._key_matrices[-1])
-        inv_shift_rows(cipher_state)
-        inv_sub_bytes(cipher_state)
+    def _encrypt_int_bytes(self, state):
+        """
+        Runs the AES rounds on a 16-byte buffer: SubBytes and the
+        MixColumns coefficients are `bytes.translate` calls, the row gather
+        an itemgetter, and AddRoundKey a 128-bit int XOR.
+        """
+        rk = self._round_key_ints
+        g0, g1, g2, g3 = self._byte_getters
+        st = (state ^ rk[0]).to_bytes(16, 'big')
+        for i in range(1, self.n_rounds):
+            sb = st.translate(s_box_bytes)
+            st = (int.from_bytes(g0(st.translate(s_box_mul2)), 'big') ^
+                  int.from_bytes(g1(st.translate(s_box_mul3)), 'big') ^
+                  int.from_bytes(g2(sb), 'big') ^ int.from_bytes(g3(sb), 'big') ^ rk[i]).to_bytes(16, 'big')
+        return int.from_bytes(g0(st.translate(s_box_bytes)), 'big') ^ rk[-1]
 
+    def _decrypt_int_bytes(self, state):
+        """
+        Runs the inverse AES rounds on a 16-byte buffer, with InvMixColumns
+        fused into the inverse row gather through the mul9/11/13/14 tables.
+        """
+        rk = self._round_key_ints
+        h0, h1, h2, h3 = self._byte_inv_getters
+        st = bytes(self._byte_inv_shift((state ^ rk[-1]).to_bytes(16, 'big'))).translate(inv_s_box_bytes)
+        for i in range(self.n_rounds - 1, 0, -1):
+            b = (int.from_bytes(st, 'big') ^ rk[i]).to_bytes(16, 'big')
+            st = (int.from_bytes(h0(b.translate(mul14)), 'big') ^ int.from_bytes(h1(b.translate(mul11)), 'big') ^
+                  int.from_bytes(h2(b.translate(mul13)), 'big') ^ int.from_bytes(h3(b.translate(mul9)), 'big')
+                  ).to_bytes(16, 'big').translate(inv_s_box_bytes)
+        return int.from_bytes(st, 'big') ^ rk[0]
+
+    def _np_prepare(self):
+        """
+        Builds the round keys as a (n_rounds + 1, 16) uint8 array and the
+        ShiftRows permutation as 16-byte gather indices for the batch rounds.
+        """
+        round_keys = np.array(
+            [list(b''.join(w.to_bytes(4, 'big') for w in round_key)) for round_key in self._key_matrices],
+            dtype=np.uint8)
+        self._np_gather = np.array(gather_index(SHIFT_ROWS_GATHER), dtype=np.intp)
+        self._np_inv_gather = np.array(gather_index(INV_SHIFT_ROWS_GATHER), dtype=np.intp)
+        # Published last: callers test only `_np_round_keys`, possibly from other threads.
+        self._np_round_keys = round_keys
+
+    def _encrypt_array(self, state):
+        """
+        Runs the AES rounds on an (N, 16) uint8 state: SubBytes is fancy
+        indexing, ShiftRows a column gather and MixColumns xtime table lookups.
+        """
+        if self._np_round_keys is None:
+            self._np_prepare()
+        rk = self._np_round_keys
+        gather = self._np_gather
+
+        state ^= rk[0]
+        for i in range(1, self.n_rounds):
+            state = np_mix_columns(np_s_box[state][:, gather])
+            state ^= rk[i]
+        state = np_s_box[state][:, gather]
+        state ^= rk[-1]
+        return state
+
+    def _decrypt_array(self, state):
+        """
+        Runs the inverse AES rounds on an (N, 16) uint8 state.
+        """
+        if self._np_round_keys is None:
+            self._np_prepare()
+        rk = self._np_round_keys
+        inv_gather = self._np_inv_gather
+
+        state ^= rk[-1]
+        state = np_inv_s_box[state[:, inv_gather]]
         for i in range(self.n_rounds - 1, 0, -1):
-            add_round_key(cipher_state, self._key_matrices[i])
-            inv_mix_columns(cipher_state)
-            inv_shift_rows(cipher_state)
-            inv_sub_bytes(cipher_state)
+            state ^= rk[i]
+            state = np_inv_s_box[np_inv_mix_columns(state)[:, inv_gather]]
+        state ^= rk[0]
+        return state
+
+    def _use_numpy(self, blocks):
+        """ Whether the batch APIs should run `blocks` through NumPy. """
+        if np is None:
+            return False
+        return isinstance(blocks, np.ndarray) or len(blocks) >= AES.numpy_min_blocks * 16
+
+    def encrypt_blocks(self, blocks):
+        """
+        Encrypts N independent 16-byte blocks in one call, giving the same
+        result as `encrypt_block` on each. `blocks` is an (N, 16) uint8 NumPy
+        array or a bytes-like object of 16N bytes; the result has the same
+        type.
+
+        Runs vectorised over all blocks when NumPy is installed, for arrays
+        and from `numpy_min_blocks` blocks.
+        """
+        if self._use_numpy(blocks):
+            state = self._encrypt_array(as_block_array(blocks))
+            return state if isinstance(blocks, np.ndarray) else state.tobytes()
+
+        data = bytes(blocks)
+        assert len(data) % 16 == 0
+        encrypt_int = self._encrypt_int
+        return b''.join(encrypt_int(int.from_bytes(data[i:i+16], 'big')).to_bytes(16, 'big')
+                        for i in range(0, len(data), 16))
 
-        add_round_key(cipher_state, self._key_matrices[0])
+    def decrypt_blocks(self, blocks):
+        """
+        Decrypts N independent 16-byte blocks in one call, giving the same
+        result as `decrypt_block` on each. Arguments as in `encrypt_blocks`.
+        """
+        if self._use_numpy(blocks):
+            state = self._decrypt_array(as_block_array(blocks))
+            return state if isinstance(blocks, np.ndarray) else state.tobytes()
 
-        return matrix2bytes(cipher_state)
+        data = bytes(blocks)
+        assert len(data) % 16 == 0
+        decrypt_int = self._decrypt_int
+        return b''.join(decrypt_int(int.from_bytes(data[i:i+16], 'big')).to_bytes(16, 'big')
+                        for i in range(0, len(data), 16))
 
     def encrypt_cbc(self, plaintext, iv):
         """
@@ -273,13 +639,13 @@ class AES:
 
         plaintext = pad(plaintext)
 
+        encrypt_int = self._encrypt_int
         blocks = []
-        previous = iv
-        for plaintext_block in split_blocks(plaintext):
+        previous = int.from_bytes(iv, 'big')
+        for i in range(0, len(plaintext), 16):
             # CBC mode encrypt: encrypt(plaintext_block XOR previous)
-            block = self.encrypt_block(xor_bytes(plaintext_block, previous))
-            blocks.append(block)
-            previous = block
+            previous = encrypt_int(int.from_bytes(plaintext[i:i+16], 'big') ^ previous)
+            blocks.append(previous.to_bytes(16, 'big'))
 
         return b''.join(blocks)
 
@@ -289,15 +655,14 @@ class AES:
         initialization vector (iv).
         """
         assert len(iv) == 16
+        assert len(ciphertext) % 16 == 0
+        n = len(ciphertext) // 16
 
-        blocks = []
-        previous = iv
-        for ciphertext_block in split_blocks(ciphertext):
-            # CBC mode decrypt: previous XOR decrypt(ciphertext)
-            blocks.append(xor_bytes(previous, self.decrypt_block(ciphertext_block)))
-            previous = ciphertext_block
-
-        return unpad(b''.join(blocks))
+        decrypt_int = self._decrypt_int
+        raw = b''.join(decrypt_int(int.from_bytes(ciphertext[i:i+16], 'big')).to_bytes(16, 'big')
+                       for i in range(0, 16 * n, 16))
+        # CBC mode decrypt: previous XOR decrypt(ciphertext), for all blocks at once
+        return unpad(xor_bytes(raw, b''.join((iv, ciphertext[:-16]))))
 
     def encrypt_pcbc(self, plaintext, iv):
         """
@@ -307,16 +672,16 @@ class AES:
         assert len(iv) == 16
 
         plaintext = pad(plaintext)
+        # plaintext_block XOR prev_plaintext does not depend on the ciphertext.
+        pre = xor_bytes(plaintext, bytes(16) + plaintext[:-16])
 
+        encrypt_int = self._encrypt_int
         blocks = []
-        prev_ciphertext = iv
-        prev_plaintext = bytes(16)
-        for plaintext_block in split_blocks(plaintext):
+        previous = int.from_bytes(iv, 'big')
+        for i in range(0, len(pre), 16):
             # PCBC mode encrypt: encrypt(plaintext_block XOR (prev_ciphertext XOR prev_plaintext))
-            ciphertext_block = self.encrypt_block(xor_bytes(plaintext_block, xor_bytes(prev_ciphertext, prev_plaintext)))
-            blocks.append(ciphertext_block)
-            prev_ciphertext = ciphertext_block
-            prev_plaintext = plaintext_block
+            previous = encrypt_int(int.from_bytes(pre[i:i+16], 'big') ^ previous)
+            blocks.append(previous.to_bytes(16, 'big'))
 
         return b''.join(blocks)
 
@@ -326,16 +691,21 @@ class AES:
         initialization vector (iv).
         """
         assert len(iv) == 16
+        assert len(ciphertext) % 16 == 0
+        n = len(ciphertext) // 16
+
+        decrypt_int = self._decrypt_int
+        raw = b''.join(decrypt_int(int.from_bytes(ciphertext[i:i+16], 'big')).to_bytes(16, 'big')
+                       for i in range(0, 16 * n, 16))
+        # Removing prev_ciphertext in bulk leaves plaintext_block XOR prev_plaintext.
+        raw = xor_bytes(raw, b''.join((iv, ciphertext[:-16])))
 
         blocks = []
-        prev_ciphertext = iv
-        prev_plaintext = bytes(16)
-        for ciphertext_block in split_blocks(ciphertext):
-            # PCBC mode decrypt: (prev_plaintext XOR prev_ciphertext) XOR decrypt(ciphertext_block)
-            plaintext_block = xor_bytes(xor_bytes(prev_ciphertext, prev_plaintext), self.decrypt_block(ciphertext_block))
-            blocks.append(plaintext_block)
-            prev_ciphertext = ciphertext_block
-            prev_plaintext = plaintext_block
+        previous = 0
+        for i in range(0, len(raw), 16):
+            # PCBC mode decrypt: (prev_ciphertext XOR prev_plaintext) XOR decrypt(ciphertext_block)
+            previous ^= int.from_bytes(raw[i:i+16], 'big')
+            blocks.append(previous.to_bytes(16, 'big'))
 
         return unpad(b''.join(blocks))
 
@@ -345,13 +715,16 @@ class AES:
         """
         assert len(iv) == 16
 
+        encrypt_int = self._encrypt_int
         blocks = []
-        prev_ciphertext = iv
-        for plaintext_block in split_blocks(plaintext, require_padding=False):
+        previous = int.from_bytes(iv, 'big')
+        full = 16 * (len(plaintext) // 16)
+        for i in range(0, full, 16):
             # CFB mode encrypt: plaintext_block XOR encrypt(prev_ciphertext)
-            ciphertext_block = xor_bytes(plaintext_block, self.encrypt_block(prev_ciphertext))
-            blocks.append(ciphertext_block)
-            prev_ciphertext = ciphertext_block
+            previous = int.from_bytes(plaintext[i:i+16], 'big') ^ encrypt_int(previous)
+            blocks.append(previous.to_bytes(16, 'big'))
+        if full < len(plaintext):
+            blocks.append(xor_bytes(plaintext[full:], encrypt_int(previous).to_bytes(16, 'big')))
 
         return b''.join(blocks)
 
@@ -360,15 +733,26 @@ class AES:
         Decrypts `ciphertext` with the given initialization vector (iv).
         """
         assert len(iv) == 16
+        n = (len(ciphertext) + 15) // 16
 
-        blocks = []
-        prev_ciphertext = iv
-        for ciphertext_block in split_blocks(ciphertext, require_padding=False):
-            # CFB mode decrypt: ciphertext XOR decrypt(prev_ciphertext)
-            plaintext_block = xor_bytes(ciphertext_block, self.encrypt_block(prev_ciphertext))
-            blocks.append(plaintext_block)
-            prev_ciphertext = ciphertext_block
+        # CFB mode decrypt: ciphertext XOR encrypt(prev_ciphertext). Every
+        # prev_ciphertext is known, so the keystream is built in one pass.
+        encrypt_int = self._encrypt_int
+        inputs = b''.join((iv, ciphertext))[:16 * n]
+        keystream = b''.join(encrypt_int(int.from_bytes(inputs[i:i+16], 'big')).to_bytes(16, 'big')
+                             for i in range(0, 16 * n, 16))
+        return xor_bytes(ciphertext, keystream)
 
+    def _ofb_keystream(self, iv, n):
+        """
+        Returns `n` blocks of OFB keystream.
+        """
+        encrypt_int = self._encrypt_int
+        blocks = []
+        previous = int.from_bytes(iv, 'big')
+        for _ in range(n):
+            previous = encrypt_int(previous)
+            blocks.append(previous.to_bytes(16, 'big'))
         return b''.join(blocks)
 
     def encrypt_ofb(self, plaintext, iv):
@@ -376,66 +760,52 @@ class AES:
         Encrypts `plaintext` using OFB mode initialization vector (iv).
         """
         assert len(iv) == 16
-
-        blocks = []
-        previous = iv
-        for plaintext_block in split_blocks(plaintext, require_padding=False):
-            # OFB mode encrypt: plaintext_block XOR encrypt(previous)
-            block = self.encrypt_block(previous)
-            ciphertext_block = xor_bytes(plaintext_block, block)
-            blocks.append(ciphertext_block)
-            previous = block
-
-        return b''.join(blocks)
+        n = (len(plaintext) + 15) // 16
+        # OFB mode encrypt: plaintext XOR keystream
+        return xor_bytes(plaintext, self._ofb_keystream(iv, n))
 
     def decrypt_ofb(self, ciphertext, iv):
         """
         Decrypts `ciphertext` using OFB mode initialization vector (iv).
         """
         assert len(iv) == 16
+        n = (len(ciphertext) + 15) // 16
+        # OFB mode decrypt: ciphertext XOR keystream
+        return xor_bytes(ciphertext, self._ofb_keystream(iv, n))
 
-        blocks = []
-        previous = iv
-        for ciphertext_block in split_blocks(ciphertext, require_padding=False):
-            # OFB mode decrypt: ciphertext XOR encrypt(previous)
-            block = self.encrypt_block(previous)
-            plaintext_block = xor_bytes(ciphertext_block, block)
-            blocks.append(plaintext_block)
-            previous = block
+    def _ctr_keystream(self, iv, n, start=0):
+        """
+        Returns `n` blocks of CTR keystream from block `start` on, block i
+        being encrypt((iv + i) mod 2^128), computed as one batch.
+        """
+        nonce = int.from_bytes(iv, 'big')
+        counters = b''.join(((nonce + i) & 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF).to_bytes(16, 'big')
+                            for i in range(start, start + n))
+        return self.encrypt_blocks(counters)
 
-        return b''.join(blocks)
+    def ctr_crypt(self, data, iv, offset=0):
+        """
+        Encrypts or decrypts `data` in CTR mode as the bytes at `offset` of a
+        message under the nonce/IV `iv`, without touching earlier blocks.
+        """
+        assert len(iv) == 16
+        assert offset >= 0
+        first, skip = divmod(offset, 16)
+        n = (skip + len(data) + 15) // 16
+        # CTR mode: data XOR encrypt(nonce + block number)
+        return xor_bytes(data, memoryview(self._ctr_keystream(iv, n, first))[skip:])
 
     def encrypt_ctr(self, plaintext, iv):
         """
         Encrypts `plaintext` using CTR mode with the given nounce/IV.
         """
-        assert len(iv) == 16
-
-        blocks = []
-        nonce = iv
-        for plaintext_block in split_blocks(plaintext, require_padding=False):
-            # CTR mode encrypt: plaintext_block XOR encrypt(nonce)
-            block = xor_bytes(plaintext_block, self.encrypt_block(nonce))
-            blocks.append(block)
-            nonce = inc_bytes(nonce)
-
-        return b''.join(blocks)
+        return self.ctr_crypt(plaintext, iv)
 
     def decrypt_ctr(self, ciphertext, iv):
         """
         Decrypts `ciphertext` using CTR mode with the given nounce/IV.
         """
-        assert len(iv) == 16
-
-        blocks = []
-        nonce = iv
-        for ciphertext_block in split_blocks(ciphertext, require_padding=False):
-            # CTR mode decrypt: ciphertext XOR encrypt(nonce)
-            block = xor_bytes(ciphertext_block, self.encrypt_block(nonce))
-            blocks.append(block)
-            nonce = inc_bytes(nonce)
-
-        return b''.join(blocks)
+        return self.ctr_crypt(ciphertext, iv)
 
     def trace_encrypt_rounds(self, plaintext):
         """
@@ -446,18 +816,18 @@ class AES:
         s = bytes2matrix(plaintext)
         rounds = []
 
-        add_round_key(s, self._key_matrices[0])
+        add_round_key(s, self._round_key_matrix(0))
 
         for i in range(1, self.n_rounds):
             sub_bytes(s)
             shift_rows(s)
             mix_columns(s)
-            add_round_key(s, self._key_matrices[i])
+            add_round_key(s, self._round_key_matrix(i))
             rounds.append(matrix2bytes([row[:] for row in s]))
 
         sub_bytes(s)
         shift_rows(s)
-        add_round_key(s, self._key_matrices[-1])
+        add_round_key(s, self._round_key_matrix(-1))
         rounds.append(matrix2bytes([row[:] for row in s]))
 
         return rounds
@@ -1,4 +1,5 @@
 import unittest
+import std_aes
 from std_aes import AES, encrypt, decrypt
 
 class TestBlock(unittest.TestCase):
@@ -36,6 +37,30 @@ class TestBlock(unittest.TestCase):
         ciphertext = AES(bytes(key)).encrypt_block(bytes(message))
         self.assertEqual(ciphertext, b'\x39\x25\x84\x1D\x02\xDC\x09\xFB\xDC\x11\x85\x97\x19\x6A\x0B\x32')
 
+    def test_trace_matches_block(self):
+        """ The list-based round trace must end in the integer core's output. """
+        for key_size in AES.rounds_by_key_size:
+            aes = AES(bytes(range(key_size)))
+            rounds = aes.trace_encrypt_rounds(b'a secret message')
+            self.assertEqual(len(rounds), aes.n_rounds)
+            self.assertEqual(rounds[-1], aes._encrypt_int(int.from_bytes(b'a secret message', 'big')).to_bytes(16, 'big'))
+
+    def test_bytes_engine(self):
+        """ The byte-buffer rounds must match the T-table rounds. """
+        with self.assertRaises(AssertionError):
+            AES(b'\x00' * 16, engine='unknown')
+
+        message = b'\x32\x43\xF6\xA8\x88\x5A\x30\x8D\x31\x31\x98\xA2\xE0\x37\x07\x34'
+        key     = b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C'
+        aes = AES(key, engine='bytes')
+        ciphertext = aes.encrypt_block(message)
+        self.assertEqual(ciphertext, b'\x39\x25\x84\x1D\x02\xDC\x09\xFB\xDC\x11\x85\x97\x19\x6A\x0B\x32')
+        self.assertEqual(aes.decrypt_block(ciphertext), message)
+        for key_size in AES.rounds_by_key_size:
+            ttable = AES(b'P' * key_size)
+            aes = AES(b'P' * key_size, engine='bytes')
+            self.assertEqual(aes.encrypt_cbc(b'M' * 100, b'\x01' * 16), ttable.encrypt_cbc(b'M' * 100, b'\x01' * 16))
+
 class TestKeySizes(unittest.TestCase):
     """
     Tests encrypt and decryption using 192- and 256-bit keys.
@@ -67,6 +92,46 @@ class TestKeySizes(unittest.TestCase):
         self.assertEqual(aes.decrypt_block(ciphertext), message)
 
 
+class TestBatch(unittest.TestCase):
+    """
+    Tests the batched ECB core against single-block calls.
+    """
+    def setUp(self):
+        self.aes = AES(b'\x2B\x7E\x15\x16\x28\xAE\xD2\xA6\xAB\xF7\x15\x88\x09\xCF\x4F\x3C')
+        self.data = bytes(range(256)) * 2
+
+    def test_matches_single_blocks(self):
+        expected = b''.join(self.aes.encrypt_block(self.data[i:i+16]) for i in range(0, len(self.data), 16))
+        ciphertext = self.aes.encrypt_blocks(self.data)
+        self.assertEqual(ciphertext, expected)
+        self.assertEqual(self.aes.decrypt_blocks(ciphertext), self.data)
+
+    @unittest.skipIf(std_aes.np is None, 'NumPy not installed')
+    def test_array(self):
+        np = std_aes.np
+        blocks = np.frombuffer(self.data, dtype=np.uint8).reshape(-1, 16)
+        ciphertext = self.aes.encrypt_blocks(blocks)
+        self.assertEqual(ciphertext.shape, blocks.shape)
+        self.assertEqual(ciphertext.tobytes(), self.aes.encrypt_blocks(self.data))
+        self.assertTrue((self.aes.decrypt_blocks(ciphertext) == blocks).all())
+
+
+class TestXor(unittest.TestCase):
+    """
+    Tests the bulk xor_bytes primitive on both size paths.
+    """
+    def test_xor(self):
+        for n in (0, 5, 16, 1000):
+            a = bytes(i * 7 & 0xFF for i in range(n))
+            b = bytes(i * 13 + 5 & 0xFF for i in range(n))
+            expected = bytes(i ^ j for i, j in zip(a, b))
+            self.assertEqual(std_aes.xor_bytes(a, b), expected)
+            self.assertEqual(std_aes.xor_bytes(memoryview(a), b + b'tail'), expected)
+            out = bytearray(a)
+            self.assertIs(std_aes.xor_bytes(out, b, out=out), out)
+            self.assertEqual(out, expected)
+
+
 class TestCbc(unittest.TestCase):
     """
     Tests AES-128 in CBC mode.
@@ -84,6 +149,13 @@ class TestCbc(unittest.TestCase):
         # Since len(message) < block size, padding won't create a new block.
         self.assertEqual(len(ciphertext), 16)
 
+    def test_memoryview(self):
+        """ Buffers such as memoryviews are accepted for the data and the IV. """
+        message = self.message * 5
+        ciphertext = self.aes.encrypt_cbc(message, self.iv)
+        self.assertEqual(self.aes.encrypt_cbc(memoryview(message), memoryview(self.iv)), ciphertext)
+        self.assertEqual(self.aes.decrypt_cbc(memoryview(ciphertext), memoryview(self.iv)), message)
+
     def test_wrong_iv(self):
         """ CBC mode should verify the IVs are of correct length."""
         with self.assertRaises(AssertionError):
@@ -141,6 +213,13 @@ class TestPcbc(unittest.TestCase):
         # Since len(message) < block size, padding won't create a new block.
         self.assertEqual(len(ciphertext), 16)
 
+    def test_memoryview(self):
+        """ Buffers such as memoryviews are accepted for the data and the IV. """
+        message = self.message * 5
+        ciphertext = self.aes.encrypt_pcbc(message, self.iv)
+        self.assertEqual(self.aes.encrypt_pcbc(memoryview(message), memoryview(self.iv)), ciphertext)
+        self.assertEqual(self.aes.decrypt_pcbc(memoryview(ciphertext), memoryview(self.iv)), message)
+
     def test_wrong_iv(self):
         """ CBC mode should verify the IVs are of correct length."""
         with self.assertRaises(AssertionError):
@@ -348,6 +427,16 @@ class TestCtr(unittest.TestCase):
         ciphertext = self.aes.encrypt_ctr(long_message, self.iv)
         self.assertEqual(self.aes.decrypt_ctr(ciphertext, self.iv), long_message)
 
+    def test_seek(self):
+        message = bytes(range(256)) * 2
+        ciphertext = self.aes.encrypt_ctr(message, self.iv)
+        for a, b in ((0, 5), (7, 40), (16, 32), (100, 512)):
+            self.assertEqual(self.aes.ctr_crypt(ciphertext[a:b], self.iv, offset=a), message[a:b])
+
+    def test_counter_wraps(self):
+        ciphertext = self.aes.encrypt_ctr(b'M' * 48, b'\xFF' * 16)
+        self.assertEqual(ciphertext[16:], self.aes.encrypt_ctr(b'M' * 32, bytes(16)))
+
 class TestFunctions(unittest.TestCase):
     """
     Tests the module functions `encrypt` and `decrypt`, as well as basic